@@ -1,2 +1,14 @@
-from .monitor import Monitor
+import sys
+
 __version__ = "1.3.0"
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    from .monitor import Monitor
+else:
+    def __getattr__(name: str):
+        # The monitor pulls in watchdog, pydantic and asyncio, which the CLI
+        # does not need to print its version or help
+        if name == 'Monitor':
+            from .monitor import Monitor
+            return Monitor
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
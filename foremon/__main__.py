@@ -1,4 +1,17 @@
+import sys
+
+
+def main():
+    # `--version` is answered before importing click, which is most of the
+    # start up time of the command
+    if sys.argv[1:] == ['--version']:
+        from . import __version__
+        print(__version__)
+        return 0
 
-if __name__ == '__main__':
     from .cli import main
+    return main()
+
+
+if __name__ == '__main__':
     main()
@@ -1,20 +1,35 @@
 import os
 import os.path as op
 import sys
-from typing import List
+import time
+from typing import Any, Dict, List
 
 from watchdog.events import FileSystemEvent
 
 from foremon.config import *
+from foremon.configcache import ConfigCache
+from foremon.discover import load_packages, merge_packages
 from foremon.display import *
 from foremon.monitor import Monitor
-from foremon.task import ForemonTask, ScriptTask
+from foremon.task import ForemonTask, ScriptTask, task_order
 from foremon.util import guess_and_update_scripts, relative_if_cwd
 
 DEFAULT_CONFIG = op.join(os.getcwd(), "pyproject.toml")
 AUTO_RELOAD_ALIAS = 'foremon-auto-reload'
 
 
+def task_settings(config: ForemonConfig) -> Dict[str, Any]:
+    """
+    The settings of a task compared on reload. Sub-configs are tasks of their
+    own and the order only changes when the task runs.
+    """
+    return config.dict(exclude={'configs', 'order', 'include'})
+
+
+def changed_settings(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    return sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+
 class ReloadTask(ForemonTask):
     """
     This task will reload the Foremon app when a config change is detected.
@@ -47,13 +62,18 @@ class ReloadTask(ForemonTask):
 class Foremon:
 
     config: ForemonConfig
+    config_cache: ConfigCache
     options: ForemonOptions
     monitor: Monitor
+    # task name -> settings of its config when it was added
+    settings: Dict[str, Dict[str, Any]]
 
     def __init__(self, options: ForemonOptions):
         self.options = options or ForemonOptions()
         self.monitor = Monitor()
         self.config = ForemonConfig()
+        self.config_cache = ConfigCache()
+        self.settings = {}
 
     @property
     def tasks(self) -> List[ForemonTask]:
@@ -100,19 +120,36 @@ class Foremon:
             self.config = ForemonConfig()
             return
 
-        with open(config_file, 'r') as fd:
-            project = PyProjectConfig.parse_toml(fd.read())
-            config = project.tool.foremon
-            if config is None:
-                display_debug(
-                    'no [tool.foremon] section specified in', relative_if_cwd(config_file))
-                self.config = ForemonConfig()
-            else:
-                display_success(
-                    'loaded [tool.foremon] config from', relative_if_cwd(config_file))
-                self.config = config
+        start = time.perf_counter()
+        project, cached = self.config_cache.load(config_file)
+        elapsed = (time.perf_counter() - start) * 1000
+        display_debug(f'config loaded in {elapsed:.1f}ms' + (' from cache' if cached else ''))
+        config = project.tool.foremon
+        if config is None:
+            display_debug(
+                'no [tool.foremon] section specified in', relative_if_cwd(config_file))
+            self.config = ForemonConfig()
+        else:
+            display_success(
+                'loaded [tool.foremon] config from', relative_if_cwd(config_file))
+            self.config = config
+            if config.include:
+                self._include_packages(config_file)
         return
 
+    def _include_packages(self, config_file: str):
+        """
+        Merge the configs of the packages matched by `include` into the config
+        as aliases named after their directories.
+        """
+        start = time.perf_counter()
+        base = op.dirname(op.abspath(config_file))
+        packages = load_packages(base, self.config.include, self.config_cache,
+                                 exclude=[op.abspath(config_file)])
+        added = merge_packages(self.config, base, packages)
+        elapsed = (time.perf_counter() - start) * 1000
+        display_debug(f'included {added} configs from {len(packages)} packages in {elapsed:.1f}ms')
+
     def _new_reload_task(self, config_file: str) -> ForemonTask:
         return ReloadTask(self, config_file)
 
@@ -157,6 +194,10 @@ class Foremon:
             display_success('dry run complete')
             return 0
 
+        if self.options.force:
+            for task in self.tasks:
+                task.force_run = True
+
         self._run()
 
         return 0
@@ -179,22 +220,71 @@ class Foremon:
     def reload(self):
         # pause events
         with self.monitor.paused():
-            self.monitor.terminate_tasks()
-            self.monitor.reset()
             self.load_config()
-            self.reset_monitor()
+            queued = self._update_tasks()
+
+        for task in sorted(queued, key=task_order):
+            self.monitor.queue_task_event(task, None)
 
-        self.monitor.queue_all_tasks()
+    def _update_tasks(self) -> List[ForemonTask]:
+        """
+        Compare the tasks of the reloaded config to the running ones by alias.
+        Unchanged tasks keep their processes and watches, changed tasks are
+        replaced and removed tasks are stopped. Returns the tasks to run.
+        """
+        current = {task.name: task for task in self.monitor.all_tasks
+                   if not isinstance(task, ReloadTask)}
+        changed: List[ForemonTask] = []
+        added: List[ForemonTask] = []
+        unchanged = 0
+
+        for task in self._make_tasks():
+            old = current.pop(task.name, None)
+            if old is None:
+                display_debug('task', task.name, 'was added')
+                added.append(task)
+                continue
+            fields = changed_settings(self.settings[old.name], task_settings(task.config))
+            if not fields:
+                old.config.order = task.config.order
+                unchanged += 1
+                continue
+            display_debug('task', task.name, 'changed', ', '.join(fields))
+            self.monitor.remove_task(old)
+            changed.append(task)
+
+        for name, task in current.items():
+            display_debug('task', name, 'was removed')
+            self.monitor.remove_task(task)
+            del self.settings[name]
+
+        for task in changed + added:
+            self._add_task(task)
+        self._add_reload_task()
+
+        display_debug(f'reloaded {len(changed)} changed, {len(added)} added,'
+                      f' {len(current)} removed and kept {unchanged} unchanged tasks')
+        return changed + added
 
     def reset_monitor(self):
         self.monitor.reset()
         self.monitor.set_pipe(self.get_pipe())
+        self.settings.clear()
 
         for task in self._make_tasks():
-            task.add_before_callback(self._before_task_runs)
-            self.monitor.add_task(task)
-            display_debug("task", task.name, "ready for monitor")
-
+            self._add_task(task)
+        self._add_reload_task()
+
+    def _add_task(self, task: ForemonTask):
+        # recorded before the monitor resolves paths in the config
+        self.settings[task.name] = task_settings(task.config)
+        task.add_before_callback(self._before_task_runs)
+        self.monitor.add_task(task)
+        display_debug("task", task.name, "ready for monitor")
+
+    def _add_reload_task(self):
+        if any(isinstance(task, ReloadTask) for task in self.monitor.all_tasks):
+            return
         # Do not schedule an auto-reload if there were no scripts
         if self.monitor.all_tasks and self.options.auto_reload:
             self.monitor.add_task(
@@ -249,3 +339,7 @@ class Foremon:
             path = relative_if_cwd(ev.src_path)
             kind = ev.event_type
             display_info(f'triggered because {path} was {kind}')
+
+        if self.options.verbose and task is not None and len(task.run_changes) > 1:
+            display_info(
+                f'{len(task.run_changes)} files changed: {task.run_changes.describe()}')
@@ -0,0 +1,189 @@
+import os
+import os.path as op
+from typing import Dict, Iterable, List, Optional
+
+from .watches import WatchKey
+
+INOTIFY_MAX_WATCHES = '/proc/sys/fs/inotify/max_user_watches'
+# Fraction of the limit left for other programs of the same user
+BUDGET_RESERVE = 0.1
+# Seconds between polls of subtrees which do not fit in the budget
+BUDGET_POLL_INTERVAL = 5.0
+
+
+def read_watch_limit(path: str = INOTIFY_MAX_WATCHES) -> Optional[int]:
+    """
+    Returns the number of inotify watches each user may create, None if the
+    limit is unknown.
+    """
+    try:
+        with open(path) as fd:
+            return int(fd.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def count_user_watches(proc: str = '/proc') -> int:
+    """
+    Count the inotify watches held by the processes of this user. The limit is
+    per user and the descriptors of other users cannot be read anyway.
+    """
+    total = 0
+    try:
+        pids = [p for p in os.listdir(proc) if p.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        fd_dir = op.join(proc, pid, 'fd')
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(op.join(fd_dir, fd)) != 'anon_inode:inotify':
+                    continue
+                with open(op.join(proc, pid, 'fdinfo', fd)) as info:
+                    total += sum(1 for line in info if line.startswith('inotify wd:'))
+            except OSError:
+                continue
+    return total
+
+
+class WatchPlan:
+    """
+    The paths of a task watched with inotify and those polled because they do
+    not fit in the watch budget.
+    """
+
+    # native key -> watches needed
+    native: Dict[WatchKey, int]
+    polled: List[WatchKey]
+    # recursive key not walked yet -> watches its walk may add
+    limits: Dict[WatchKey, int]
+
+    def __init__(self):
+        self.native = {}
+        self.polled = []
+        self.limits = {}
+
+    @property
+    def watches(self) -> int:
+        return sum(self.native.values())
+
+
+class WatchBudget:
+    """
+    Plans the inotify watches of each task against the per user limit of the
+    kernel and the watches other programs already use. Trees are counted by
+    the walk which watches them, a tree which was not walked yet may take the
+    watches left and its walk stops there. A recursive path which does not fit
+    is split, its top level directories are watched while they fit and the
+    rest are polled.
+
+    Tasks watching the same path share the watch, so it is only counted once.
+    """
+
+    limit: int
+    # watches used by other programs, counted when first needed
+    used: Optional[int]
+    reserve: float
+    # task -> planned watches
+    planned: Dict[object, Dict[WatchKey, int]]
+    # recursive path -> watches needed, from its walk
+    counts: Dict[str, int]
+    # recursive path -> watches of its top level directories
+    splits: Dict[str, Dict[str, int]]
+
+    def __init__(self, limit: int, used: Optional[int] = None, reserve: float = BUDGET_RESERVE):
+        self.limit = limit
+        self.used = used
+        self.reserve = reserve
+        self.planned = {}
+        self.counts = {}
+        self.splits = {}
+
+    @classmethod
+    def from_system(cls) -> Optional['WatchBudget']:
+        limit = read_watch_limit()
+        if limit is None:
+            return None
+        return cls(limit)
+
+    @property
+    def total(self) -> int:
+        """
+        Watches foremon may use.
+        """
+        if self.used is None:
+            self.used = count_user_watches()
+        return int(self.limit * (1 - self.reserve)) - self.used
+
+    def record(self, path: str, needed: int, children: Dict[str, int]) -> None:
+        """
+        Record the watches a walk of the recursive watch of `path` found it
+        needs, and how many of them each top level directory takes.
+        """
+        self.counts[path] = needed
+        self.splits[path] = children
+        for keys in self.planned.values():
+            if (path, True) in keys:
+                keys[(path, True)] = needed
+
+    def _shared(self, task: object) -> Dict[WatchKey, int]:
+        shared: Dict[WatchKey, int] = {}
+        for other, keys in self.planned.items():
+            if other is not task:
+                shared.update(keys)
+        return shared
+
+    def plan(self, task: object, keys: Iterable[WatchKey]) -> WatchPlan:
+        plan = WatchPlan()
+        shared = self._shared(task)
+        left = self.total - sum(shared.values())
+
+        def fits(key: WatchKey, needed: int) -> bool:
+            nonlocal left
+            if key in shared:
+                plan.native[key] = shared[key]
+                return True
+            if needed > left:
+                return False
+            plan.native[key] = needed
+            left -= needed
+            return True
+
+        unwalked = []
+        for key in keys:
+            path, recursive = key
+            if not recursive or not op.isdir(path):
+                if not fits(key, 1):
+                    plan.polled.append(key)
+                continue
+
+            needed = self.counts.get(path)
+            if fits(key, 1 if needed is None else needed):
+                if needed is None and key not in shared:
+                    unwalked.append(key)
+                continue
+
+            # Split the tree, smaller subtrees first so most of them fit
+            if not fits((path, False), 1):
+                plan.polled.append((path, False))
+            children = self.splits.get(path, {})
+            for child, count in sorted(children.items(), key=lambda c: c[1]):
+                if not fits((child, True), count):
+                    plan.polled.append((child, True))
+
+        # each walk may use what is left besides the watch it was counted with
+        for key in unwalked:
+            plan.limits[key] = left + 1
+        self.planned[task] = dict(plan.native)
+        return plan
+
+    def release(self, task: object) -> None:
+        self.planned.pop(task, None)
+
+
+__all__ = ['BUDGET_POLL_INTERVAL', 'WatchBudget', 'WatchPlan', 'count_user_watches',
+           'read_watch_limit']
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import os.path as op
+import stat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import ForemonConfig
+from .scan import scan_config
+
+CACHE_VERSION = 1
+# Number of cache files kept of each kind, the least recently used are removed first
+CACHE_LIMIT = 64
+READ_SIZE = 2 ** 16
+
+
+def get_cache_dir() -> str:
+    root = os.environ.get('XDG_CACHE_HOME') or op.expanduser('~/.cache')
+    return op.join(root, 'foremon')
+
+
+def kind_dir(cache_dir: Optional[str], kind: str) -> str:
+    """
+    Subdirectory of the cache files of `kind`, each kind is evicted on its own
+    so that one kind cannot push out the files of another.
+    """
+    return op.join(cache_dir or get_cache_dir(), kind)
+
+
+def cache_key(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def command_key(config: ForemonConfig) -> str:
+    """
+    Digest of what a run of a config executes, its scripts, the exit code
+    expected of them and the environment they inherit.
+    """
+    return cache_key(config.scripts, config.returncode, sorted(config.get_env().items()))
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fd:
+        while True:
+            data = fd.read(READ_SIZE)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def evict(cache_dir: str, limit: int = CACHE_LIMIT) -> None:
+    """
+    Remove the least recently used files from `cache_dir` over `limit`.
+    """
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.is_file()]
+    except OSError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[limit:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def stat_files(files: Iterable[str]) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Yields the regular files of `files` which exist with their stat.
+    """
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            yield path, st
+
+
+def read_cache(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r') as fd:
+            data = json.load(fd)
+        # reading counts as a use for eviction
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return None
+    return data
+
+
+def write_cache(path: str, data: Dict) -> None:
+    data['version'] = CACHE_VERSION
+    os.makedirs(op.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fd:
+        json.dump(data, fd, separators=(',', ':'))
+    os.replace(tmp, path)
+    evict(op.dirname(path))
+
+
+class InputFingerprint:
+    """
+    Fingerprint of the files a task watches, persisted between runs of foremon.
+    File contents are only hashed when their inode, size or mtime differ from
+    the cached values.
+    """
+
+    path: str
+    files: Dict[str, List]
+    last: Optional[str]
+    loaded: bool
+
+    def __init__(self, config: ForemonConfig, cache_dir: Optional[str] = None):
+        key = cache_key(op.abspath(config.cwd), config.alias, config.paths,
+                        config.auto_paths, config.files_from,
+                        config.patterns, config.ignore_defaults + config.ignore,
+                        command_key(config))
+        self.path = op.join(kind_dir(cache_dir, 'inputs'), f'{key}.json')
+        self.config = config
+        self.files = {}
+        self.last = None
+        self.loaded = False
+
+    def load(self) -> None:
+        self.loaded = True
+        data = read_cache(self.path)
+        if data is None:
+            return
+        self.files = data.get('files', {})
+        self.last = data.get('last')
+
+    def save(self) -> None:
+        try:
+            write_cache(self.path, dict(files=self.files, last=self.last))
+        except OSError:
+            pass
+
+    def compute(self, watched: Optional[Iterable[str]] = None) -> str:
+        """
+        Returns the fingerprint of the current inputs, the `watched` files
+        when the task watches exact files and otherwise the files below its
+        paths. Entries for files which are no longer watched are dropped.
+        """
+        if not self.loaded:
+            self.load()
+
+        entries = scan_config(self.config) if watched is None else stat_files(watched)
+        h = hashlib.blake2b(digest_size=16)
+        files = {}
+        for path, st in sorted(entries, key=lambda e: e[0]):
+            key = [st.st_ino, st.st_size, st.st_mtime_ns]
+            entry = self.files.get(path)
+            if entry and entry[:3] == key:
+                digest = entry[3]
+            else:
+                try:
+                    digest = file_digest(path)
+                except OSError:
+                    continue
+            files[path] = key + [digest]
+            h.update(path.encode())
+            h.update(digest.encode())
+
+        self.files = files
+        return h.hexdigest()
+
+    def is_unchanged(self, fingerprint: str) -> bool:
+        return self.last is not None and self.last == fingerprint
+
+    def set_success(self, fingerprint: str) -> None:
+        self.last = fingerprint
+        self.save()
+
+
+__all__ = ['InputFingerprint', 'command_key', 'file_digest', 'get_cache_dir', 'kind_dir', 'stat_files']
@@ -0,0 +1,108 @@
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, MutableMapping, Optional
+
+from watchdog.events import FileSystemEvent
+
+# Maximum number of paths kept for a burst of events
+CHANGES_LIMIT = 1000
+# Sets with more paths than this are passed to scripts in a file
+CHANGES_ENV_LIMIT = 100
+
+ENV_CHANGED_FILES = 'FOREMON_CHANGED_FILES'
+ENV_CHANGED_FILES_LIST = 'FOREMON_CHANGED_FILES_LIST'
+ENV_CHANGED_FILES_OVERFLOW = 'FOREMON_CHANGED_FILES_OVERFLOW'
+
+
+def event_paths(ev: Any) -> Iterator[str]:
+    if not isinstance(ev, FileSystemEvent):
+        return
+    if ev.src_path:
+        yield ev.src_path
+    dest = getattr(ev, 'dest_path', None)
+    if dest:
+        yield dest
+
+
+class ChangeSet:
+    """
+    Deduplicated paths changed in a burst of events, in the order they were
+    first seen. At most `limit` paths are kept and `overflow` is set if more
+    paths changed.
+    """
+
+    paths: Dict[str, None]
+    overflow: bool
+    limit: int
+
+    def __init__(self, paths: Iterable[str] = (), limit: int = CHANGES_LIMIT):
+        self.paths = {}
+        self.overflow = False
+        self.limit = limit
+        for path in paths:
+            self.add(path)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.paths
+
+    def add(self, path: str) -> None:
+        if path in self.paths:
+            return
+        if len(self.paths) >= self.limit:
+            self.overflow = True
+            return
+        self.paths[path] = None
+
+    def add_event(self, ev: Any) -> None:
+        for path in event_paths(ev):
+            self.add(path)
+
+    def update(self, other: 'ChangeSet') -> None:
+        for path in other:
+            self.add(path)
+        self.overflow = self.overflow or other.overflow
+
+    def clear(self) -> None:
+        self.paths.clear()
+        self.overflow = False
+
+    def describe(self, count: int = 3) -> str:
+        """
+        Short description of the changed paths for display.
+        """
+        paths = list(self.paths)
+        text = ', '.join(paths[:count])
+        more = len(paths) - count
+        if more > 0 or self.overflow:
+            text += f' (+{max(more, 0)}{"+" if self.overflow else ""} more)'
+        return text
+
+    def update_env(self, env: MutableMapping[str, str]) -> Optional[str]:
+        """
+        Expose the changed paths to scripts, one path per line. Large sets are
+        written to a temporary file instead, the caller removes the returned
+        file path when the scripts are done.
+        """
+        env[ENV_CHANGED_FILES_OVERFLOW] = '1' if self.overflow else '0'
+        env.pop(ENV_CHANGED_FILES_LIST, None)
+
+        if len(self.paths) <= CHANGES_ENV_LIMIT:
+            env[ENV_CHANGED_FILES] = '\n'.join(self.paths)
+            return None
+
+        env[ENV_CHANGED_FILES] = ''
+        fd, path = tempfile.mkstemp(prefix='foremon-changes-', suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(self.paths) + '\n')
+        env[ENV_CHANGED_FILES_LIST] = path
+        return path
+
+
+__all__ = ['ChangeSet', 'event_paths', 'ENV_CHANGED_FILES',
+           'ENV_CHANGED_FILES_LIST', 'ENV_CHANGED_FILES_OVERFLOW']
@@ -5,9 +5,6 @@ import click
 from click.core import Context
 
 import foremon.display as display
-from foremon.app import DEFAULT_CONFIG, Foremon
-from foremon.config import ForemonOptions
-from foremon.errors import ForemonError
 
 from . import __version__
 
@@ -45,7 +42,7 @@ def print_version(ctx: Context, param, value):
               expose_value=False, is_eager=True,
               help='Print version and exit.')
 @click.option('-f', '--config-file',
-              default=DEFAULT_CONFIG, show_default=False,
+              default=None, show_default=False,
               help='Path to file config.')
 @click.option('-e', '--ext', 'patterns',
               default='*', multiple=True,
@@ -79,6 +76,8 @@ def print_version(ctx: Context, param, value):
               multiple=True, default=['default'],
               help='Run the alias from the config.')
 @click.option('--dry-run', is_flag=True, hidden=True)
+@click.option('--force', is_flag=True, default=False,
+              help='Run every script on start even if nothing changed.')
 @click.option('--reload/--no-reload', 'auto_reload',
               is_flag=True, default=True,
               help='Automatically reload the config if it changes.')
@@ -86,9 +85,14 @@ def print_version(ctx: Context, param, value):
               default=0.1, show_default=True,
               help='Dwell this long after a change is detect to restart a script.')
 @click.argument('args', callback=want_string, nargs=-1)
-def foremon(verbose: bool, args: str, scripts: List[str], version=None, **kwargs):
+def foremon(verbose: bool, args: str, scripts: List[str], config_file=None, version=None, **kwargs):
+    # imported here so `--version` and `--help` stay fast
+    from foremon.app import DEFAULT_CONFIG, Foremon
+    from foremon.config import ForemonOptions
+    from foremon.errors import ForemonError
 
     display.set_display_verbose(verbose)
+    kwargs['config_file'] = config_file or DEFAULT_CONFIG
 
     scripts = list(filter(lambda s: s, scripts + [args]))
     options = ForemonOptions(verbose=verbose, scripts=scripts, **kwargs)
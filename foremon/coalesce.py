@@ -0,0 +1,98 @@
+import os.path as op
+import re
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from watchdog.events import (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED,
+                             EVENT_TYPE_MOVED, FileModifiedEvent,
+                             FileSystemEvent)
+
+# File names editors use for swap, backup and temporary files while saving
+EDITOR_TEMP_PATTERNS = [
+    r'\.sw[a-p]x?$',        # vim swap files
+    r'^4913$',              # vim probe for a writable directory
+    r'~$',                  # vim, emacs and gedit backups
+    r'^\.#',                # emacs lock files
+    r'^#.*#$',              # emacs auto-save files
+    r'___jb_(tmp|old|bak)___$',  # JetBrains safe write
+    r'^\.goutputstream-',   # gedit and other GIO editors
+    r'\.kate-swp$',         # kate swap files
+    r'\.crswap$',           # browser based editors
+]
+
+EDITOR_TEMP = re.compile('|'.join(EDITOR_TEMP_PATTERNS))
+
+# Seconds a removed file may be re-created as part of the same save
+SAVE_WINDOW = 1.0
+
+
+def is_editor_temp(path: str) -> bool:
+    return bool(EDITOR_TEMP.search(op.basename(path)))
+
+
+class SaveCoalescer:
+    """
+    Turns the sequences of events editors produce when saving a file, writing a
+    temporary file and renaming it over the real file, renaming the real file
+    to a backup, deleting and re-creating it, into `modified` events for the
+    real file. Events for the temporary files themselves are dropped.
+
+    Events are coalesced before they are filtered by the `events` of a task, so
+    a save which renames a temporary file is seen as a modification even if
+    `moved` is not in `events`. The removals are kept per `owner`, usually the
+    task, as each task watching a file sees its own copy of the events.
+    """
+
+    removed: Dict[Tuple[Any, str], float]
+    window: float
+
+    def __init__(self, window: float = SAVE_WINDOW):
+        self.removed = {}
+        self.window = window
+
+    def _set_removed(self, owner: Hashable, path: str) -> None:
+        now = time.monotonic()
+        if len(self.removed) > 256:
+            self.removed = {k: t for k, t in self.removed.items()
+                            if now - t < self.window}
+        self.removed[owner, path] = now
+
+    def _was_removed(self, owner: Hashable, path: str) -> bool:
+        removed_at = self.removed.pop((owner, path), None)
+        return removed_at is not None and time.monotonic() - removed_at < self.window
+
+    def coalesce(self, ev: FileSystemEvent,
+                 owner: Hashable = None) -> Optional[FileSystemEvent]:
+        """
+        Returns the event to use in place of `ev`, or None to drop it.
+        """
+        if ev.is_directory:
+            return ev
+
+        src_temp = is_editor_temp(ev.src_path)
+
+        if ev.event_type == EVENT_TYPE_MOVED:
+            dest_temp = is_editor_temp(ev.dest_path)
+            if src_temp and dest_temp:
+                return None
+            if src_temp:
+                # temporary file renamed over the real file
+                return FileModifiedEvent(ev.dest_path)
+            if dest_temp:
+                # real file renamed to a backup, a new one is written next
+                self._set_removed(owner, ev.src_path)
+                return FileModifiedEvent(ev.src_path)
+            return ev
+
+        if src_temp:
+            return None
+
+        if ev.event_type == EVENT_TYPE_DELETED:
+            self._set_removed(owner, ev.src_path)
+        elif ev.event_type == EVENT_TYPE_CREATED and self._was_removed(owner, ev.src_path):
+            return FileModifiedEvent(ev.src_path)
+
+        return ev
+
+
+__all__ = ['EDITOR_TEMP_PATTERNS', 'SaveCoalescer', 'is_editor_temp']
@@ -1,11 +1,12 @@
 import os
 import signal
+import threading
 from enum import Enum
 from itertools import count
-from typing import Any, Dict, List, MutableMapping, Optional
+from typing import Any, Dict, List, MutableMapping, Optional, Union
 
 import toml
-from pydantic import BaseSettings, Field, validator
+from pydantic import BaseSettings, Field, PrivateAttr, validator
 from pydantic.main import BaseModel
 
 DEFAULT_IGNORES = [
@@ -19,11 +20,32 @@ DEFAULT_EVENTS = [
 ]
 
 
+# Action which terminates and re-runs the scripts of a task
+RESTART_ACTION = 'restart'
+
+# `paths` which watches the directories of the modules a python script
+# imports, only as a bare string, `auto` in a list is a literal path
+AUTO_PATHS = 'auto'
+
+
+def parse_signal(value: Any) -> int:
+    """
+    Convert a signal name like `SIGHUP` or a number to a signal number.
+    """
+    if isinstance(value, str):
+        if hasattr(signal.Signals, value):
+            value = getattr(signal.Signals, value)
+    # raises a ValueError for unknown signals
+    return int(signal.Signals(int(value)))
+
+
 class Events(str, Enum):
     created = 'created'
     modified = 'modified'
     deleted = 'deleted'
     moved = 'moved'
+    # a file opened for writing was closed, or stopped changing
+    closed = 'closed'
 
 
 Increment = count(start=0)
@@ -53,6 +75,10 @@ class ForemonConfig(BaseSettings):
     returncode:      int = Field(0)
     scripts:         List[str] = Field(default_factory=list)
     term_signal:     int = Field(int(signal.SIGTERM))
+    # kill processes which outlive their script, like daemons
+    cleanup_orphans: bool = Field(False)
+    # maps file patterns to `restart` or a signal sent to the running scripts
+    actions:         Dict[str, Union[int, str]] = Field(default_factory=dict)
 
     ################################
     # Change monitoring
@@ -61,22 +87,74 @@ class ForemonConfig(BaseSettings):
     ignore_defaults: List[str] = Field(default_factory=DEFAULT_IGNORES.copy)
     ignore_dirs:     bool = Field(True)
     ignore:          List[str] = Field(default_factory=list)
+    # also ignore what the .gitignore files and .git/info/exclude ignore
+    ignore_vcs:      bool = Field(False)
     paths:           List[str] = Field(default_factory=['.'].copy)
+    # command printing the exact files to watch, replaces `paths` and `patterns`
+    files_from:      Optional[str]
+    # poll for changes, for file systems without native events like network mounts
+    polling:         bool = Field(False)
+    poll_interval:   float = Field(1.0)
     patterns:        List[str] = Field(default_factory=['*'].copy)
     recursive:       bool = Field(True)
+    # watch the directories symbolic links point to, each real directory once
+    follow_symlinks: bool = Field(False)
     events:          List[Events] = Field(default_factory=DEFAULT_EVENTS.copy)
+    # seconds a file must keep its size with `closed` where the writer's close is not seen
+    settle:          float = Field(1.0)
+    # drop events for files whose content did not change
+    ignore_unchanged: bool = Field(True)
+    # merge the events of editors saving a file into one modified event
+    coalesce_saves:  bool = Field(True)
+    # skip runs when the inputs are identical to the last clean exit
+    cache:           bool = Field(False)
+    # on start only run if watched files changed since foremon last stopped
+    snapshot:        bool = Field(False)
+    # only restart for python files imported by the script
+    follow_imports:  bool = Field(False)
+    # hold restarts while a rebase, merge or commit is in progress
+    wait_for_vcs:    bool = Field(True)
+    # seconds until a VCS marker counts as stale, like the lock of a crashed git
+    vcs_max_hold:    float = Field(300.0)
+
+    ################################
+    # Readiness
+    ################################
+    ready_port:      Optional[int]
+    ready_url:       Optional[str]
+    ready_pattern:   Optional[str]
+    ready_timeout:   float = Field(30.0)
 
     skip:            bool = Field(False)
+    # globs of package directories or config files merged as namespaced aliases
+    include:         List[str] = Field(default_factory=list)
     configs:         List['ForemonConfig'] = Field(default_factory=list)
 
+    # set for `paths = "auto"`
+    _auto_paths:     bool = PrivateAttr(False)
+
     @validator('term_signal', pre=True)
     def validate_term_signal(cls, value) -> int:
+        return parse_signal(value)
+
+    @validator('actions', pre=True)
+    def validate_actions(cls, value) -> Dict[str, Union[int, str]]:
+        actions = {}
+        for pattern, action in dict(value).items():
+            if isinstance(action, str) and action.lower() == RESTART_ACTION:
+                actions[pattern] = RESTART_ACTION
+            else:
+                actions[pattern] = parse_signal(action)
+        return actions
+
+    @validator('paths', pre=True)
+    def validate_paths(cls, value) -> Any:
         if isinstance(value, str):
-            if hasattr(signal.Signals, value):
-                value = getattr(signal.Signals, value)
-        return int(value)
+            # paths = "src", `auto` is taken out by __init__
+            return [value]
+        return value
 
-    @validator('paths', 'patterns', 'ignore')
+    @validator('paths', 'patterns', 'ignore', 'include')
     def validate_expandvars(cls, value) -> Any:
         if value:
             if isinstance(value, list):
@@ -123,7 +201,20 @@ class ForemonConfig(BaseSettings):
 
             obj['alias'] = name
             configs.append(obj)
+
+        auto_paths = kwargs.get('paths') == AUTO_PATHS
+        if auto_paths:
+            kwargs['paths'] = []
         super().__init__(*args, **kwargs)
+        self._auto_paths = auto_paths
+
+    @property
+    def auto_paths(self) -> bool:
+        """
+        True if the paths are derived from the imports of the scripts, besides
+        any paths watched when they cannot be derived.
+        """
+        return self._auto_paths
 
     def get_env(self) -> MutableMapping[str, str]:
         env = os.environ.copy()
@@ -154,6 +245,10 @@ class ToolConfig(BaseSettings):
         extra = 'allow'
 
 
+# Held while parsing since the default `order` comes from a global counter
+_parse_lock = threading.Lock()
+
+
 class PyProjectConfig(BaseSettings):
 
     tool: ToolConfig = Field(default_factory=ToolConfig)
@@ -166,9 +261,10 @@ class PyProjectConfig(BaseSettings):
         # TODO - Do this without a global. We need to reset this to zero each
         # time a config is reloaded to keep auto-values constant between config
         # reloads.
-        SetIncrement(0)
         data = toml.loads(text)
-        project = cls.parse_obj(data)
+        with _parse_lock:
+            SetIncrement(0)
+            project = cls.parse_obj(data)
         return project
 
 
@@ -177,6 +273,7 @@ class ForemonOptions(BaseModel):
     config_file: Optional[str]
     cwd: Optional[str]
     dry_run: bool = Field(False)
+    force: bool = Field(False)
     ignore: List[str] = Field([])
     no_guess: bool = Field(False)
     paths: List[str] = Field([])
@@ -190,4 +287,5 @@ class ForemonOptions(BaseModel):
 
 
 __all__ = ['PyProjectConfig', 'ToolConfig',
-           'ForemonConfig', 'Events', 'ForemonOptions']
+           'ForemonConfig', 'Events', 'ForemonOptions', 'RESTART_ACTION',
+           'AUTO_PATHS']
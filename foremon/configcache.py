@@ -0,0 +1,132 @@
+import hashlib
+import os
+import os.path as op
+import pickle
+import re
+from typing import Dict, List, Optional, Tuple
+
+from . import config as config_module
+from . import __version__
+from .cache import cache_key, evict, file_digest, kind_dir
+from .config import ForemonConfig, PyProjectConfig
+
+CONFIG_MAGIC = b'FOREMON-CONFIG'
+CONFIG_VERSION = 1
+
+# Variables expanded in `paths`, `patterns`, `ignore` and `include`
+VAR_PATTERN = re.compile(r'\$(\w+|\{[^}]*\})')
+
+
+_schema: Optional[str] = None
+
+
+def config_schema() -> str:
+    """
+    Digest of the module defining the config models, a cached config is only
+    valid for the fields, defaults and validators it was created with.
+    """
+    global _schema
+    if _schema is None:
+        _schema = file_digest(config_module.__file__)
+    return _schema
+
+
+def config_env(text: str) -> List[Tuple[str, str]]:
+    """
+    The environment variables which change the result of parsing `text`, the
+    settings read by pydantic and the variables the file expands.
+    """
+    prefix = ForemonConfig.__config__.env_prefix.lower()
+    names = {m.group(1).strip('{}') for m in VAR_PATTERN.finditer(text)}
+    env = []
+    for name, value in os.environ.items():
+        lower = name.lower()
+        if name in names or lower.startswith(prefix) or lower in ('tool', 'foremon'):
+            env.append((name, value))
+    return sorted(env)
+
+
+class ConfigCache:
+    """
+    Validated configs keyed by the hash of the config file, the environment it
+    depends on and the working directory, so an unchanged config is loaded
+    without parsing or validating it again.
+
+    Configs are pickled, the last one of each file is kept in memory for
+    reloads and all of them in the cache directory for the next start. A cache
+    file of a different version or which cannot be read is treated as missing.
+    """
+
+    cache_dir: str
+    # config file -> (key, pickled config)
+    memory: Dict[str, Tuple[str, bytes]]
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = kind_dir(cache_dir, 'configs')
+        self.memory = {}
+
+    def _path(self, key: str) -> str:
+        return op.join(self.cache_dir, f'{key}.bin')
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fd:
+                header = fd.read(len(CONFIG_MAGIC) + 1)
+                if header != CONFIG_MAGIC + bytes([CONFIG_VERSION]):
+                    return None
+                data = fd.read()
+            # reading counts as a use for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as fd:
+                fd.write(CONFIG_MAGIC + bytes([CONFIG_VERSION]))
+                fd.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        evict(self.cache_dir)
+
+    def load(self, config_file: str) -> Tuple[PyProjectConfig, bool]:
+        """
+        Returns the config parsed from `config_file` and whether it came from
+        the cache. Errors parsing the file are raised like `parse_toml` does.
+        """
+        with open(config_file, 'rb') as fd:
+            content = fd.read()
+        text = content.decode()
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        key = cache_key(__version__, config_schema(), digest, os.getcwd(), config_env(text))
+
+        data = None
+        entry = self.memory.get(config_file)
+        if entry is not None and entry[0] == key:
+            data = entry[1]
+        else:
+            data = self._read(key)
+
+        if data is not None:
+            try:
+                project = pickle.loads(data)
+            except Exception:
+                project = None
+            if isinstance(project, PyProjectConfig):
+                self.memory[config_file] = (key, data)
+                return project, True
+
+        project = PyProjectConfig.parse_toml(text)
+        data = pickle.dumps(project, pickle.HIGHEST_PROTOCOL)
+        self.memory[config_file] = (key, data)
+        self._write(key, data)
+        return project, False
+
+
+__all__ = ['ConfigCache', 'config_env']
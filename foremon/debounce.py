@@ -5,12 +5,14 @@ from asyncio.events import TimerHandle
 from collections import defaultdict
 from typing import Any, Callable, DefaultDict, List, Optional, Tuple
 
+from foremon.changes import ChangeSet
 from foremon.display import display_error, display_warning
-from foremon.task import ForemonTask
+from foremon.task import ForemonTask, task_order
 
 
 class EventContainer:
     args: Optional[Tuple[ForemonTask, Any]]
+    changes: ChangeSet
     reset_count: int
     set_at: int
     warn_after: int
@@ -18,6 +20,7 @@ class EventContainer:
     def __init__(self) -> None:
         self.set_at = -1
         self.args = None
+        self.changes = ChangeSet()
         self.reset_count = 0
         self.warn_after = 100
 
@@ -27,6 +30,7 @@ class EventContainer:
 
         self.set_at = time.time()
         self.args = (task, ev)
+        self.changes.add_event(ev)
 
         if self.reset_count < self.warn_after:
             return
@@ -44,7 +48,7 @@ class Debounce:
 
     def __init__(self,
                  dwell: float,
-                 callback: Callable[[ForemonTask, Any], None],
+                 callback: Callable[[ForemonTask, Any, ChangeSet], None],
                  loop: Optional[BaseEventLoop] = None):
         self.loop = loop or asyncio.get_event_loop()
         self.callback = callback
@@ -54,7 +58,9 @@ class Debounce:
 
     def submit(self, task: ForemonTask, ev: Any):
         if self.dwell <= 0.0:
-            self.callback(task, ev)
+            changes = ChangeSet()
+            changes.add_event(ev)
+            self.callback(task, ev, changes)
         else:
             self.pending_events[task.name].set(task, ev)
             if self._scheduled:
@@ -65,17 +71,37 @@ class Debounce:
     def submit_threadsafe(self, task: ForemonTask, ev: Any):
         self.loop.call_soon_threadsafe(self.submit, task, ev)
 
+    def take_pending(self) -> List[Tuple[ForemonTask, ChangeSet]]:
+        """
+        Remove the pending events without calling back, returns the task and
+        changes of each.
+        """
+        if self._scheduled:
+            self._scheduled.cancel()
+            self._scheduled = None
+        containers = list(self.pending_events.values())
+        self.pending_events.clear()
+        return [(cont.args[0], cont.changes) for cont in containers]
+
+    def discard(self, task: ForemonTask) -> None:
+        """
+        Drop the pending events of a task which was removed.
+        """
+        cont = self.pending_events.get(task.name)
+        if cont is not None and cont.args[0] is task:
+            del self.pending_events[task.name]
+
     def drain_events(self):
         self._scheduled = None
         containers = list(self.pending_events.values())
         self.pending_events.clear()
 
         def get_order(cont: EventContainer):
-            return cont.args[0].config.order
+            return task_order(cont.args[0])
 
         cont: EventContainer
         for cont in sorted(containers, key=get_order):
             try:
-                self.callback(*cont.args)
+                self.callback(*cont.args, cont.changes)
             except Exception as e:
                 display_error('drain callback error', e)
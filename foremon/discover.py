@@ -0,0 +1,128 @@
+import glob
+import os
+import os.path as op
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from .config import ForemonConfig
+from .configcache import ConfigCache
+from .display import display_debug, display_error
+from .scan import SCAN_WORKERS
+
+# Name of the config file looked for in included package directories
+PACKAGE_CONFIG = 'pyproject.toml'
+# Separates the package from the alias of one of its sub-configs
+ALIAS_SEPARATOR = ':'
+
+
+def _expand(base: str, pattern: str) -> List[str]:
+    matches = []
+    for path in glob.glob(op.join(base, pattern), recursive=True):
+        if op.isdir(path):
+            path = op.join(path, PACKAGE_CONFIG)
+            if not op.isfile(path):
+                continue
+        matches.append(op.normpath(path))
+    return matches
+
+
+def find_package_configs(base: str, patterns: Iterable[str], exclude: Iterable[str] = (),
+                         workers: int = SCAN_WORKERS) -> List[str]:
+    """
+    Expand the `include` globs relative to `base`, each into package
+    directories with a config file or config files. Patterns are expanded in
+    parallel, the files are returned sorted and without the `exclude`d ones.
+    """
+    patterns = list(patterns)
+    with ThreadPoolExecutor(max_workers=min(workers, len(patterns) or 1),
+                            thread_name_prefix='foremon-discover') as pool:
+        expanded = pool.map(lambda p: _expand(base, p), patterns)
+        files = {path for paths in expanded for path in paths}
+    files.difference_update(op.normpath(p) for p in exclude)
+    return sorted(files)
+
+
+def package_name(base: str, config_file: str) -> str:
+    """
+    The alias of a package, the path of its directory relative to `base`.
+    """
+    return op.relpath(op.dirname(config_file), base).replace(os.sep, '/')
+
+
+def _load_package(cache: ConfigCache, config_file: str) -> Optional[ForemonConfig]:
+    try:
+        project, _ = cache.load(config_file)
+    except Exception as e:
+        display_error(f'cannot load {config_file}, skipped', e)
+        return None
+    return project.tool.foremon
+
+
+def load_packages(base: str, patterns: Iterable[str], cache: ConfigCache,
+                  exclude: Iterable[str] = (),
+                  workers: int = SCAN_WORKERS) -> List[Tuple[str, ForemonConfig]]:
+    """
+    Returns the name and config of every included package with a
+    `[tool.foremon]` section. Configs are read in parallel through `cache`, a
+    config which cannot be read is skipped.
+    """
+    files = find_package_configs(base, patterns, exclude, workers)
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(files)),
+                            thread_name_prefix='foremon-discover') as pool:
+        configs = list(pool.map(lambda f: _load_package(cache, f), files))
+
+    packages = []
+    for config_file, config in zip(files, configs):
+        if config is None:
+            display_debug('no [tool.foremon] section specified in', config_file)
+            continue
+        packages.append((package_name(base, config_file), config))
+    return packages
+
+
+def _resolve(root: str, path: str) -> str:
+    if op.isabs(path):
+        return path
+    return op.normpath(op.join(root, path))
+
+
+def namespace_package(name: str, root: str, config: ForemonConfig) -> List[ForemonConfig]:
+    """
+    Prefix the aliases of a package's configs with its name and make their
+    paths and working directory relative to the package directory `root`,
+    where scripts and `files_from` run. Returns the configs in their order.
+    """
+    configs = config.get_configs()
+    for conf in configs:
+        conf.alias = name if conf is config else f'{name}{ALIAS_SEPARATOR}{conf.alias}'
+        conf.cwd = _resolve(root, conf.cwd) if 'cwd' in conf.__fields_set__ else root
+        conf.paths = [_resolve(root, p) for p in conf.paths]
+        if conf.include:
+            display_debug(f'includes of package {name} are not followed')
+        conf.configs = []
+    return configs
+
+
+def merge_packages(config: ForemonConfig, base: str,
+                   packages: Iterable[Tuple[str, ForemonConfig]]) -> int:
+    """
+    Add the configs of each package to `config` as sub-configs, ordered after
+    the configs of `config` and by package. Returns the number of configs
+    added.
+    """
+    order = max(c.order for c in config.get_configs()) + 1
+    added = 0
+    for name, package in packages:
+        root = op.normpath(op.join(base, name))
+        for conf in namespace_package(name, root, package):
+            conf.order = order
+            order += 1
+            config.configs.append(conf)
+            added += 1
+    return added
+
+
+__all__ = ['ALIAS_SEPARATOR', 'PACKAGE_CONFIG', 'find_package_configs', 'load_packages',
+           'merge_packages', 'namespace_package', 'package_name']
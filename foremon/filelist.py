@@ -0,0 +1,92 @@
+import os.path as op
+import subprocess
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from .config import ForemonConfig
+from .display import display_warning
+
+# Seconds to wait for a `files_from` command
+FILES_FROM_TIMEOUT = 30.0
+
+
+def run_files_from(command: str, cwd: str, timeout: float = FILES_FROM_TIMEOUT) -> List[str]:
+    """
+    Run `command` and return the absolute paths it prints, one per line,
+    relative paths are resolved from `cwd`.
+    """
+    try:
+        proc = subprocess.run(command, shell=True, cwd=cwd, timeout=timeout,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        display_warning(f'cannot list files with `{command}`', e)
+        return []
+
+    if proc.returncode != 0:
+        err = proc.stderr.decode(errors='replace').strip()
+        display_warning(
+            f'cannot list files with `{command}`, exited {proc.returncode}', err)
+        return []
+
+    cwd = op.abspath(cwd)
+    files = []
+    for line in proc.stdout.decode(errors='replace').splitlines():
+        line = line.strip()
+        if line:
+            files.append(op.normpath(op.join(cwd, line)))
+    return files
+
+
+class FileList:
+    """
+    An exact set of files to watch produced by the `files_from` command of a
+    task. Events are matched by a set lookup rather than by patterns and the
+    parent directories of the files are watched without recursion.
+    """
+
+    command: str
+    cwd: str
+    files: Set[str]
+
+    def __init__(self, command: str, cwd: str):
+        self.command = command
+        self.cwd = cwd
+        self.files = set()
+
+    @classmethod
+    def from_config(cls, config: ForemonConfig) -> 'FileList':
+        return cls(config.files_from, config.cwd)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.files)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.files
+
+    @property
+    def directories(self) -> Set[str]:
+        return set(op.dirname(p) for p in self.files)
+
+    def list(self) -> List[str]:
+        """
+        Run the command, safe to call from any thread.
+        """
+        return run_files_from(self.command, self.cwd)
+
+    def update(self, files: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+        """
+        Replace the set of files, returns the files added and removed.
+        """
+        files = set(files)
+        added = files - self.files
+        removed = self.files - files
+        self.files = files
+        return added, removed
+
+    def refresh(self) -> Tuple[Set[str], Set[str]]:
+        return self.update(self.list())
+
+
+__all__ = ['FileList', 'run_files_from']
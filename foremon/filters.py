@@ -0,0 +1,153 @@
+import asyncio
+import os
+import stat
+import threading
+from asyncio import BaseEventLoop
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from watchdog.events import EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, FileSystemEvent
+
+from .cache import file_digest
+from .display import display_debug
+from .settle import EVENT_TYPE_CLOSED
+from .task import ForemonTask
+
+# Number of files with a remembered digest
+DIGEST_CACHE_SIZE = 4096
+DIGEST_WORKERS = 2
+
+StatKey = Tuple[int, int, int, int]
+
+
+class ContentFilter:
+    """
+    Drops created, modified and closed events for files whose content did not change,
+    like after a `touch` or a formatter which rewrote identical bytes.
+
+    A bounded LRU of content digests is kept per path, keyed by the `(dev,
+    inode, mtime, size)` of the file when it was hashed. Files are hashed in a
+    thread pool so large files do not block the loop. A file seen for the
+    first time has nothing to compare to and is always considered changed.
+
+    The events of a path are delivered in the order they were submitted, an
+    event waits while an earlier one of its path is checked.
+    """
+
+    callback: Callable[[ForemonTask, Any], None]
+    digests: 'OrderedDict[str, Tuple[StatKey, str, bool]]'
+    size: int
+    # path -> events of the path being checked and waiting, and if each needs a check
+    pending: Dict[str, Deque[Tuple[ForemonTask, Any, bool]]]
+    _executor: Optional[ThreadPoolExecutor]
+
+    def __init__(self,
+                 callback: Callable[[ForemonTask, Any], None],
+                 loop: Optional[BaseEventLoop] = None,
+                 size: int = DIGEST_CACHE_SIZE):
+        self.loop = loop or asyncio.get_event_loop()
+        self.callback = callback
+        self.digests = OrderedDict()
+        self.size = size
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, task: ForemonTask, ev: Any) -> None:
+        needs_check = (isinstance(ev, FileSystemEvent) and not ev.is_directory
+                       and ev.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED,
+                                             EVENT_TYPE_CLOSED))
+        path = getattr(ev, 'src_path', None)
+        queued = self.pending.get(path)
+        if queued is not None:
+            queued.append((task, ev, needs_check))
+            return
+
+        if not needs_check:
+            self.callback(task, ev)
+            return
+
+        self.pending[path] = deque([(task, ev, True)])
+        self._start(path)
+
+    def _start(self, path: str) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=DIGEST_WORKERS, thread_name_prefix='foremon-digest')
+
+        fut = self.loop.run_in_executor(self._executor, self.check, path)
+        fut.add_done_callback(partial(self._checked, path, self.pending[path]))
+
+    def _checked(self, path: str, queued: Deque[Tuple[ForemonTask, Any, bool]],
+                 fut: asyncio.Future) -> None:
+        # dropped by shutdown while the check ran
+        if self.pending.get(path) is not queued:
+            return
+        try:
+            changed = fut.result()
+        except Exception:
+            changed = True
+
+        task, ev, _ = queued.popleft()
+        if changed:
+            self.callback(task, ev)
+        else:
+            display_debug(f'content of {ev.src_path} is unchanged, ignored')
+
+        # events which need no check only waited for the ones before them
+        while queued and not queued[0][2]:
+            task, ev, _ = queued.popleft()
+            self.callback(task, ev)
+        if queued:
+            self._start(path)
+        else:
+            del self.pending[path]
+
+    def check(self, path: str) -> bool:
+        """
+        Returns True if the content of `path` differs from when it was last
+        checked. Safe to call from any thread.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+
+        if not stat.S_ISREG(st.st_mode):
+            return True
+
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self.digests.get(path)
+            if entry is not None and entry[0] == key:
+                # The same observation gets the same answer for every task
+                self.digests.move_to_end(path)
+                return entry[2]
+
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return True
+
+        with self._lock:
+            entry = self.digests.get(path)
+            if entry is not None and entry[0] == key:
+                return entry[2]
+            changed = entry is None or entry[1] != digest
+            self.digests[path] = (key, digest, changed)
+            self.digests.move_to_end(path)
+            while len(self.digests) > self.size:
+                self.digests.popitem(last=False)
+
+        return changed
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.pending.clear()
+
+
+__all__ = ['ContentFilter']
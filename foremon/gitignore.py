@@ -0,0 +1,316 @@
+import os
+import os.path as op
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+from .display import display_debug
+from .vcs import find_vcs_dir
+
+# Files holding the ignore rules of a directory
+IGNORE_FILE = '.gitignore'
+
+# Consecutive rules with the same sign, their patterns joined into one regex
+RuleGroup = Tuple[Pattern, bool]
+
+
+def find_work_tree(path: str) -> Optional[str]:
+    """
+    Returns the top directory of the git work tree containing `path`.
+    """
+    path = op.abspath(path)
+    while True:
+        if op.exists(op.join(path, '.git')):
+            return path
+        parent = op.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translate a gitignore glob, already relative to the directory of its file,
+    into a regex matching the whole relative path.
+    """
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and i + 3 == n:
+            out.append('/.*')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] == '!':
+                j += 1
+            # a `]` right after the bracket is part of the class
+            j = pattern.find(']', j + 1)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def parse_rules(lines: Iterable[str]) -> List[Tuple[str, bool, bool]]:
+    """
+    Parse the lines of an ignore file into `(regex, negated, directories
+    only)` rules, in the order they appear.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line or line.startswith('#'):
+            continue
+        # trailing spaces are ignored unless escaped
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        if '/' in line:
+            # anchored to the directory of the ignore file
+            regex = _translate(line.lstrip('/'))
+        else:
+            regex = '(?:.*/)?' + _translate(line)
+        rules.append((regex, negated, dir_only))
+    return rules
+
+
+def _group(rules: List[Tuple[str, bool, bool]]) -> List[RuleGroup]:
+    # The last matching rule decides, so rules are tried from the end and
+    # neighbours with the same sign are matched with one regex
+    groups: List[RuleGroup] = []
+    run: List[str] = []
+    sign = None
+    for regex, negated, _ in reversed(rules):
+        if run and negated != sign:
+            groups.append((re.compile('(?:%s)$' % '|'.join(run)), sign))
+            run = []
+        run.append(regex)
+        sign = negated
+    if run:
+        groups.append((re.compile('(?:%s)$' % '|'.join(run)), sign))
+    return groups
+
+
+class GitIgnore:
+    """
+    The compiled rules of one ignore file, relative to the directory `base`.
+    """
+
+    base: str
+    _files: List[RuleGroup]
+    _dirs: List[RuleGroup]
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        rules = parse_rules(lines)
+        self._files = _group([r for r in rules if not r[2]])
+        self._dirs = _group(rules)
+
+    def __bool__(self) -> bool:
+        return bool(self._dirs)
+
+    @classmethod
+    def load(cls, path: str, base: str) -> Optional['GitIgnore']:
+        try:
+            with open(path, errors='replace') as fd:
+                ignore = cls(base, fd)
+        except OSError:
+            return None
+        return ignore if ignore else None
+
+    def match(self, relpath: str, is_dir: bool) -> Optional[bool]:
+        """
+        True if ignored, False if re-included by a negated rule and None if no
+        rule matched.
+        """
+        for regex, negated in (self._dirs if is_dir else self._files):
+            if regex.match(relpath):
+                return not negated
+        return None
+
+
+class IgnoreTree:
+    """
+    The ignore files of a git work tree, `.git/info/exclude` and a
+    `.gitignore` in any directory. Ignore files are read and compiled the first
+    time a path in their directory is matched and kept until they change.
+    Whether a directory is ignored is cached, nothing inside an ignored
+    directory can be re-included.
+    """
+
+    root: str
+    exclude: Optional[GitIgnore]
+    # directory -> rules of its ignore file, None if it has none
+    files: Dict[str, Optional[GitIgnore]]
+    # directory -> whether it is ignored
+    _ignored_dirs: Dict[str, bool]
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files = {}
+        self._ignored_dirs = {}
+        self.exclude = None
+        vcs_dir = find_vcs_dir(root)
+        if vcs_dir is not None:
+            self.exclude = GitIgnore.load(op.join(vcs_dir, 'info', 'exclude'), root)
+
+    def _rules(self, dirname: str) -> Optional[GitIgnore]:
+        try:
+            return self.files[dirname]
+        except KeyError:
+            pass
+        ignore = GitIgnore.load(op.join(dirname, IGNORE_FILE), dirname)
+        self.files[dirname] = ignore
+        return ignore
+
+    def _match(self, path: str, is_dir: bool) -> bool:
+        # deeper ignore files take precedence, `exclude` has the lowest
+        dirname = op.dirname(path)
+        while True:
+            ignore = self._rules(dirname)
+            if ignore is not None:
+                matched = ignore.match(path[len(dirname) + 1:], is_dir)
+                if matched is not None:
+                    return matched
+            if dirname == self.root:
+                break
+            dirname = op.dirname(dirname)
+        if self.exclude is not None:
+            return bool(self.exclude.match(path[len(self.root) + 1:], is_dir))
+        return False
+
+    def _is_dir_ignored(self, dirname: str) -> bool:
+        if dirname == self.root:
+            return False
+        ignored = self._ignored_dirs.get(dirname)
+        if ignored is None:
+            ignored = (self._is_dir_ignored(op.dirname(dirname))
+                       or self._match(dirname, True))
+            self._ignored_dirs[dirname] = ignored
+        return ignored
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        """
+        `path` must be an absolute path inside `root`.
+        """
+        if path == self.root:
+            return False
+        if is_dir:
+            return self._is_dir_ignored(path)
+        return self._is_dir_ignored(op.dirname(path)) or self._match(path, False)
+
+    def reload(self, path: str) -> None:
+        """
+        Forget the rules of the ignore file `path` after it changed.
+        """
+        dirname = op.dirname(path)
+        if dirname in self.files:
+            display_debug(f'{path} changed, recompiling ignore rules')
+            del self.files[dirname]
+            self._ignored_dirs = {}
+
+
+# work tree -> shared ignore rules
+_trees: Dict[str, IgnoreTree] = {}
+_trees_lock = threading.Lock()
+
+
+def get_ignore_tree(path: str) -> Optional[IgnoreTree]:
+    """
+    Returns the ignore rules of the work tree containing `path`, shared by
+    every task in it.
+    """
+    root = find_work_tree(path)
+    if root is None:
+        return None
+    with _trees_lock:
+        tree = _trees.get(root)
+        if tree is None:
+            tree = _trees[root] = IgnoreTree(root)
+        return tree
+
+
+class VcsIgnore:
+    """
+    Matches paths against the ignore files of the work trees containing the
+    `paths` of a task.
+    """
+
+    trees: List[IgnoreTree]
+
+    def __init__(self, trees: Iterable[IgnoreTree]):
+        self.trees = []
+        for tree in trees:
+            if tree not in self.trees:
+                self.trees.append(tree)
+
+    def __bool__(self) -> bool:
+        return bool(self.trees)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> 'VcsIgnore':
+        trees = (get_ignore_tree(p) for p in paths if op.exists(p))
+        return cls(t for t in trees if t is not None)
+
+    def _tree(self, path: str) -> Optional[IgnoreTree]:
+        for tree in self.trees:
+            if path.startswith(tree.root + os.sep):
+                return tree
+        return None
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        path = op.abspath(path)
+        tree = self._tree(path)
+        return tree is not None and tree.is_ignored(path, is_dir)
+
+    def reload(self, path: str) -> bool:
+        """
+        Reload the rules of `path` if it is an ignore file, returns True if it
+        is one.
+        """
+        if op.basename(path) != IGNORE_FILE:
+            return False
+        path = op.abspath(path)
+        tree = self._tree(path)
+        if tree is not None:
+            tree.reload(path)
+        return True
+
+
+__all__ = ['GitIgnore', 'IGNORE_FILE', 'IgnoreTree', 'VcsIgnore', 'find_work_tree',
+           'get_ignore_tree', 'parse_rules']
@@ -0,0 +1,125 @@
+import os
+import os.path as op
+from typing import Any, Callable, List, Optional
+
+from watchdog.events import (EVENT_TYPE_CREATED, EVENT_TYPE_MOVED,
+                             FileSystemEvent, PatternMatchingEventHandler)
+
+from .filelist import FileList
+from .gitignore import VcsIgnore
+from .links import LinkMap
+from .scan import PathFilter
+from .settle import EVENT_TYPE_CLOSED
+from .storm import StormDetector
+from .task import ForemonTask
+
+
+class TaskEventHandler(PatternMatchingEventHandler):
+    """
+    Forwards events with a path matching the patterns of a task to `callback`
+    regardless of the event type. Events are filtered by type later, after
+    editor save sequences are coalesced.
+
+    With a `files` list paths are matched by a set lookup instead, files which
+    appear in a watched directory but are not listed are passed to
+    `on_new_file` so the list can be refreshed.
+
+    Events which pass every filter are counted by the `storm` detector, during
+    a storm they are only counted. `closed` events are dropped first unless the
+    task asked for them.
+
+    With `links` events for the real paths behind symbolic links are
+    forwarded once for each logical path of the file.
+
+    With `vcs_ignore` paths ignored by git are dropped as well. A changed
+    ignore file is reloaded and reported to `on_ignore_change`, even though the
+    file itself usually does not match.
+    """
+
+    task: ForemonTask
+    callback: Callable[[ForemonTask, FileSystemEvent], Any]
+    files: Optional[FileList]
+    on_new_file: Optional[Callable[[ForemonTask, FileSystemEvent], Any]]
+    storm: Optional[StormDetector]
+    links: Optional[LinkMap]
+    vcs_ignore: Optional[VcsIgnore]
+    on_ignore_change: Optional[Callable[[ForemonTask], Any]]
+    # compiled `patterns` and `ignore_patterns`
+    path_filter: PathFilter
+
+    def __init__(self, task: ForemonTask, callback: Callable[[ForemonTask, FileSystemEvent], Any],
+                 files: Optional[FileList] = None,
+                 on_new_file: Optional[Callable[[ForemonTask, FileSystemEvent], Any]] = None,
+                 storm: Optional[StormDetector] = None,
+                 links: Optional[LinkMap] = None,
+                 vcs_ignore: Optional[VcsIgnore] = None,
+                 on_ignore_change: Optional[Callable[[ForemonTask], Any]] = None):
+        conf = task.config
+        super().__init__(
+            patterns=conf.patterns,
+            ignore_patterns=conf.ignore_defaults + conf.ignore,
+            ignore_directories=conf.ignore_dirs,
+            case_sensitive=not conf.ignore_case)
+        self.task = task
+        self.callback = callback
+        self.files = files
+        self.on_new_file = on_new_file
+        self.storm = storm
+        self.links = links
+        self.vcs_ignore = vcs_ignore or None
+        self.on_ignore_change = on_ignore_change
+        self.path_filter = PathFilter(self.patterns, self.ignore_patterns, self.case_sensitive)
+
+    def dispatch(self, event: FileSystemEvent) -> None:
+        if self.vcs_ignore is not None and not event.is_directory:
+            self._reload_ignore_files(event)
+
+        if event.event_type == EVENT_TYPE_CLOSED and EVENT_TYPE_CLOSED not in self.task.config.events:
+            return
+
+        if self.ignore_directories and event.is_directory:
+            return
+
+        if self.links is None:
+            self._dispatch_event(event)
+            return
+        for mapped in self.links.map_event(event):
+            self._dispatch_event(mapped)
+
+    def _reload_ignore_files(self, event: FileSystemEvent) -> None:
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        changed = [self.vcs_ignore.reload(os.fsdecode(p)) for p in paths if p]
+        if any(changed) and self.on_ignore_change is not None:
+            self.on_ignore_change(self.task)
+
+    def _dispatch_event(self, event: FileSystemEvent) -> None:
+        paths = []
+        if hasattr(event, 'dest_path'):
+            paths.append(os.fsdecode(event.dest_path))
+        if event.src_path:
+            paths.append(os.fsdecode(event.src_path))
+
+        if self.files is not None:
+            self._dispatch_listed(event, paths)
+        elif self.vcs_ignore is not None and all(
+                self.vcs_ignore.is_ignored(p, event.is_directory) for p in paths):
+            return
+        elif any(self.path_filter.match(p) for p in paths):
+            self._forward(event, self.callback)
+
+    def _dispatch_listed(self, event: FileSystemEvent, paths: List[str]) -> None:
+        files = self.files
+        if any(op.abspath(p) in files for p in paths):
+            self._forward(event, self.callback)
+        elif self.on_new_file and event.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MOVED):
+            self._forward(event, self.on_new_file)
+
+    def _forward(self, event: FileSystemEvent,
+                 callback: Callable[[ForemonTask, FileSystemEvent], Any]) -> None:
+        # ignored events do not count towards a storm
+        if self.storm is not None and self.storm.absorb(self.task, event):
+            return
+        callback(self.task, event)
+
+
+__all__ = ['TaskEventHandler']
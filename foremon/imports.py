@@ -0,0 +1,260 @@
+import ast
+import os.path as op
+import re
+import shlex
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from watchdog.events import EVENT_TYPE_MODIFIED, FileSystemEvent
+
+from .config import ForemonConfig
+from .settle import EVENT_TYPE_CLOSED
+
+# An import as (level, dotted name), level is 0 for absolute imports
+ImportSpec = Tuple[int, str]
+
+FROM_IMPORT = re.compile(r'(?:from|import)\s+([\w.]+)')
+
+
+def parse_imports(path: str) -> List[ImportSpec]:
+    """
+    Returns the modules imported by the python file at `path`. For `from a
+    import b` both `a` and `a.b` are returned since `b` may be a module.
+    """
+    with open(path, 'rb') as fd:
+        source = fd.read()
+
+    try:
+        tree = ast.parse(source, path)
+    except (SyntaxError, ValueError):
+        return []
+
+    specs: List[ImportSpec] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                specs.append((0, alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if module or node.level:
+                specs.append((node.level, module))
+            for alias in node.names:
+                if alias.name != '*':
+                    name = f'{module}.{alias.name}' if module else alias.name
+                    specs.append((node.level, name))
+    return specs
+
+
+def resolve_module(base: str, name: str) -> List[str]:
+    """
+    Returns the files under `base` executed by importing the dotted `name`,
+    the `__init__.py` of each package and the module itself.
+    """
+    files = []
+    parts = name.split('.') if name else []
+    path = base
+    for part in parts:
+        init = op.join(path, part, '__init__.py')
+        if op.isfile(init):
+            files.append(init)
+        elif op.isfile(op.join(path, part + '.py')):
+            files.append(op.join(path, part + '.py'))
+            break
+        elif not op.isdir(op.join(path, part)):
+            break
+        path = op.join(path, part)
+    return files
+
+
+def get_import_roots(config: ForemonConfig) -> List[str]:
+    """
+    Directories absolute imports of a task are resolved from, the cwd of the
+    task and its PYTHONPATH.
+    """
+    cwd = op.abspath(config.cwd)
+    roots = [cwd]
+    python_path = config.environment.get('PYTHONPATH', '')
+    for path in python_path.split(op.pathsep):
+        if path:
+            path = op.normpath(op.join(cwd, path))
+            if path not in roots:
+                roots.append(path)
+    return roots
+
+
+def guess_entry_files(config: ForemonConfig, roots: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the python files run by the last script of a task, the script
+    itself or the module executed by `python -m` or imported by `python -c`.
+    These are the scripts `guess_and_update_scripts` produces.
+    """
+    if not config.scripts:
+        return []
+    if roots is None:
+        roots = get_import_roots(config)
+
+    try:
+        args = shlex.split(config.scripts[-1])
+    except ValueError:
+        return []
+
+    if args and op.basename(args[0]).startswith('python'):
+        args = args[1:]
+
+    modules: List[str] = []
+    for i, arg in enumerate(args):
+        if arg == '-m' and i + 1 < len(args):
+            modules.append(args[i + 1])
+            break
+        if arg == '-c' and i + 1 < len(args):
+            modules.extend(FROM_IMPORT.findall(args[i + 1]))
+            break
+        if arg.startswith('-'):
+            continue
+        if arg.endswith('.py'):
+            path = op.join(roots[0], arg)
+            return [op.abspath(path)] if op.isfile(path) else []
+        break
+
+    files: List[str] = []
+    for module in modules:
+        for root in roots:
+            found = resolve_module(root, module)
+            if found:
+                main = op.join(op.dirname(found[-1]), '__main__.py')
+                if found[-1].endswith('__init__.py') and op.isfile(main):
+                    found.append(main)
+                files.extend(found)
+                break
+    return files
+
+
+class ImportGraph:
+    """
+    Transitive closure of the project files imported by the entry files of a
+    task. Imports are parsed once per file and only parsed again when the file
+    is modified. The closure is rebuilt from the parsed imports when a change
+    could alter it.
+    """
+
+    entries: List[str]
+    roots: List[str]
+    imports: Dict[str, List[ImportSpec]]
+    _version: int
+    _closure: Optional[Set[str]]
+
+    def __init__(self, entries: Iterable[str], roots: Iterable[str]):
+        self.entries = [op.abspath(p) for p in entries]
+        self.roots = [op.abspath(p) for p in roots]
+        self.imports = {}
+        self._version = 0
+        self._closure = None
+
+    @property
+    def closure(self) -> Set[str]:
+        if self._closure is None:
+            self._closure = self._build()
+            self._version += 1
+        return self._closure
+
+    @property
+    def version(self) -> int:
+        """
+        Incremented every time the closure is rebuilt, the closure is rebuilt
+        first if a change invalidated it.
+        """
+        if self._closure is None:
+            self._closure = self._build()
+            self._version += 1
+        return self._version
+
+    @property
+    def directories(self) -> Set[str]:
+        """
+        Directories containing the files of the closure.
+        """
+        return set(op.dirname(p) for p in self.closure)
+
+    def _parse(self, path: str) -> List[ImportSpec]:
+        specs = self.imports.get(path)
+        if specs is None:
+            try:
+                specs = parse_imports(path)
+            except OSError:
+                specs = []
+            self.imports[path] = specs
+        return specs
+
+    def _resolve(self, path: str, spec: ImportSpec) -> List[str]:
+        level, name = spec
+        if level:
+            base = op.dirname(path)
+            for _ in range(level - 1):
+                base = op.dirname(base)
+            if not name:
+                init = op.join(base, '__init__.py')
+                return [init] if op.isfile(init) else []
+            return resolve_module(base, name)
+        for root in self.roots:
+            files = resolve_module(root, name)
+            if files:
+                return files
+        return []
+
+    def _build(self) -> Set[str]:
+        seen: Set[str] = set()
+        stack = [p for p in self.entries if op.isfile(p)]
+        while stack:
+            path = stack.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            for spec in self._parse(path):
+                for dep in self._resolve(path, spec):
+                    if dep not in seen:
+                        stack.append(op.abspath(dep))
+        return seen
+
+    def update(self, ev: FileSystemEvent) -> None:
+        """
+        Update the graph for a file event. A modified or closed file is parsed
+        again and the closure is only rebuilt if its imports changed, other
+        events may change how imports resolve and always rebuild the closure.
+        """
+        if ev.event_type not in (EVENT_TYPE_MODIFIED, EVENT_TYPE_CLOSED):
+            for path in (ev.src_path, getattr(ev, 'dest_path', None)):
+                if path:
+                    self.imports.pop(op.abspath(path), None)
+            self._closure = None
+            return
+
+        path = op.abspath(ev.src_path)
+        old = self.imports.pop(path, None)
+        if old is None:
+            return
+        if self._parse(path) != old:
+            self._closure = None
+
+    def __contains__(self, path: str) -> bool:
+        return op.abspath(path) in self.closure
+
+    def is_related(self, ev: FileSystemEvent) -> bool:
+        """
+        Update the graph for `ev` and return True if it touches a file in the
+        closure before or after the update. Events for files other than python
+        files are always related.
+        """
+        paths = [p for p in (ev.src_path, getattr(ev, 'dest_path', None)) if p]
+        if ev.is_directory or not all(is_python_file(p) for p in paths):
+            self.update(ev)
+            return True
+        before = any(p in self for p in paths)
+        self.update(ev)
+        return before or any(p in self for p in paths)
+
+
+def is_python_file(path: str) -> bool:
+    return path.endswith('.py')
+
+
+__all__ = ['ImportGraph', 'get_import_roots', 'guess_entry_files',
+           'is_python_file', 'parse_imports']
@@ -0,0 +1,154 @@
+import os
+import os.path as op
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from watchdog.events import FileSystemEvent
+
+from .display import display_debug
+from .scan import find_dir_links
+from .watches import WatchKey
+
+# A real directory and a logical path which leads to it
+Alias = Tuple[str, str]
+
+
+def is_below(path: str, root: str) -> bool:
+    """
+    True if `path` is `root` or inside of it.
+    """
+    return path == root or path.startswith(op.join(root, ''))
+
+
+class LinkMap:
+    """
+    The real directories below the paths of a task, following symbolic links.
+
+    Every real directory is watched once, no matter how many links lead to it
+    or if it is also inside a watched path. Directories are identified by their
+    inode so bind mounts of the same directory are watched once too. Links to
+    one of their own parents are not followed.
+
+    Events for real paths are mapped back to every logical path inside the
+    configured `roots` they can be reached by.
+    """
+
+    roots: List[str]
+    # real directories to watch
+    watched: List[str]
+    # (st_dev, st_ino) -> watched path of the directory
+    inodes: Dict[Tuple[int, int], str]
+    # real directory -> logical paths leading to it
+    aliases: Dict[str, List[str]]
+    # number of links followed
+    followed: int
+
+    def __init__(self, roots: Iterable[str] = ()):
+        self.roots = list(roots)
+        self.watched = []
+        self.inodes = {}
+        self.aliases = {}
+        self.followed = 0
+
+    @classmethod
+    def build(cls, paths: Iterable[str], prune: Callable[[str], bool],
+              recursive: bool = True) -> 'LinkMap':
+        links = cls(op.normpath(p) for p in paths)
+        pending = []
+        for path in links.roots:
+            real = op.realpath(path)
+            watched, new = links._add(real)
+            if watched is None:
+                continue
+            if watched != path:
+                links._alias(watched, path)
+            if recursive and new and op.isdir(real):
+                pending.append(real)
+
+        while pending:
+            for link in find_dir_links(pending.pop(), prune):
+                target = op.realpath(link)
+                if is_below(op.dirname(link), target):
+                    display_debug(f'{link} links to its parent {target}, not followed')
+                    continue
+                watched, new = links._add(target)
+                if watched is None:
+                    continue
+                links._alias(watched, link)
+                links.followed += 1
+                if recursive and new:
+                    pending.append(target)
+        return links
+
+    def _add(self, real: str) -> Tuple[Optional[str], bool]:
+        """
+        Watch `real` unless it is watched already, returns the path its events
+        are reported with and whether it was added.
+        """
+        if any(is_below(real, path) for path in self.watched):
+            # already scanned with its parent
+            return real, False
+        try:
+            st = os.stat(real)
+        except OSError:
+            return None, False
+        inode = (st.st_dev, st.st_ino)
+        if inode in self.inodes:
+            return self.inodes[inode], False
+        self.inodes[inode] = real
+        self.watched = [p for p in self.watched if not is_below(p, real)] + [real]
+        return real, True
+
+    def _alias(self, real: str, logical: str) -> None:
+        aliases = self.aliases.setdefault(real, [])
+        if logical not in aliases:
+            aliases.append(logical)
+
+    def watch_keys(self, recursive: bool) -> List[WatchKey]:
+        return [(path, recursive) for path in self.watched]
+
+    def logical_paths(self, path: str) -> List[str]:
+        """
+        Every path inside the roots `path` can be reached by. Each link is
+        followed once per path, so links forming a cycle end.
+        """
+        result = []
+        pending: List[Tuple[str, FrozenSet[Alias]]] = [(path, frozenset())]
+        seen: Set[str] = set()
+        while pending:
+            current, used = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            if any(is_below(current, root) for root in self.roots):
+                result.append(current)
+            for real, logicals in self.aliases.items():
+                if not is_below(current, real):
+                    continue
+                rest = current[len(real):]
+                for logical in logicals:
+                    if (real, logical) not in used:
+                        pending.append((logical + rest, used | {(real, logical)}))
+        return result
+
+    def map_event(self, event: FileSystemEvent) -> List[FileSystemEvent]:
+        """
+        Copies of `event` for each logical path of the file.
+        """
+        src = self.logical_paths(event.src_path) if event.src_path else []
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path is None:
+            if src == [event.src_path]:
+                return [event]
+            return [type(event)(path) for path in src]
+
+        # a side moved out of the roots keeps its real path
+        src = src or [event.src_path]
+        dest = self.logical_paths(dest_path) or [dest_path]
+        if src == [event.src_path] and dest == [dest_path]:
+            return [event]
+        count = max(len(src), len(dest))
+        return [type(event)(src[min(i, len(src) - 1)], dest[min(i, len(dest) - 1)])
+                for i in range(count)]
+
+
+__all__ = ['LinkMap', 'is_below']
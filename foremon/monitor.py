@@ -1,16 +1,35 @@
 import asyncio
 import errno
+import signal
+from foremon.budget import BUDGET_POLL_INTERVAL, WatchBudget
+from foremon.changes import ChangeSet
+from foremon.coalesce import SaveCoalescer
 from foremon.debounce import Debounce
+from foremon.filelist import FileList
+from foremon.filters import ContentFilter
+from foremon.handler import TaskEventHandler
+from foremon.polling import ShardedPollingObserver
+from foremon.imports import ImportGraph, get_import_roots, guess_entry_files
+from foremon.links import LinkMap
+from foremon.multiplex import MultiplexedObserver, make_observer
+from foremon.watches import WatchKey, WatchSet, remove_handler
 import os.path as op
 from asyncio import BaseEventLoop, Queue
 from functools import partial
-from typing import Any, List, Optional, Set, TextIO
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
 
-from watchdog.events import FileSystemEvent, PatternMatchingEventHandler
+from watchdog.events import EVENT_TYPE_MOVED, FileSystemEvent
 from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
+from watchdog.utils.patterns import match_any_paths
 
 from foremon.config import ForemonConfig
 from foremon.errors import ForemonError
+from foremon.scan import PathFilter
+from foremon.settle import EVENT_TYPE_CLOSED, FileClosedEvent, SettleFilter
+from foremon.snapshot import Snapshot, TreeSnapshot, diff_snapshots, take_snapshot
+from foremon.storm import Storm, StormDetector, rescan_changed
+from foremon.vcs import VcsGuard, find_vcs_dir
 from contextlib import contextmanager
 from .config import *
 from .display import *
@@ -22,13 +41,44 @@ class Monitor:
 
     _loop: BaseEventLoop
     observer: Observer
+    # created for the first task which polls for changes
+    poller: Optional[ShardedPollingObserver]
     debounce: Debounce
     pipe: Optional[TextIO]
     queue: Queue
     stop_timeout: int
-    # used to suppress duplicate events (like create+modify when file is touched)
-    current_files: Set[str]
-    active_tasks: Set[ForemonTask]
+    # used to merge the events of editors saving files
+    coalescer: SaveCoalescer
+    # used to suppress events for files whose content did not change
+    content_filter: ContentFilter
+    # used to wait until files are written for tasks with `closed` events
+    settle: SettleFilter
+    # used to drop events for python files a task does not import
+    import_graphs: Dict[ForemonTask, ImportGraph]
+    watch_sets: Dict[ForemonTask, WatchSet]
+    # plans inotify watches against the kernel limit, None where it is unknown
+    budget: Optional[WatchBudget]
+    # paths of tasks polled because they did not fit in the budget
+    budget_polls: Dict[ForemonTask, WatchSet]
+    # used to replace a burst of events with one rescan
+    storm: StormDetector
+    # tasks with debounced events when a storm started
+    storm_held: Set[ForemonTask]
+    # used to hold restarts while a rebase, merge or commit is in progress
+    vcs_guards: Dict[ForemonTask, VcsGuard]
+    # tasks with changes held until a VCS operation finishes
+    vcs_held: Set[ForemonTask]
+    # real directories behind the symbolic links of tasks with `follow_symlinks`
+    link_maps: Dict[ForemonTask, LinkMap]
+    # exact files watched by tasks with `files_from`
+    file_lists: Dict[ForemonTask, FileList]
+    # events for unlisted files waiting for a file list refresh
+    unlisted_events: Dict[ForemonTask, List[FileSystemEvent]]
+    # version of the import graph the `auto` watches were derived from
+    auto_versions: Dict[ForemonTask, int]
+    # files of tasks with `snapshot` as their current run started
+    run_snapshots: Dict[ForemonTask, Snapshot]
+    active_runs: Dict[ForemonTask, asyncio.Future]
     all_tasks: Set[ForemonTask]
     is_terminating: bool
     is_paused: bool
@@ -39,13 +89,32 @@ class Monitor:
             loop = asyncio.get_event_loop()
 
         self.stop_timeout = 5
-        self.observer = Observer()
+        self.observer = make_observer(close_events=True, on_walked=self._on_walked)
+        self.poller = None
         self.debounce = Debounce(dwell, self.queue_task_event, loop=loop)
         self.pipe = pipe
         self._loop = loop
         self.queue = Queue()
-        self.current_files = set()
-        self.active_tasks = set()
+        self.coalescer = SaveCoalescer()
+        self.content_filter = ContentFilter(self._accept_event, loop=loop)
+        self.settle = SettleFilter(self._filter_event, loop=loop)
+        self.import_graphs = {}
+        self.storm = StormDetector(self._storm_ended, loop=loop,
+                                   on_storm_start=self._storm_started)
+        self.storm_held = set()
+        self.vcs_guards = {}
+        self.vcs_held = set()
+        self.watch_sets = {}
+        self.budget = None
+        if isinstance(self.observer, MultiplexedObserver):
+            self.budget = WatchBudget.from_system()
+        self.budget_polls = {}
+        self.auto_versions = {}
+        self.link_maps = {}
+        self.file_lists = {}
+        self.unlisted_events = {}
+        self.run_snapshots = {}
+        self.active_runs = {}
         self.all_tasks = set()
         self.is_terminating = False
         self.is_paused = False
@@ -54,6 +123,10 @@ class Monitor:
     def loop(self):
         return self._loop
 
+    @property
+    def active_tasks(self) -> Set[ForemonTask]:
+        return set(self.active_runs)
+
     def add_task(self, task: ForemonTask) -> 'Monitor':
 
         if task in self.all_tasks:
@@ -72,42 +145,485 @@ class Monitor:
             display_debug('ignore_case', conf.ignore_case)
             display_debug('events', list(map(lambda e: e.name, conf.events)))
 
-        for path in list(conf.paths):
-            if not op.exists(path):
-                display_warning(f'cannot watch {path}, path does not exist')
-                conf.paths.remove(path)
+        if conf.files_from:
+            self._add_file_list(task)
+        else:
+            for path in list(conf.paths):
+                if not op.exists(path):
+                    display_warning(f'cannot watch {path}, path does not exist')
+                    conf.paths.remove(path)
+
+            if not conf.paths and not conf.auto_paths:
+                raise ForemonError(
+                    'no valid paths specified, cannot add watch task', errno.ENOENT)
+
+        if conf.follow_imports or conf.auto_paths:
+            self._add_import_graph(task)
+
+        if conf.auto_paths and task not in self.import_graphs and not conf.files_from:
+            display_warning(f'cannot derive paths of {task.name}, watching {conf.cwd}')
+            conf.paths = [conf.cwd]
+
+        if conf.follow_symlinks and not conf.files_from:
+            self._add_link_map(task)
+
+        path_filter = PathFilter.from_config(conf)
+        if path_filter.vcs_ignore is not None:
+            display_debug(
+                f'{task.name} uses the ignore files of {len(path_filter.vcs_ignore.trees)} work trees')
+
+        handler = TaskEventHandler(task, self._on_event,
+                                   files=self.file_lists.get(task),
+                                   on_new_file=self._on_unlisted_file,
+                                   storm=self.storm,
+                                   links=self.link_maps.get(task),
+                                   vcs_ignore=path_filter.vcs_ignore,
+                                   on_ignore_change=self._on_ignore_change)
+
+        if conf.polling:
+            watches = WatchSet(self._get_poller(), handler,
+                               path_filter=path_filter,
+                               interval=conf.poll_interval)
+        elif isinstance(self.observer, MultiplexedObserver):
+            watches = WatchSet(self.observer, handler,
+                               path_filter=path_filter)
+        else:
+            watches = WatchSet(self.observer, handler)
+        self.watch_sets[task] = watches
+        self.update_watches(task)
+
+        if conf.wait_for_vcs:
+            self._add_vcs_guard(task)
+
+        if conf.cache:
+            task.watched_files = partial(self._watched_files, task)
+
+        if conf.snapshot:
+            task.add_before_callback(self._snapshot_run)
+            task.add_after_callback(self._save_snapshot)
 
-        if not conf.paths:
-            raise ForemonError(
-                'no valid paths specified, cannot add watch task', errno.ENOENT)
+        self.all_tasks.add(task)
 
-        callback = partial(self.debounce.submit_threadsafe, task)
+        return self
 
-        handler = PatternMatchingEventHandler(
-            patterns=conf.patterns,
-            ignore_patterns=conf.ignore_defaults + conf.ignore,
-            ignore_directories=conf.ignore_dirs,
-            case_sensitive=not conf.ignore_case)
+    def remove_task(self, task: ForemonTask) -> None:
+        """
+        Stop a task and remove its watches, leaving the other tasks running.
+        Watches shared with other tasks are kept for them.
+        """
+        self.all_tasks.discard(task)
+        task.terminate()
+
+        watches = self.watch_sets.pop(task, None)
+        if watches is not None:
+            watches.clear()
+        polls = self.budget_polls.pop(task, None)
+        if polls is not None:
+            polls.clear()
+        if self.budget is not None:
+            self.budget.release(task)
+
+        guard = self.vcs_guards.pop(task, None)
+        if guard is not None and guard not in self.vcs_guards.values():
+            guard.cancel()
+            for observer in self.observers:
+                remove_handler(observer, guard)
+
+        self.import_graphs.pop(task, None)
+        self.auto_versions.pop(task, None)
+        self.link_maps.pop(task, None)
+        self.file_lists.pop(task, None)
+        self.unlisted_events.pop(task, None)
+        self.run_snapshots.pop(task, None)
+        self.storm_held.discard(task)
+        self.vcs_held.discard(task)
+        self.settle.discard(task)
+        self.debounce.discard(task)
 
-        if Events.created in conf.events:
-            handler.on_created = callback
-        if Events.deleted in conf.events:
-            handler.on_deleted = callback
-        if Events.moved in conf.events:
-            handler.on_moved = callback
-        if Events.modified in conf.events:
-            handler.on_modified = callback
+    @property
+    def observers(self) -> List[Observer]:
+        if self.poller is None:
+            return [self.observer]
+        return [self.observer, self.poller]
+
+    def _get_poller(self) -> ShardedPollingObserver:
+        if self.poller is None:
+            self.poller = ShardedPollingObserver()
+            if self.observer.is_alive():
+                self.poller.start()
+        return self.poller
+
+    def _add_import_graph(self, task: ForemonTask) -> None:
+        roots = get_import_roots(task.config)
+        entries = guess_entry_files(task.config, roots)
+        if not entries:
+            display_warning(
+                f'cannot follow imports of {task.name}, no python module found in its scripts')
+            return
 
-        for path in conf.paths:
-            self.observer.schedule(handler, path, recursive=conf.recursive)
+        graph = ImportGraph(entries, roots)
+        self.import_graphs[task] = graph
+        display_debug(
+            f'{task.name} imports {len(graph.closure)} files from the project')
 
-        self.all_tasks.add(task)
+    def _add_link_map(self, task: ForemonTask) -> None:
+        conf = task.config
+        links = LinkMap.build(conf.paths, PathFilter.from_config(conf).prune, conf.recursive)
+        self.link_maps[task] = links
+        display_debug(
+            f'{task.name} follows {links.followed} symbolic links,'
+            f' watching {len(links.watched)} real paths')
 
-        return self
+    def get_watch_keys(self, task: ForemonTask) -> Iterator[WatchKey]:
+        """
+        Yields the paths to watch for a task. With `paths = "auto"` the
+        directories of the files the python script imports are watched,
+        non-recursively. Tasks with a file list only watch the directories of
+        the listed files. With `follow_symlinks` the real paths are watched.
+        """
+        conf = task.config
+        files = self.file_lists.get(task)
+        if files is not None:
+            for dirname in files.directories:
+                yield dirname, False
+            return
+
+        links = self.link_maps.get(task)
+        if links is not None:
+            yield from links.watch_keys(conf.recursive)
+
+        if links is None:
+            for path in conf.paths:
+                yield path, conf.recursive
+
+        graph = self.import_graphs.get(task)
+        if conf.auto_paths and graph is not None:
+            self.auto_versions[task] = graph.version
+            for dirname in graph.directories:
+                yield dirname, False
+
+    def update_watches(self, task: ForemonTask) -> Tuple[int, int]:
+        """
+        Schedule the watches of a task, returns the number of watches added and
+        removed. Paths which do not fit in the inotify watch budget are polled.
+        """
+        keys = self.get_watch_keys(task)
+        watches = self.watch_sets[task]
+        if self.budget is None or watches.observer is not self.observer:
+            return watches.update(keys)
+
+        plan = self.budget.plan(task, keys)
+        if isinstance(self.observer, MultiplexedObserver):
+            # a walk past the watches left is planned again like a full one
+            for (path, _), limit in plan.limits.items():
+                self.observer.limit_watches(path, limit)
+        added, removed = watches.update(plan.native)
+
+        polls = self.budget_polls.get(task)
+        if plan.polled and polls is None:
+            polls = self.budget_polls[task] = WatchSet(
+                self._get_poller(), watches.handler,
+                path_filter=watches.options.get('path_filter'),
+                interval=BUDGET_POLL_INTERVAL)
+        if polls is not None:
+            for path, _ in (k for k in plan.polled if k not in polls):
+                display_warning(
+                    f'not enough inotify watches for {path},'
+                    f' polling it every {BUDGET_POLL_INTERVAL:.0f}s')
+            more, fewer = polls.update(plan.polled)
+            added, removed = added + more, removed + fewer
+        return added, removed
+
+    def _on_walked(self, watch: ObservedWatch, needed: int, children: Dict[str, int],
+                   full: bool) -> None:
+        # called from the walk thread, which may outlive the loop
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._record_walk, watch.path, needed, children, full)
+
+    def _record_walk(self, path: str, needed: int, children: Dict[str, int], full: bool) -> None:
+        """
+        Count a walked tree against the watch budget. When the walk reached
+        the watch limit, the tasks watching the tree are planned again so the
+        part which does not fit is polled.
+        """
+        if self.budget is None:
+            return
+        self.budget.record(path, needed, children)
+        display_debug(
+            f'{path} needs {needed} inotify watches, limit {self.budget.limit}'
+            f' with {self.budget.used} used by other programs')
+        if not full:
+            return
+        for task in sorted(self.all_tasks, key=task_order):
+            if (path, True) in self.budget.planned.get(task, {}):
+                self.update_watches(task)
+
+    def _update_auto_watches(self, task: ForemonTask) -> None:
+        graph = self.import_graphs[task]
+        if self.auto_versions.get(task) == graph.version:
+            return
+        added, removed = self.update_watches(task)
+        if added or removed:
+            display_debug(
+                f'{task.name} imports changed, watching {added} more and {removed} fewer directories')
+
+    def _add_file_list(self, task: ForemonTask) -> None:
+        files = FileList.from_config(task.config)
+        files.refresh()
+        if not files:
+            display_warning(
+                f'`{task.config.files_from}` listed no files for {task.name}')
+        else:
+            display_debug(
+                f'{task.name} watches {len(files)} files in {len(files.directories)} directories')
+        self.file_lists[task] = files
+
+    def _on_unlisted_file(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        # called from observer threads
+        self.loop.call_soon_threadsafe(self._refresh_file_list, task, ev)
+
+    def _refresh_file_list(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        """
+        Run the `files_from` command of a task again after a file appeared
+        which is not listed. Events arriving during a refresh share it.
+        """
+        pending = self.unlisted_events.get(task)
+        if pending is not None:
+            pending.append(ev)
+            return
+        files = self.file_lists.get(task)
+        if files is None:
+            return
+
+        self.unlisted_events[task] = [ev]
+        fut = self.loop.run_in_executor(None, files.list)
+        fut.add_done_callback(partial(self._file_list_refreshed, task))
+
+    def _file_list_refreshed(self, task: ForemonTask, fut: asyncio.Future) -> None:
+        events = self.unlisted_events.pop(task, [])
+        files = self.file_lists.get(task)
+        if files is None or fut.cancelled() or fut.exception():
+            return
+
+        added, removed = files.update(fut.result())
+        if not added and not removed:
+            return
+
+        self.update_watches(task)
+        display_debug(
+            f'files of {task.name} changed, {len(added)} added and {len(removed)} removed')
+
+        for ev in events:
+            paths = [ev.src_path, getattr(ev, 'dest_path', None)]
+            if any(p and op.abspath(p) in added for p in paths):
+                self.submit_event(task, ev)
+
+    def _storm_started(self, storm: Storm) -> None:
+        # Debounced events would start runs on a half finished change
+        for task, changes in self.debounce.take_pending():
+            task.changes.update(changes)
+            self.storm_held.add(task)
+
+    def _storm_ended(self, storm: Storm) -> None:
+        tasks = dict(storm.tasks)
+        for task in self.storm_held:
+            tasks[task] = True
+        self.storm_held.clear()
+        display_info(
+            f'event storm of {storm.event_count} events over'
+            f' {storm.ended_at - storm.started_at:.1f}s ended, rescanning {len(tasks)} tasks')
+        asyncio.ensure_future(self._rescan_after_storm(storm, tasks), loop=self.loop)
+
+    async def _rescan_after_storm(self, storm: Storm, tasks: Dict[ForemonTask, bool]) -> None:
+        """
+        Trigger each task affected by a storm at most once, if the rescan finds
+        files modified since the storm started or the storm removed files.
+        """
+        for task in sorted(tasks, key=task_order):
+            if task not in self.all_tasks:
+                continue
+            changed = await self.loop.run_in_executor(
+                None, rescan_changed, task.config, storm.started_at, self._watched_files(task))
+            if not changed and not tasks[task]:
+                display_debug(f'no changes to {task.name} after the event storm')
+                continue
+            if self._hold_for_vcs(task, None):
+                task.changes.update(ChangeSet(changed))
+                continue
+            task.mark_triggered()
+            self.queue_task_event(task, None, ChangeSet(changed))
+
+    def _add_vcs_guard(self, task: ForemonTask) -> None:
+        vcs_dir = find_vcs_dir(task.config.cwd)
+        if vcs_dir is None:
+            return
+        for guard in self.vcs_guards.values():
+            if guard.vcs_dir == vcs_dir:
+                self.vcs_guards[task] = guard
+                return
+
+        guard = VcsGuard(vcs_dir, self._vcs_changed,
+                         max_hold=task.config.vcs_max_hold, loop=self.loop)
+        guard.scan()
+        if guard.busy:
+            display_warning(
+                f'{", ".join(sorted(guard.markers))} found in {vcs_dir}, holding restarts of'
+                f' {task.name} until it is removed or for {guard.max_hold}s')
+        observer = self._get_poller() if task.config.polling else self.observer
+        observer.schedule(guard, vcs_dir, recursive=False)
+        self.vcs_guards[task] = guard
+        display_debug(f'holding restarts of {task.name} during operations in {vcs_dir}')
+
+    def _vcs_busy(self, task: ForemonTask) -> bool:
+        guard = self.vcs_guards.get(task)
+        return guard is not None and guard.busy
+
+    def _vcs_changed(self, guard: VcsGuard) -> None:
+        if guard.busy:
+            # Debounced events would start runs on an intermediate state
+            for task, changes in self.debounce.take_pending():
+                task.changes.update(changes)
+                if self._vcs_busy(task):
+                    self.vcs_held.add(task)
+                else:
+                    self.debounce.submit(task, None)
+            return
+
+        tasks = [t for t in self.vcs_held if self.vcs_guards.get(t) is guard]
+        if not tasks:
+            return
+        display_info(
+            f'operation in {guard.vcs_dir} finished, restarting {len(tasks)} tasks')
+        # Debounced once more so changes still on their way are included
+        for task in sorted(tasks, key=task_order):
+            self.vcs_held.discard(task)
+            task.mark_triggered()
+            self.debounce.submit(task, None)
+
+    def _hold_for_vcs(self, task: ForemonTask, ev: Optional[FileSystemEvent]) -> bool:
+        """
+        Changes made while a VCS operation is in progress are held until it
+        finishes, then each task is restarted once.
+        """
+        if not self._vcs_busy(task):
+            return False
+        if ev is not None:
+            task.changes.add_event(ev)
+        if task not in self.vcs_held:
+            display_debug(f'VCS operation in progress, holding restart of {task.name}')
+        self.vcs_held.add(task)
+        return True
+
+    def _hold_for_storm(self, task: ForemonTask, ev: FileSystemEvent) -> bool:
+        """
+        Events which were on their way when a storm started are held with it.
+        """
+        if not self.storm.active:
+            return False
+        task.changes.add_event(ev)
+        self.storm_held.add(task)
+        return True
+
+    def _on_ignore_change(self, task: ForemonTask) -> None:
+        # called from observer threads
+        self.loop.call_soon_threadsafe(self._rewalk, task)
+
+    def _rewalk(self, task: ForemonTask) -> None:
+        """
+        Directories an ignore file no longer ignores are watched by walking the
+        watches of the task again, polling picks them up on its next scan.
+        """
+        watches = self.watch_sets.get(task)
+        if watches is None or not isinstance(watches.observer, MultiplexedObserver):
+            return
+        for watch in watches.watches.values():
+            watches.observer.rewalk(watch)
+
+    def _on_event(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        # called from observer threads
+        self.loop.call_soon_threadsafe(self.submit_event, task, ev)
+
+    def submit_event(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        """
+        Pass an event through the event filters before it is debounced.
+        """
+        if self._hold_for_storm(task, ev):
+            return
+
+        renamed = ev.event_type == EVENT_TYPE_MOVED
+        if task.config.coalesce_saves:
+            ev = self.coalescer.coalesce(ev, task)
+            if ev is None:
+                return
+
+        if EVENT_TYPE_CLOSED in task.config.events:
+            if renamed and not ev.is_directory and ev.event_type != EVENT_TYPE_MOVED:
+                # a file renamed into place by a save is already written
+                ev = FileClosedEvent(ev.src_path)
+            self.settle.submit(task, ev, self._delivers_closed(task, ev.src_path))
+        else:
+            self._filter_event(task, ev)
+
+    def _filter_event(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        graph = self.import_graphs.get(task)
+        if graph is not None:
+            related = graph.is_related(ev)
+            if task.config.auto_paths:
+                self._update_auto_watches(task)
+            if task.config.follow_imports and not related:
+                display_debug(f'{ev.src_path} is not imported by {task.name}, ignored')
+                return
+
+        if ev.event_type not in task.config.events:
+            return
+
+        if task.config.ignore_unchanged:
+            self.content_filter.submit(task, ev)
+        else:
+            self._accept_event(task, ev)
+
+    def _delivers_closed(self, task: ForemonTask, path: str) -> bool:
+        """
+        True if `closed` events of `path` are delivered by the observer, paths
+        which are polled only see the file change.
+        """
+        watches = self.watch_sets.get(task)
+        if watches is None or not getattr(watches.observer, 'close_events', False):
+            return False
+        polls = self.budget_polls.get(task)
+        if polls is None:
+            return True
+        dirname = op.dirname(path)
+        for root, recursive in polls.watches:
+            if dirname == root or (recursive and dirname.startswith(op.join(root, ''))):
+                return False
+        return True
+
+    def _accept_event(self, task: ForemonTask, ev: FileSystemEvent) -> None:
+        if self._hold_for_storm(task, ev) or self._hold_for_vcs(task, ev):
+            return
+        task.mark_triggered()
+        self.debounce.submit(task, ev)
 
     def reset(self):
-        self.observer.unschedule_all()
+        for observer in self.observers:
+            observer.unschedule_all()
         self.all_tasks.clear()
+        self.import_graphs.clear()
+        self.watch_sets.clear()
+        self.budget_polls.clear()
+        if self.budget is not None:
+            self.budget.planned.clear()
+        self.auto_versions.clear()
+        self.link_maps.clear()
+        self.file_lists.clear()
+        self.unlisted_events.clear()
+        self.run_snapshots.clear()
+        for guard in self.vcs_guards.values():
+            guard.cancel()
+        self.vcs_guards.clear()
+        self.vcs_held.clear()
+        self.settle.clear()
 
     def set_pipe(self, pipe: TextIO):
         # Pipe is usually only set None in testing due to a conflict with
@@ -123,14 +639,109 @@ class Monitor:
             self.loop.add_reader(self.pipe, self._repl)
 
     def queue_all_tasks(self):
-        for task in list(self.all_tasks):
+        for task in sorted(self.all_tasks, key=task_order):
             self.queue_task_event(task, None)
 
-    def queue_task_event(self, task: ForemonTask, ev: Optional[FileSystemEvent] = None) -> None:
+    def queue_changed_tasks(self):
+        """
+        Queue every task except those with `snapshot` whose files did not
+        change since foremon last stopped.
+        """
+        for task in sorted(self.all_tasks, key=task_order):
+            if task.config.snapshot and not task.force_run and not self._changed_offline(task):
+                display_success(
+                    f'no changes to {task.name} since foremon last stopped - skipped')
+                continue
+            self.queue_task_event(task, None)
+
+    def _watched_files(self, task: ForemonTask) -> Optional[Iterable[str]]:
+        files = self.file_lists.get(task)
+        if files is not None:
+            return files
+        graph = self.import_graphs.get(task)
+        if graph is not None and task.config.auto_paths:
+            return graph.closure
+        return None
+
+    def _changed_offline(self, task: ForemonTask) -> bool:
+        old = TreeSnapshot(task.config).load()
+        if old is None:
+            return True
+        new = take_snapshot(task.config, self._watched_files(task))
+        changed = diff_snapshots(old, new)
+        if changed:
+            display_info(
+                f'{len(changed)} files of {task.name} changed since foremon last stopped')
+            task.changes.update(ChangeSet(changed))
+            # the first run sees the tree as it was just read
+            self.run_snapshots[task] = new
+        return bool(changed)
+
+    async def _snapshot_run(self, task: ForemonTask, _) -> None:
+        """
+        Read the files of a task with `snapshot` as its run starts, the tree
+        the run saw is what a clean exit records.
+        """
+        if task not in self.run_snapshots:
+            self.run_snapshots[task] = await self.loop.run_in_executor(
+                None, take_snapshot, task.config, self._watched_files(task))
+
+    def _save_snapshot(self, task: ForemonTask, _) -> None:
+        """
+        Persist the snapshot of a run which exited cleanly. A crashed task
+        loses its snapshot so it runs on the next start, a terminated run
+        keeps the last one so the changes it was stopped for are not lost.
+        """
+        snapshot = self.run_snapshots.pop(task, None)
+        if task.clean_exit and snapshot is not None:
+            TreeSnapshot(task.config).save(snapshot)
+        elif task.crashed:
+            TreeSnapshot(task.config).remove()
+
+    def get_action(self, task: ForemonTask, path: str) -> Union[int, str]:
+        """
+        Returns the action of the first pattern in `config.actions` matching
+        `path`. Without a match the task is restarted.
+        """
+        case_sensitive = not task.config.ignore_case
+        for pattern, action in task.config.actions.items():
+            if match_any_paths([path], [pattern], case_sensitive=case_sensitive):
+                return action
+
+        return RESTART_ACTION
+
+    def get_actions(self, task: ForemonTask, paths: Iterable[str]) -> Set[Union[int, str]]:
+        """
+        Returns the actions for a batch of changed paths. The task is restarted
+        if any path needs a restart, or if there are no paths.
+        """
+        actions = set(self.get_action(task, path) for path in paths)
+        if not actions or RESTART_ACTION in actions:
+            return {RESTART_ACTION}
+        return actions
+
+    def queue_task_event(self, task: ForemonTask, ev: Optional[FileSystemEvent] = None,
+                         changes: Optional[ChangeSet] = None) -> None:
         if self.is_terminating or self.is_paused:
             return
 
+        if changes is not None:
+            task.changes.update(changes)
+        else:
+            task.changes.add_event(ev)
+
         if task.running:
+            actions = {RESTART_ACTION}
+            if task.config.actions and not task.changes.overflow:
+                actions = self.get_actions(task, task.changes)
+            if RESTART_ACTION not in actions:
+                for action in sorted(actions):
+                    display_info(
+                        f'sending {signal.Signals(action).name} to {task.name}')
+                    task.send_signal(action)
+                task.triggered_at = None
+                task.changes.clear()
+                return
             task.terminate()
 
         self.loop.call_soon_threadsafe(
@@ -143,20 +754,35 @@ class Monitor:
         if not self.observer.is_alive():
             return
 
-        if task.running or task in self.active_tasks:
+        if task not in self.all_tasks:
+            # removed by a reload after it was queued
             return
 
-        self.active_tasks.add(task)
-        try:
-            await task.run(trigger)
-        except Exception as e:
-            display_error(f'error from {task.name} task', e)
-        finally:
-            self.active_tasks.remove(task)
+        previous = self.active_runs.get(task)
+        if previous is not None:
+            # A terminated run may still be winding down
+            await asyncio.wait([previous])
+
+        run = task.start(trigger)
+        self.active_runs[task] = run
+
+        def done(fut: asyncio.Future):
+            if self.active_runs.get(task) is fut:
+                del self.active_runs[task]
+            if not fut.cancelled() and fut.exception():
+                display_error(f'error from {task.name} task', fut.exception())
+
+        run.add_done_callback(done)
+
+        # Unblocks the queue once the task is ready, tasks without a readiness
+        # check are ready when they finish.
+        await task.wait_ready()
 
     def restart_tasks(self):
         self.terminate_tasks()
         for task in list(self.all_tasks):
+            # a manual restart always runs the scripts
+            task.force_run = True
             self.loop.call_later(0.1, self.queue_task_event, task)
 
     @contextmanager
@@ -175,15 +801,18 @@ class Monitor:
             task.terminate()
 
     def clear(self):
-        self.observer.unschedule_all()
+        for observer in self.observers:
+            observer.unschedule_all()
         self.stop()
 
     def stop(self):
         self.is_terminating = True
         self.terminate_tasks()
-        self.observer.stop()
-        if self.observer.is_alive():
-            self.observer.join(self.stop_timeout)
+        self.content_filter.shutdown()
+        for observer in self.observers:
+            observer.stop()
+            if observer.is_alive():
+                observer.join(self.stop_timeout)
         self.is_terminating = False
 
     def start(self, run_on_start: bool = True) -> bool:
@@ -197,9 +826,10 @@ class Monitor:
             return False
 
         if run_on_start:
-            self.queue_all_tasks()
+            self.queue_changed_tasks()
 
-        self.observer.start()
+        for observer in self.observers:
+            observer.start()
         return True
 
     async def start_interactive(self, run_on_start: bool = True):
@@ -229,6 +859,11 @@ class Monitor:
 
         self.stop()
 
+        # Tasks released by a readiness check are still winding down
+        runs = list(self.active_runs.values())
+        if runs:
+            await asyncio.wait(runs, timeout=self.stop_timeout)
+
     def handle_input(self, line: str) -> None:
         restart = ['rs', 'restart']
         quit = ['\\q', 'quit', 'exit']
@@ -0,0 +1,482 @@
+import errno
+import os
+import select
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from watchdog.events import FileSystemEvent
+from watchdog.observers import Observer
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT, BaseObserver, ObservedWatch
+from watchdog.utils import BaseThread
+
+from .display import display_debug, display_warning
+from .scan import SCAN_WORKERS, PathFilter, walk_dirs_parallel
+from .settle import FileClosedEvent
+
+try:
+    from watchdog.observers.inotify import InotifyEmitter
+    from watchdog.observers.inotify_c import (WATCHDOG_ALL_EVENTS, Inotify, InotifyConstants,
+                                              InotifyEvent)
+except (ImportError, OSError):  # pragma: no cover
+    InotifyEmitter = None
+
+# Seconds an unpaired IN_MOVED_FROM waits for its IN_MOVED_TO
+MOVE_DELAY = 0.5
+
+# Queued to wake the dispatcher when stopping. The queue compares items with
+# the last one queued, so it must be a real event and watch.
+_WAKE = (FileSystemEvent(''), ObservedWatch('\0foremon-wake', False))
+
+# Called with a walked watch, its watches, those of each top level directory
+# and whether the watch limit was reached
+WalkCallback = Callable[[ObservedWatch, int, Dict[str, int], bool], None]
+
+
+class _WatchBuffer:
+    """
+    Stands in for the `InotifyBuffer` of an emitter, which is a thread of its
+    own. Events read by the multiplexer are held here until the emitter turns
+    them into watchdog events. Moves are paired like `InotifyBuffer` does.
+    """
+
+    inotify: 'Inotify'
+    events: Deque
+    # cookie -> (IN_MOVED_FROM event, deadline)
+    moves: Dict[int, Tuple['InotifyEvent', float]]
+
+    def __init__(self, inotify: 'Inotify'):
+        self.inotify = inotify
+        self.events = deque()
+        self.moves = {}
+
+    def put(self, events: List['InotifyEvent'], now: float) -> None:
+        for event in events:
+            if event.is_moved_from:
+                self.moves[event.cookie] = (event, now + MOVE_DELAY)
+            elif event.is_moved_to and event.cookie in self.moves:
+                self.events.append((self.moves.pop(event.cookie)[0], event))
+            else:
+                self.events.append(event)
+
+    def expire(self, now: float) -> Optional[float]:
+        """
+        Release unpaired moves past their deadline, returns the next deadline.
+        """
+        deadline = None
+        for cookie, (event, expires) in list(self.moves.items()):
+            if expires <= now:
+                del self.moves[cookie]
+                self.events.append(event)
+            elif deadline is None or expires < deadline:
+                deadline = expires
+        return deadline
+
+    def read_event(self):
+        return self.events.popleft() if self.events else None
+
+    def close(self) -> None:
+        self.inotify.close()
+
+
+if InotifyEmitter is not None:
+
+    class _RootInotify(Inotify):
+        """
+        Only watches the root of a recursive watch when created, the directories
+        below are added by a `TreeWalker`. Directories created later are still
+        watched as they appear.
+        """
+
+        def _add_dir_watch(self, path, recursive, mask):
+            if not os.path.isdir(path):
+                raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            self._add_watch(path, mask)
+
+    class MultiplexedEmitter(InotifyEmitter):
+        """
+        An inotify emitter without a thread. Starting the emitter registers its
+        inotify descriptor with the multiplexer, which reads its events and
+        has them converted on the multiplexer thread, and hands the tree below
+        a recursive watch to the walker.
+
+        With `close_events` files closed after writing are reported as
+        `closed` events.
+        """
+
+        path_filters: List[Optional[PathFilter]]
+        close_events: bool
+        # watches a walk of the tree may add, including the watch of the root
+        max_watches: Optional[int]
+
+        def __init__(self, event_queue, watch: ObservedWatch,
+                     timeout: float = DEFAULT_EMITTER_TIMEOUT,
+                     multiplexer: Optional['InotifyMultiplexer'] = None,
+                     walker: Optional['TreeWalker'] = None,
+                     path_filters: Optional[List[Optional[PathFilter]]] = None,
+                     close_events: bool = False,
+                     max_watches: Optional[int] = None):
+            super().__init__(event_queue, watch, timeout)
+            self.multiplexer = multiplexer
+            self.walker = walker
+            self.path_filters = path_filters if path_filters is not None else []
+            self.close_events = close_events
+            self.max_watches = max_watches
+
+        def start(self) -> None:
+            path = os.fsencode(self.watch.path)
+            mask = WATCHDOG_ALL_EVENTS
+            if self.close_events:
+                mask |= InotifyConstants.IN_CLOSE_WRITE
+            self._inotify = _WatchBuffer(_RootInotify(path, self.watch.is_recursive, mask))
+            self.multiplexer.register(self)
+            if self.watch.is_recursive and os.path.isdir(path):
+                self.walker.walk(self)
+
+        def prune(self, path: str) -> bool:
+            filters = self.path_filters
+            return bool(filters) and all(f is not None and f.prune(path) for f in filters)
+
+        def add_watch(self, path: str) -> None:
+            buffer = self._inotify
+            if buffer is not None:
+                buffer.inotify.add_watch(os.fsencode(path))
+
+        def on_thread_stop(self) -> None:
+            if self._inotify is not None:
+                self.multiplexer.unregister(self)
+                buffer, self._inotify = self._inotify, None
+                buffer.close()
+
+        def join(self, timeout: Optional[float] = None) -> None:
+            pass
+
+        def is_alive(self) -> bool:
+            return self._inotify is not None and not self.stopped_event.is_set()
+
+        @property
+        def fd(self) -> int:
+            return self._inotify.inotify.fd
+
+        def queue_events(self, timeout, full_events=False):
+            buffer = self._inotify
+            event = buffer.events[0] if buffer.events else None
+            # InotifyEmitter reads close events without queueing anything
+            if isinstance(event, InotifyEvent) and event.is_close_write:
+                buffer.events.popleft()
+                if not event.is_directory:
+                    self.queue_event(FileClosedEvent(self._decode_path(event.src_path)))
+                return
+            super().queue_events(timeout, full_events)
+
+        def read(self, now: float) -> None:
+            buffer = self._inotify
+            buffer.put(buffer.inotify.read_events(), now)
+
+        def flush(self, now: float) -> Optional[float]:
+            """
+            Queue the buffered events, returns the deadline of unpaired moves.
+            """
+            buffer = self._inotify
+            deadline = buffer.expire(now)
+            # the emitter stops itself when its path is deleted
+            while buffer.events and self.is_alive():
+                self.queue_events(0)
+            return deadline
+
+
+class InotifyMultiplexer(BaseThread):
+    """
+    Waits on the inotify descriptors of every emitter with one `epoll` and
+    converts their events on this thread, instead of two threads per watch.
+    Without pending moves the thread sleeps until an event arrives.
+    """
+
+    _emitters: Dict[int, 'MultiplexedEmitter']
+
+    def __init__(self):
+        super().__init__()
+        self.name = 'foremon-inotify'
+        self._epoll = select.epoll()
+        self._emitters = {}
+        # held while events are read, so emitters are not closed meanwhile
+        self._lock = threading.RLock()
+        self._wake_r, self._wake_w = os.pipe()
+        self._epoll.register(self._wake_r, select.EPOLLIN)
+
+    def __len__(self) -> int:
+        return len(self._emitters)
+
+    def register(self, emitter: 'MultiplexedEmitter') -> None:
+        with self._lock:
+            self._emitters[emitter.fd] = emitter
+            self._epoll.register(emitter.fd, select.EPOLLIN)
+
+    def unregister(self, emitter: 'MultiplexedEmitter') -> None:
+        with self._lock:
+            if self._emitters.get(emitter.fd) is emitter:
+                del self._emitters[emitter.fd]
+                self._epoll.unregister(emitter.fd)
+
+    def wake(self) -> None:
+        os.write(self._wake_w, b'\0')
+
+    def on_thread_stop(self) -> None:
+        if self.is_alive():
+            self.wake()
+        else:
+            self._close()
+
+    def _close(self) -> None:
+        if self._epoll.closed:
+            return
+        self._epoll.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def run(self) -> None:
+        timeout = -1
+        while self.should_keep_running():
+            ready = self._epoll.poll(timeout)
+            now = time.monotonic()
+            deadline = None
+            with self._lock:
+                for fd, _ in ready:
+                    if fd == self._wake_r:
+                        os.read(self._wake_r, 512)
+                        continue
+                    emitter = self._emitters.get(fd)
+                    if emitter is not None:
+                        emitter.read(now)
+
+                for emitter in list(self._emitters.values()):
+                    if not emitter.is_alive():
+                        continue
+                    expires = emitter.flush(now)
+                    if expires is not None and (deadline is None or expires < deadline):
+                        deadline = expires
+            timeout = -1 if deadline is None else max(0.0, deadline - time.monotonic())
+
+        self._close()
+
+
+class TreeWalker:
+    """
+    Watches the directories below recursive watches on a pool of threads,
+    pruning directories every handler of a watch ignores. Walks run on a
+    thread started on demand which exits once no walks are pending, so
+    starting an observer does not wait for large trees and events are
+    delivered for a directory as soon as it is watched.
+
+    Once a tree is walked `on_walked` is called on the walk thread. A tree is
+    still counted to its end after the watch limit or the `max_watches` of its
+    emitter was reached, so the watches it needs are known.
+    """
+
+    workers: int
+    on_walked: Optional[WalkCallback]
+    _pending: Deque['MultiplexedEmitter']
+    _thread: Optional[threading.Thread]
+
+    def __init__(self, workers: int = SCAN_WORKERS,
+                 on_walked: Optional[WalkCallback] = None):
+        self.workers = workers
+        self.on_walked = on_walked
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def walk(self, emitter: 'MultiplexedEmitter') -> None:
+        with self._cond:
+            self._pending.append(emitter)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='foremon-walk', daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every pending walk finished, returns False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._thread is None, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+                emitter = self._pending.popleft()
+            if emitter.is_alive():
+                self._walk(emitter)
+
+    def _walk(self, emitter: 'MultiplexedEmitter') -> None:
+        root = emitter.watch.path
+        started = time.monotonic()
+        count = 0
+        full = False
+        limit = emitter.max_watches
+        children: Dict[str, int] = {}
+        prefix = len(root.rstrip(os.sep)) + 1
+        for path in walk_dirs_parallel(root, emitter.prune, self.workers):
+            if not emitter.is_alive():
+                return
+            child = os.path.join(root, path[prefix:].split(os.sep, 1)[0])
+            children[child] = children.get(child, 0) + 1
+            if full:
+                continue
+            if limit is not None and count + 1 >= limit:
+                display_warning(
+                    f'{root} needs more than the {limit} inotify watches left for it,'
+                    f' only partly watched')
+                full = True
+                continue
+            try:
+                emitter.add_watch(path)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    display_warning(
+                        f'inotify watch limit reached, {root} is only partly watched')
+                    full = True
+                # removed during the walk
+                continue
+            count += 1
+        elapsed = time.monotonic() - started
+        display_debug(
+            f'watched {count} directories below {root} in {elapsed:.3f}s'
+            f' ({count / max(elapsed, 1e-6):.0f} dirs/s)')
+        if self.on_walked is not None:
+            self.on_walked(emitter.watch, sum(children.values()) + 1, children, full)
+
+
+class MultiplexedObserver(BaseObserver):
+    """
+    Inotify observer whose watches share one emitter thread, so the number of
+    threads does not grow with the number of scheduled paths.
+
+    Without a `timeout` the observer blocks on its queue until an event
+    arrives and is woken explicitly to stop, so an idle observer never wakes.
+
+    Each watch may have filters used to prune ignored directories when its
+    tree is walked, a watch shared by handlers only prunes directories every
+    handler ignores.
+
+    With `close_events` handlers also receive `closed` events, which the
+    handlers of watchdog do not know. `on_walked` is passed to the
+    `TreeWalker`.
+    """
+
+    multiplexer: InotifyMultiplexer
+    walker: TreeWalker
+    close_events: bool
+    _filters: Dict[ObservedWatch, List[Optional[PathFilter]]]
+    _limits: Dict[ObservedWatch, int]
+
+    def __init__(self, timeout: Optional[float] = None, workers: int = SCAN_WORKERS,
+                 close_events: bool = False,
+                 on_walked: Optional[WalkCallback] = None):
+        super().__init__(emitter_class=self._make_emitter, timeout=timeout)
+        self.multiplexer = InotifyMultiplexer()
+        self.walker = TreeWalker(workers, on_walked)
+        self.close_events = close_events
+        self._filters = {}
+        self._limits = {}
+
+    def _make_emitter(self, event_queue, watch: ObservedWatch, timeout: float) -> 'MultiplexedEmitter':
+        return MultiplexedEmitter(event_queue, watch, timeout,
+                                  multiplexer=self.multiplexer,
+                                  walker=self.walker,
+                                  path_filters=self._filters.setdefault(watch, []),
+                                  close_events=self.close_events,
+                                  max_watches=self._limits.get(watch))
+
+    def schedule(self, event_handler, path: str, recursive: bool = False,
+                 path_filter: Optional[PathFilter] = None) -> ObservedWatch:
+        with self._lock:
+            watch = ObservedWatch(path, recursive)
+            self._filters.setdefault(watch, []).append(path_filter)
+            # the new handler may need directories the others ignore
+            self.rewalk(watch)
+            return super().schedule(event_handler, path, recursive)
+
+    def rewalk(self, watch: ObservedWatch) -> None:
+        """
+        Walk the tree of a recursive watch again after its filters changed,
+        so directories they no longer prune are watched.
+        """
+        with self._lock:
+            emitter = self._emitter_for_watch.get(watch)
+            if emitter is not None and emitter.is_alive() and watch.is_recursive:
+                self.walker.walk(emitter)
+
+    def limit_watches(self, path: str, limit: Optional[int]) -> None:
+        """
+        Stop walks of the recursive watch of `path` once the tree takes `limit`
+        watches, as if the kernel ran out of them. None removes the limit.
+        """
+        watch = ObservedWatch(path, True)
+        with self._lock:
+            if limit is None:
+                self._limits.pop(watch, None)
+            else:
+                self._limits[watch] = limit
+            emitter = self._emitter_for_watch.get(watch)
+            if emitter is not None:
+                emitter.max_watches = limit
+
+    def unschedule(self, watch: ObservedWatch) -> None:
+        with self._lock:
+            super().unschedule(watch)
+            self._filters.pop(watch, None)
+            self._limits.pop(watch, None)
+
+    def unschedule_all(self) -> None:
+        with self._lock:
+            super().unschedule_all()
+            self._filters.clear()
+            self._limits.clear()
+
+    def start(self) -> None:
+        self.multiplexer.start()
+        super().start()
+
+    def dispatch_events(self, event_queue, *args) -> None:
+        # later versions of watchdog do not pass a timeout
+        item = event_queue.get(block=True, timeout=args[0] if args else None)
+        try:
+            # a wake up, or the stop marker of later versions of watchdog
+            if item is _WAKE or not isinstance(item, tuple):
+                return
+            event, watch = item
+            with self._lock:
+                # handlers may be removed by the handlers dispatched before them
+                for handler in list(self._handlers.get(watch, [])):
+                    if handler in self._handlers.get(watch, []):
+                        handler.dispatch(event)
+        finally:
+            event_queue.task_done()
+
+    def on_thread_stop(self) -> None:
+        super().on_thread_stop()
+        self.multiplexer.stop()
+        if self.multiplexer.is_alive():
+            self.multiplexer.join()
+        self.event_queue.put(_WAKE)
+
+
+def make_observer(close_events: bool = False,
+                  on_walked: Optional[WalkCallback] = None) -> BaseObserver:
+    """
+    Returns the multiplexed observer where inotify is available and the native
+    observer of watchdog otherwise, which does not deliver `closed` events and
+    walks trees itself.
+    """
+    if InotifyEmitter is None:
+        return Observer()
+    return MultiplexedObserver(close_events=close_events, on_walked=on_walked)
+
+
+__all__ = ['InotifyMultiplexer', 'MultiplexedObserver', 'TreeWalker', 'make_observer']
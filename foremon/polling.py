@@ -0,0 +1,267 @@
+import os
+import os.path as op
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from watchdog.events import (DirCreatedEvent, DirDeletedEvent, FileCreatedEvent,
+                             FileDeletedEvent, FileModifiedEvent, FileMovedEvent,
+                             FileSystemEvent)
+from watchdog.observers.api import (DEFAULT_EMITTER_TIMEOUT, DEFAULT_OBSERVER_TIMEOUT,
+                                    BaseObserver, EventEmitter, ObservedWatch)
+
+from .display import display_debug
+from .scan import PathFilter
+
+# Seconds between scans of the same file
+POLL_INTERVAL = 1.0
+# Number of steps each scan is spread over
+POLL_SHARDS = 8
+# Report scan statistics after this many scans
+REPORT_EVERY = 300
+
+# (inode, size, mtime_ns)
+StatKey = Tuple[int, int, int]
+
+
+class ShardedPollingEmitter(EventEmitter):
+    """
+    Detects changes by comparing an index of `(inode, size, mtime)` per file
+    to the tree. Each scan is spread over the poll interval in `shards` steps
+    of a few directories so large trees do not cause a burst of I/O once per
+    interval. Directories the filters prune are never entered.
+
+    Files which are removed and re-added with the same inode during one step
+    are reported as moved.
+    """
+
+    interval: float
+    shards: int
+    path_filters: List[Optional[PathFilter]]
+    # directory -> file name -> stat key
+    files: Dict[str, Dict[str, StatKey]]
+    # directory -> sub directories
+    subdirs: Dict[str, Set[str]]
+    scan_count: int
+    scan_time: float
+    scan_files: int
+
+    def __init__(self, event_queue, watch: ObservedWatch, timeout: float = DEFAULT_EMITTER_TIMEOUT,
+                 interval: float = POLL_INTERVAL, shards: int = POLL_SHARDS,
+                 path_filters: Optional[List[Optional[PathFilter]]] = None):
+        super().__init__(event_queue, watch, timeout)
+        self.interval = interval
+        self.shards = max(1, shards)
+        self.path_filters = path_filters if path_filters is not None else []
+        self.files = {}
+        self.subdirs = {}
+        self.scan_count = 0
+        self.scan_time = 0.0
+        self.scan_files = 0
+        self._indexed = False
+
+        path = op.abspath(watch.path)
+        # A single watched file is polled through its directory
+        self.only_name = None
+        if not op.isdir(path):
+            self.only_name = op.basename(path)
+            path = op.dirname(path)
+        self.root = path
+
+    def prune(self, path: str) -> bool:
+        filters = self.path_filters
+        return bool(filters) and all(f is not None and f.prune(path) for f in filters)
+
+    @property
+    def file_count(self) -> int:
+        return sum(len(f) for f in self.files.values())
+
+    def _scan_dir(self, top: str, changes: List[Tuple[str, str, StatKey]],
+                  pending: List[str]) -> int:
+        """
+        Compare one directory to the index. Changes are appended to `changes`
+        and new sub directories to `pending`. Returns the number of files seen.
+        """
+        try:
+            entries = list(os.scandir(top))
+        except OSError:
+            self._remove_dir(top, changes)
+            return 0
+
+        new: Dict[str, StatKey] = {}
+        dirs: Set[str] = set()
+        for entry in entries:
+            if self.only_name is not None and entry.name != self.only_name:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.watch.is_recursive and not self.prune(entry.path):
+                        dirs.add(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            new[entry.name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+        old = self.files.get(top, {})
+        for name, key in new.items():
+            prev = old.get(name)
+            if prev is None:
+                changes.append(('created', op.join(top, name), key))
+            elif prev != key:
+                changes.append(('modified', op.join(top, name), key))
+        for name, key in old.items():
+            if name not in new:
+                changes.append(('deleted', op.join(top, name), key))
+        self.files[top] = new
+
+        old_dirs = self.subdirs.get(top, set())
+        for path in old_dirs - dirs:
+            self._remove_dir(path, changes)
+        for path in dirs - old_dirs:
+            changes.append(('dir_created', path, (0, 0, 0)))
+            self.files.setdefault(path, {})
+            pending.append(path)
+        self.subdirs[top] = dirs
+
+        return len(new)
+
+    def _remove_dir(self, top: str, changes: List[Tuple[str, str, StatKey]]) -> None:
+        for name, key in self.files.pop(top, {}).items():
+            changes.append(('deleted', op.join(top, name), key))
+        for path in self.subdirs.pop(top, set()):
+            self._remove_dir(path, changes)
+        if top != self.root:
+            changes.append(('dir_deleted', top, (0, 0, 0)))
+
+    def _scan(self, dirs: List[str], changes: Optional[List] = None) -> int:
+        """
+        Scan `dirs` and any new directories found below them.
+        """
+        if changes is None:
+            changes = []
+        pending = list(dirs)
+        count = 0
+        while pending:
+            top = pending.pop()
+            if top != self.root and top not in self.files:
+                # removed along with a parent earlier in the scan
+                continue
+            count += self._scan_dir(top, changes, pending)
+        return count
+
+    def index(self) -> None:
+        """
+        Build the index without reporting changes.
+        """
+        started = time.monotonic()
+        self._indexed = True
+        self.files[self.root] = {}
+        count = self._scan([self.root])
+        elapsed = time.monotonic() - started
+        display_debug(
+            f'indexed {count} files in {self.root} in {elapsed:.3f}s'
+            f' ({count / max(elapsed, 1e-6):.0f} files/s)')
+
+    def _queue_changes(self, changes: List[Tuple[str, str, StatKey]]) -> None:
+        deleted: Dict[int, str] = {}
+        for kind, path, key in changes:
+            if kind == 'deleted':
+                deleted[key[0]] = path
+
+        for kind, path, key in changes:
+            event: Optional[FileSystemEvent] = None
+            if kind == 'created':
+                src = deleted.pop(key[0], None)
+                event = FileMovedEvent(src, path) if src else FileCreatedEvent(path)
+            elif kind == 'modified':
+                event = FileModifiedEvent(path)
+            elif kind == 'dir_created':
+                event = DirCreatedEvent(path)
+            elif kind == 'dir_deleted':
+                event = DirDeletedEvent(path)
+            if event is not None:
+                self.queue_event(event)
+
+        for path in deleted.values():
+            self.queue_event(FileDeletedEvent(path))
+
+    def queue_events(self, timeout: float) -> None:
+        if not self._indexed:
+            self.index()
+
+        # Each directory is scanned once per interval, a step at a time
+        dirs = sorted(set(self.files) | {self.root})
+        size = -(-len(dirs) // self.shards)
+        step = self.interval / self.shards
+        scan_time = 0.0
+        scan_files = 0
+        for i in range(self.shards):
+            if self.stopped_event.wait(step):
+                return
+            started = time.monotonic()
+            changes = []
+            scan_files += self._scan(dirs[i * size:(i + 1) * size], changes)
+            self._queue_changes(changes)
+            scan_time += time.monotonic() - started
+
+        self.scan_count += 1
+        self.scan_time = scan_time
+        self.scan_files = scan_files
+        if self.scan_count % REPORT_EVERY == 0:
+            display_debug(
+                f'scanned {scan_files} files in {self.root} in {scan_time:.3f}s'
+                f' ({scan_files / max(scan_time, 1e-6):.0f} files/s)')
+
+
+class ShardedPollingObserver(BaseObserver):
+    """
+    Observer for file systems which do not deliver native events, like network
+    mounts. Each watch may have its own poll interval and filters used to prune
+    ignored directories, a watch shared by handlers only prunes directories
+    every handler ignores.
+    """
+
+    interval: float
+    shards: int
+    _options: Dict[ObservedWatch, Dict]
+
+    def __init__(self, interval: float = POLL_INTERVAL, shards: int = POLL_SHARDS,
+                 timeout: float = DEFAULT_OBSERVER_TIMEOUT):
+        super().__init__(emitter_class=self._make_emitter, timeout=timeout)
+        self.interval = interval
+        self.shards = shards
+        self._options = {}
+
+    def _make_emitter(self, event_queue, watch: ObservedWatch, timeout: float) -> ShardedPollingEmitter:
+        options = self._options.get(watch, {})
+        return ShardedPollingEmitter(
+            event_queue, watch, timeout,
+            interval=options.get('interval') or self.interval,
+            shards=self.shards,
+            path_filters=options.setdefault('path_filters', []))
+
+    def schedule(self, event_handler, path: str, recursive: bool = False,
+                 path_filter: Optional[PathFilter] = None,
+                 interval: Optional[float] = None) -> ObservedWatch:
+        with self._lock:
+            watch = ObservedWatch(path, recursive)
+            options = self._options.setdefault(watch, {'path_filters': []})
+            options.setdefault('interval', interval)
+            options['path_filters'].append(path_filter)
+            return super().schedule(event_handler, path, recursive)
+
+    def unschedule(self, watch: ObservedWatch) -> None:
+        with self._lock:
+            super().unschedule(watch)
+            self._options.pop(watch, None)
+
+    def unschedule_all(self) -> None:
+        with self._lock:
+            super().unschedule_all()
+            self._options.clear()
+
+    def emitter_for(self, watch: ObservedWatch) -> Optional[ShardedPollingEmitter]:
+        return self._emitter_for_watch.get(watch)
+
+
+__all__ = ['ShardedPollingEmitter', 'ShardedPollingObserver']
@@ -0,0 +1,136 @@
+import asyncio
+import re
+import time
+from asyncio.base_events import BaseEventLoop
+from typing import Optional, Pattern
+from urllib.parse import urlsplit
+
+from .config import ForemonConfig
+
+# Delay between attempts to connect to a port or url
+PROBE_INTERVAL = 0.05
+# Limit for a single connection attempt
+CONNECT_TIMEOUT = 1.0
+
+
+async def probe_port(port: int, host: str = '127.0.0.1') -> bool:
+    """
+    Returns true if a TCP connection to `host:port` can be opened.
+    """
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def probe_url(url: str) -> bool:
+    """
+    Returns true if a `GET` request to `url` responds with status 200.
+    """
+    parts = urlsplit(url)
+    use_ssl = parts.scheme == 'https'
+    host = parts.hostname or '127.0.0.1'
+    port = parts.port or (443 if use_ssl else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=use_ssl or None),
+            CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n\r\n'.encode())
+        line = await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+    status = line.split()
+    return len(status) > 1 and status[1] == b'200'
+
+
+class ReadyProbe:
+    """
+    Decides when a running script is ready. Every configured check must pass:
+    a line of output matching `ready_pattern`, `ready_port` accepting
+    connections and `ready_url` responding with a 200.
+    """
+
+    port: Optional[int]
+    url: Optional[str]
+    pattern: Optional[Pattern]
+    timeout: float
+    _matched: asyncio.Future
+
+    def __init__(self, config: ForemonConfig, loop: Optional[BaseEventLoop] = None):
+        loop = loop or asyncio.get_event_loop()
+        self.port = config.ready_port
+        self.url = config.ready_url
+        self.pattern = None
+        self.timeout = config.ready_timeout
+        self._matched = loop.create_future()
+
+        if config.ready_pattern:
+            self.pattern = re.compile(config.ready_pattern)
+        else:
+            self._matched.set_result(True)
+
+    @classmethod
+    def from_config(cls, config: ForemonConfig,
+                    loop: Optional[BaseEventLoop] = None) -> Optional['ReadyProbe']:
+        """
+        Returns a probe or None if the config does not define any checks.
+        """
+        if config.ready_port or config.ready_url or config.ready_pattern:
+            return cls(config, loop)
+        return None
+
+    @property
+    def wants_output(self) -> bool:
+        return self.pattern is not None
+
+    def feed(self, line: str) -> None:
+        """
+        Match a line of script output against the `ready_pattern`.
+        """
+        if self._matched.done():
+            return
+        if self.pattern.search(line):
+            self._matched.set_result(True)
+
+    async def _check_sockets(self) -> bool:
+        if self.port and not await probe_port(self.port):
+            return False
+        if self.url and not await probe_url(self.url):
+            return False
+        return True
+
+    async def wait(self) -> bool:
+        """
+        Blocks until all checks pass and returns True, or False if the checks
+        did not pass within `timeout` seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(self._matched), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        while not await self._check_sockets():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(PROBE_INTERVAL)
+
+        return True
+
+
+__all__ = ['ReadyProbe', 'probe_port', 'probe_url']
@@ -0,0 +1,222 @@
+import asyncio
+import ctypes
+import os
+import signal
+import sys
+from itertools import count
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Union
+
+IS_LINUX = sys.platform.startswith('linux')
+PR_SET_CHILD_SUBREAPER = 36
+# Seconds leaked processes have to exit before they are killed
+KILL_GRACE = 0.5
+KILL_POLL = 0.05
+
+# Pids of scripts which have been spawned and not yet waited on
+SCRIPT_PIDS: Set[int] = set()
+
+# Environment variable marking the descendants of runs which clean up orphans
+CLEANUP_ENV = 'FOREMON_CLEANUP'
+
+_is_subreaper: Optional[bool] = None
+_markers = count(1)
+# True once a run marked its descendants for cleanup
+_marked = False
+
+
+class ProcStat(NamedTuple):
+    pid: int
+    ppid: int
+    sid: int
+    state: str
+
+
+def set_subreaper() -> bool:
+    """
+    Make foremon the subreaper of its descendants so processes which daemonize
+    are re-parented to foremon instead of init. Returns True if foremon is a
+    subreaper, only Linux is supported.
+    """
+    global _is_subreaper
+    if _is_subreaper is None:
+        _is_subreaper = False
+        if IS_LINUX:
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                _is_subreaper = libc.prctl(
+                    PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+            except (OSError, AttributeError):
+                pass
+    return _is_subreaper
+
+
+def is_subreaper() -> bool:
+    return bool(_is_subreaper)
+
+
+def new_marker() -> str:
+    """
+    Returns a value for `CLEANUP_ENV` unique to one run of a task.
+    """
+    global _marked
+    _marked = True
+    return f'{os.getpid()}-{next(_markers)}'
+
+
+def read_marker(pid: int) -> Optional[str]:
+    """
+    The `CLEANUP_ENV` a process was started with, None if it has none or its
+    environment can not be read.
+    """
+    try:
+        with open(f'/proc/{pid}/environ', 'rb') as fd:
+            data = fd.read()
+    except OSError:
+        return None
+    prefix = f'{CLEANUP_ENV}='.encode()
+    for entry in data.split(b'\0'):
+        if entry.startswith(prefix):
+            return entry[len(prefix):].decode(errors='replace')
+    return None
+
+
+def read_stat(pid: int) -> Optional[ProcStat]:
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as fd:
+            data = fd.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parenthesis
+    fields = data[data.rindex(b')') + 2:].split()
+    return ProcStat(pid, int(fields[1]), int(fields[3]), fields[0].decode())
+
+
+def process_table() -> Dict[int, ProcStat]:
+    table = {}
+    if not IS_LINUX:
+        return table
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        stat = read_stat(int(name))
+        if stat is not None:
+            table[stat.pid] = stat
+    return table
+
+
+def find_leaked(sessions: Iterable[int], marker: Union[str, bool, None] = None,
+                table: Optional[Dict[int, ProcStat]] = None) -> List[int]:
+    """
+    Returns live processes left behind by scripts which have exited. Processes
+    still in the session of one of the `sessions` belong to those scripts.
+    Orphans re-parented to foremon which left the session are only claimed
+    when they inherited `marker` in their environment, with `marker` True any
+    marker of this foremon is claimed.
+    """
+    if table is None:
+        table = process_table()
+
+    me = os.getpid()
+    sessions = set(sessions)
+    roots: Set[int] = set()
+
+    def is_marked(pid: int) -> bool:
+        found = read_marker(pid)
+        if found is None:
+            return False
+        if marker is True:
+            return found.startswith(f'{me}-')
+        return found == marker
+
+    for stat in table.values():
+        if stat.pid == me or stat.pid in SCRIPT_PIDS or stat.state == 'Z':
+            continue
+        if stat.sid in sessions:
+            roots.add(stat.pid)
+        elif marker and stat.ppid == me and is_marked(stat.pid):
+            roots.add(stat.pid)
+
+    children: Dict[int, List[int]] = {}
+    for stat in table.values():
+        children.setdefault(stat.ppid, []).append(stat.pid)
+
+    leaked: List[int] = []
+    seen: Set[int] = set()
+    pending = sorted(roots)
+    while pending:
+        pid = pending.pop(0)
+        if pid in seen:
+            continue
+        seen.add(pid)
+        if table[pid].state != 'Z':
+            leaked.append(pid)
+        pending.extend(children.get(pid, []))
+
+    return leaked
+
+
+def reap_zombies() -> int:
+    """
+    Wait on re-parented children which have exited. Returns the number reaped.
+    """
+    me = os.getpid()
+    count = 0
+    for stat in process_table().values():
+        if stat.ppid != me or stat.state != 'Z' or stat.pid in SCRIPT_PIDS:
+            continue
+        try:
+            os.waitpid(stat.pid, os.WNOHANG)
+            count += 1
+        except ChildProcessError:
+            pass
+    return count
+
+
+def _is_alive(pid: int) -> bool:
+    stat = read_stat(pid)
+    return stat is not None and stat.state != 'Z'
+
+
+def _kill(pids: Iterable[int], sig: int) -> None:
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+async def kill_leaked(pids: List[int], sig: int = signal.SIGTERM) -> int:
+    """
+    Send `sig` to each process, then SIGKILL those which are still alive after
+    a grace period. Returns the number of processes which were signaled.
+    """
+    live = [pid for pid in pids if _is_alive(pid)]
+    _kill(live, sig)
+
+    waited = 0.0
+    remaining = live
+    while remaining and waited < KILL_GRACE:
+        await asyncio.sleep(KILL_POLL)
+        waited += KILL_POLL
+        remaining = [pid for pid in remaining if _is_alive(pid)]
+
+    _kill(remaining, signal.SIGKILL)
+    reap_zombies()
+    return len(live)
+
+
+def kill_all_leaked() -> int:
+    """
+    Kill every orphan re-parented to foremon from a run which cleans up its
+    orphans, used when foremon exits.
+    """
+    if not _marked or not is_subreaper():
+        return 0
+    leaked = find_leaked([], marker=True)
+    _kill(leaked, signal.SIGKILL)
+    reap_zombies()
+    return len(leaked)
+
+
+__all__ = ['CLEANUP_ENV', 'SCRIPT_PIDS', 'find_leaked', 'is_subreaper', 'kill_all_leaked',
+           'kill_leaked', 'new_marker', 'read_marker', 'reap_zombies', 'set_subreaper']
@@ -0,0 +1,325 @@
+import fnmatch
+import os
+import os.path as op
+import re
+import stat
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Set, Tuple, TypeVar
+
+from .config import ForemonConfig
+from .gitignore import VcsIgnore
+
+T = TypeVar('T')
+
+# Threads used to walk large trees, scandir and stat release the GIL
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Directories one task of a parallel walk scans before handing the rest back
+WALK_BATCH = 64
+
+# A file name no sane ignore pattern matches except a wildcard. A directory is
+# pruned when this name inside of it would be ignored, like with `build/*`.
+PRUNE_SENTINEL = '\x00\x01'
+
+
+class Glob:
+    """
+    A compiled glob pattern matched against the trailing components of a path,
+    the same as `PurePath.match` which watchdog uses to filter events.
+    """
+
+    anchored: bool
+    parts: List[Pattern]
+
+    def __init__(self, pattern: str, case_sensitive: bool = True):
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.anchored = pattern.startswith('/')
+        self.parts = [re.compile(fnmatch.translate(part), flags)
+                      for part in pattern.split('/') if part]
+
+    def match(self, parts: List[str]) -> bool:
+        n = len(self.parts)
+        if len(parts) < n or (self.anchored and len(parts) != n):
+            return False
+        return all(r.match(p) for r, p in zip(self.parts, parts[len(parts) - n:]))
+
+
+class GlobSet:
+    """
+    Globs matched together like a list of `Glob`. The globs with the same
+    number of parts are one regular expression over those trailing components
+    joined by NUL. Paths have no NUL of their own, so each part still matches
+    exactly one component.
+    """
+
+    # (parts, anchored, expression)
+    groups: List[Tuple[int, bool, Pattern]]
+
+    def __init__(self, patterns: List[str], case_sensitive: bool = True):
+        flags = 0 if case_sensitive else re.IGNORECASE
+        grouped: Dict[Tuple[int, bool], List[str]] = {}
+        for pattern in patterns:
+            parts = [_translate(part) for part in pattern.split('/') if part]
+            key = (len(parts), pattern.startswith('/'))
+            grouped.setdefault(key, []).append('\0'.join(parts))
+        self.groups = [(n, anchored, re.compile(f'(?:{"|".join(regexes)})\\Z', flags))
+                       for (n, anchored), regexes in grouped.items()]
+
+    def match(self, parts: List[str]) -> bool:
+        for n, anchored, regex in self.groups:
+            if len(parts) < n or (anchored and len(parts) != n):
+                continue
+            if regex.match('\0'.join(parts[len(parts) - n:])):
+                return True
+        return False
+
+
+def _translate(part: str) -> str:
+    # fnmatch anchors the expression at the end, the parts are joined first
+    regex = fnmatch.translate(part)
+    return regex[:-2] if regex.endswith('\\Z') else regex
+
+
+def split_path(path: str) -> List[str]:
+    return [p for p in path.split(op.sep) if p]
+
+
+class PathFilter:
+    """
+    Matches paths against the `patterns` and ignore lists of a config, and the
+    ignore files of git with `vcs_ignore`.
+    """
+
+    patterns: GlobSet
+    ignores: GlobSet
+    vcs_ignore: Optional[VcsIgnore]
+
+    def __init__(self, patterns: List[str], ignores: List[str], case_sensitive: bool = True,
+                 vcs_ignore: Optional[VcsIgnore] = None):
+        self.patterns = GlobSet(patterns, case_sensitive)
+        self.ignores = GlobSet(ignores, case_sensitive)
+        self.vcs_ignore = vcs_ignore or None
+
+    @classmethod
+    def from_config(cls, config: ForemonConfig) -> 'PathFilter':
+        vcs_ignore = None
+        if config.ignore_vcs:
+            vcs_ignore = VcsIgnore.from_paths(config.paths)
+        return cls(config.patterns,
+                   config.ignore_defaults + config.ignore,
+                   not config.ignore_case,
+                   vcs_ignore)
+
+    def is_ignored(self, path: str) -> bool:
+        parts = split_path(path)
+        return self.ignores.match(parts)
+
+    def match(self, path: str) -> bool:
+        parts = split_path(path)
+        return (self.patterns.match(parts)
+                and not self.ignores.match(parts)
+                and not (self.vcs_ignore is not None and self.vcs_ignore.is_ignored(path)))
+
+    def prune(self, path: str) -> bool:
+        """
+        Returns True if nothing below the directory `path` can match.
+        """
+        return (self.is_ignored(path) or self.is_ignored(op.join(path, PRUNE_SENTINEL))
+                or (self.vcs_ignore is not None and self.vcs_ignore.is_ignored(path, True)))
+
+
+def _scan_one(top: str, match: Callable[[str], bool], prune: Callable[[str], bool],
+              recursive: bool) -> Tuple[List[Tuple[str, os.stat_result]], List[str]]:
+    files = []
+    dirs = []
+    try:
+        entries = list(os.scandir(top))
+    except OSError:
+        return files, dirs
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not prune(entry.path):
+                    dirs.append(entry.path)
+                continue
+            if match(entry.path):
+                st = entry.stat()
+                # links to directories are left to the link map
+                if not stat.S_ISDIR(st.st_mode):
+                    files.append((entry.path, st))
+        except OSError:
+            continue
+    return files, dirs
+
+
+def _scan_tree(path: str, match: Callable[[str], bool], prune: Callable[[str], bool],
+               recursive: bool, workers: Optional[int]) -> Iterator[Tuple[str, os.stat_result]]:
+    if workers and workers > 1:
+        def scan(top: str):
+            return _scan_one(top, match, prune, recursive)
+        yield from _walk_parallel(path, scan, workers)
+        return
+
+    pending = [path]
+    while pending:
+        files, dirs = _scan_one(pending.pop(), match, prune, recursive)
+        pending.extend(dirs)
+        yield from files
+
+
+def scan_dir(path: str, path_filter: PathFilter, recursive: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Yields `(path, stat)` for each matching file below `path`. Ignored
+    directories are not entered.
+    """
+    return _scan_tree(path, path_filter.match, path_filter.prune, recursive, None)
+
+
+def _scan_batch(scan: Callable[[str], Tuple[List[T], List[str]]],
+                pending: List[str]) -> Tuple[List[T], List[str]]:
+    # Scanning a few directories per task keeps the pool overhead low on
+    # fast file systems, where one directory takes microseconds
+    items: List[T] = []
+    for _ in range(WALK_BATCH):
+        if not pending:
+            break
+        found, dirs = scan(pending.pop())
+        items.extend(found)
+        pending.extend(dirs)
+    return items, pending
+
+
+def _walk_parallel(path: str, scan: Callable[[str], Tuple[List[T], List[str]]],
+                   workers: int) -> Iterator[T]:
+    """
+    Call `scan` for `path` and every directory it returns on a pool of threads,
+    yields the items of each scan as they complete.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='foremon-scan') as pool:
+        running: Set[Future] = {pool.submit(_scan_batch, scan, [path])}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                items, pending = fut.result()
+                # split the remaining directories between idle workers
+                parts = max(1, min(len(pending), workers - len(running)))
+                for i in range(parts if pending else 0):
+                    running.add(pool.submit(_scan_batch, scan, pending[i::parts]))
+                yield from items
+
+
+def scan_dir_parallel(path: str, path_filter: PathFilter, recursive: bool = True,
+                      workers: int = SCAN_WORKERS) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Same as `scan_dir` with directories scanned by a pool of threads, which is
+    much faster for large trees or slow file systems. Files are yielded in no
+    particular order.
+    """
+    return _scan_tree(path, path_filter.match, path_filter.prune, recursive, workers)
+
+
+def _list_dirs(top: str, prune: Callable[[str], bool]) -> Tuple[List[str], List[str]]:
+    dirs = []
+    try:
+        entries = list(os.scandir(top))
+    except OSError:
+        return dirs, dirs
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False) and not prune(entry.path):
+                dirs.append(entry.path)
+        except OSError:
+            continue
+    return dirs, dirs
+
+
+def walk_dirs_parallel(path: str, prune: Callable[[str], bool],
+                       workers: int = SCAN_WORKERS) -> Iterator[str]:
+    """
+    Yields every directory below `path` on a pool of threads, directories for
+    which `prune` returns True are not entered. Symbolic links are not followed.
+    """
+    def scan(top: str):
+        return _list_dirs(top, prune)
+    return _walk_parallel(path, scan, workers)
+
+
+def _list_links(top: str, prune: Callable[[str], bool]) -> Tuple[List[str], List[str]]:
+    links = []
+    dirs = []
+    try:
+        entries = list(os.scandir(top))
+    except OSError:
+        return links, dirs
+    for entry in entries:
+        try:
+            if entry.is_symlink():
+                if entry.is_dir() and not prune(entry.path):
+                    links.append(entry.path)
+            elif entry.is_dir(follow_symlinks=False) and not prune(entry.path):
+                dirs.append(entry.path)
+        except OSError:
+            continue
+    return links, dirs
+
+
+def find_dir_links(path: str, prune: Callable[[str], bool],
+                   workers: int = SCAN_WORKERS) -> Iterator[str]:
+    """
+    Yields the symbolic links to directories below `path` on a pool of threads.
+    Links are not followed and pruned directories are not entered.
+    """
+    def scan(top: str):
+        return _list_links(top, prune)
+    return _walk_parallel(path, scan, workers)
+
+
+def scan_config(config: ForemonConfig,
+                workers: Optional[int] = None) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Yields `(path, stat)` for every file the config watches. Trees are walked
+    in parallel when `workers` is more than one.
+    """
+    path_filter = PathFilter.from_config(config)
+    if config.follow_symlinks:
+        yield from _scan_links(config, path_filter, workers)
+        return
+
+    for path in config.paths:
+        if op.isdir(path):
+            yield from _scan_tree(path, path_filter.match, path_filter.prune,
+                                  config.recursive, workers)
+        elif op.isfile(path) and path_filter.match(path):
+            try:
+                yield path, os.stat(path)
+            except OSError:
+                continue
+
+
+def _scan_links(config: ForemonConfig, path_filter: PathFilter,
+                workers: Optional[int]) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Scans each real directory behind the paths and symbolic links of a config
+    once, like they are watched, and yields the files under every logical
+    path their events are reported with. Links to a parent are not followed.
+    """
+    # links walks directories with this module
+    from .links import LinkMap
+
+    links = LinkMap.build(config.paths, path_filter.prune, config.recursive)
+    for real in links.watched:
+        if op.isdir(real):
+            files = _scan_tree(real, lambda p: True, path_filter.prune, config.recursive, workers)
+        else:
+            try:
+                files = [(real, os.stat(real))]
+            except OSError:
+                continue
+        for path, st in files:
+            for logical in links.logical_paths(path):
+                if path_filter.match(logical):
+                    yield logical, st
+
+
+__all__ = ['Glob', 'GlobSet', 'PathFilter', 'find_dir_links', 'scan_config', 'scan_dir',
+           'scan_dir_parallel', 'walk_dirs_parallel']
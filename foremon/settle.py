@@ -0,0 +1,121 @@
+import asyncio
+import os
+import stat
+from asyncio import BaseEventLoop
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from watchdog.events import EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, FileSystemEvent
+
+from .display import display_debug
+from .task import ForemonTask
+
+try:
+    from watchdog.events import EVENT_TYPE_CLOSED, FileClosedEvent
+except ImportError:  # watchdog < 2.1
+
+    EVENT_TYPE_CLOSED = 'closed'
+
+    class FileClosedEvent(FileSystemEvent):
+        """
+        A file opened for writing was closed.
+        """
+
+        event_type = EVENT_TYPE_CLOSED
+
+# Seconds the size and mtime of a file must not change before it is settled
+SETTLE_WINDOW = 1.0
+
+StatKey = Tuple[int, int, int]
+
+
+def _stat_key(path: str) -> Optional[StatKey]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class SettleFilter:
+    """
+    Replaces the created and modified events of a file with one `closed` event
+    once it is completely written, so a task does not restart while a large
+    file is still being copied or generated.
+
+    Where the observer delivers `closed` events for a path, created and
+    modified events are dropped and the `closed` event of the writer is used.
+    Elsewhere the size and mtime of the file are checked every `window`
+    seconds until they stop changing.
+    """
+
+    callback: Callable[[ForemonTask, Any], None]
+    # (task, path) -> (last stat, pending check)
+    pending: Dict[Tuple[ForemonTask, str], Tuple[StatKey, asyncio.TimerHandle]]
+
+    def __init__(self, callback: Callable[[ForemonTask, Any], None],
+                 loop: Optional[BaseEventLoop] = None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.callback = callback
+        self.pending = {}
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def submit(self, task: ForemonTask, ev: FileSystemEvent, closes: bool) -> None:
+        """
+        `closes` is True if the observer of the path delivers `closed` events.
+        """
+        if ev.is_directory:
+            self.callback(task, ev)
+            return
+
+        if ev.event_type not in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED):
+            # the writer finished or the file is gone
+            self.cancel(task, ev.src_path)
+            self.callback(task, ev)
+            return
+
+        key = (task, ev.src_path)
+        if closes or key in self.pending:
+            return
+
+        st = _stat_key(ev.src_path)
+        if st is None:
+            return
+        display_debug(f'waiting for {ev.src_path} to settle')
+        self._schedule(task, ev.src_path, st)
+
+    def _schedule(self, task: ForemonTask, path: str, st: StatKey) -> None:
+        handle = self.loop.call_later(
+            task.config.settle, self._check, task, path)
+        self.pending[(task, path)] = (st, handle)
+
+    def _check(self, task: ForemonTask, path: str) -> None:
+        old, _ = self.pending.pop((task, path))
+        st = _stat_key(path)
+        if st is None:
+            # deleted meanwhile, its deleted event follows
+            return
+        if st != old:
+            self._schedule(task, path, st)
+            return
+        self.callback(task, FileClosedEvent(path))
+
+    def cancel(self, task: ForemonTask, path: str) -> None:
+        entry = self.pending.pop((task, path), None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def discard(self, task: ForemonTask) -> None:
+        for key in [k for k in self.pending if k[0] is task]:
+            self.pending.pop(key)[1].cancel()
+
+    def clear(self) -> None:
+        for _, handle in self.pending.values():
+            handle.cancel()
+        self.pending.clear()
+
+
+__all__ = ['EVENT_TYPE_CLOSED', 'FileClosedEvent', 'SETTLE_WINDOW', 'SettleFilter']
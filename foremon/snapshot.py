@@ -0,0 +1,95 @@
+import marshal
+import os
+import os.path as op
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import cache_key, command_key, evict, kind_dir
+from .config import ForemonConfig
+from .scan import SCAN_WORKERS, scan_config
+
+SNAPSHOT_MAGIC = b'FOREMON-SNAPSHOT'
+SNAPSHOT_VERSION = 1
+
+# path -> (inode, size, mtime_ns)
+Snapshot = Dict[str, Tuple[int, int, int]]
+
+
+def take_snapshot(config: ForemonConfig, files: Optional[Iterable[str]] = None,
+                  workers: int = SCAN_WORKERS) -> Snapshot:
+    """
+    Stat every file a config watches, walking trees in parallel. When `files`
+    is given only those files are read.
+    """
+    if files is None:
+        return {path: (st.st_ino, st.st_size, st.st_mtime_ns)
+                for path, st in scan_config(config, workers=workers)}
+
+    snapshot = {}
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        snapshot[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> List[str]:
+    """
+    Returns the paths added, removed or changed between two snapshots.
+    """
+    changed = [path for path, key in new.items() if old.get(path) != key]
+    changed.extend(path for path in old if path not in new)
+    return changed
+
+
+class TreeSnapshot:
+    """
+    The metadata of the files a task watches, persisted when a run exits
+    cleanly so changes made since can be found on the next start. A snapshot
+    is only valid for the command it was recorded for.
+
+    Snapshots are stored with `marshal` behind a magic and a version, a
+    snapshot of a different version is treated as missing.
+    """
+
+    path: str
+
+    def __init__(self, config: ForemonConfig, cache_dir: Optional[str] = None):
+        key = cache_key(op.abspath(config.cwd), config.alias, config.paths,
+                        config.patterns, config.ignore_defaults + config.ignore,
+                        config.files_from, command_key(config))
+        self.path = op.join(kind_dir(cache_dir, 'snapshots'), f'{key}.bin')
+
+    def load(self) -> Optional[Snapshot]:
+        try:
+            with open(self.path, 'rb') as fd:
+                header = fd.read(len(SNAPSHOT_MAGIC) + 1)
+                if (header[:-1] != SNAPSHOT_MAGIC
+                        or header[-1:] != bytes([SNAPSHOT_VERSION])):
+                    return None
+                data = marshal.load(fd)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def save(self, snapshot: Snapshot) -> None:
+        try:
+            os.makedirs(op.dirname(self.path), exist_ok=True)
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as fd:
+                fd.write(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]))
+                marshal.dump(snapshot, fd)
+            os.replace(tmp, self.path)
+            evict(op.dirname(self.path))
+        except OSError:
+            pass
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+__all__ = ['TreeSnapshot', 'diff_snapshots', 'take_snapshot']
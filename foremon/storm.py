@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+import time
+from asyncio import BaseEventLoop
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from watchdog.events import EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, FileSystemEvent
+
+from .config import ForemonConfig
+from .display import display_warning
+from .scan import SCAN_WORKERS, scan_config
+from .task import ForemonTask
+
+# Events per second which start a storm
+STORM_RATE = 2000
+# Seconds events are counted over to measure the rate
+STORM_WINDOW = 0.25
+# Seconds without events which end a storm
+STORM_QUIET = 0.5
+
+
+def rescan_changed(config: ForemonConfig, since: float,
+                   files: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Returns the watched files modified at or after the wall clock time `since`.
+    The change time is compared too, files moved into place or extracted with
+    an old mtime still count as modified. When `files` is given only those
+    files are checked.
+    """
+    since_ns = int(since * 1e9)
+    if files is None:
+        return [path for path, st in scan_config(config, workers=SCAN_WORKERS)
+                if max(st.st_mtime_ns, st.st_ctime_ns) >= since_ns]
+
+    changed = []
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if max(st.st_mtime_ns, st.st_ctime_ns) >= since_ns:
+            changed.append(path)
+    return changed
+
+
+class Storm:
+    """
+    The tasks which saw events during a storm, and whether any of those events
+    removed files, which a rescan of modification times cannot find.
+    """
+
+    started_at: float
+    ended_at: float
+    event_count: int
+    tasks: Dict[ForemonTask, bool]
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.ended_at = started_at
+        self.event_count = 0
+        self.tasks = {}
+
+
+class StormDetector:
+    """
+    Detects bursts of events, like from a `git checkout` of another branch or
+    a package install, by their rate. During a storm events are counted per
+    task instead of being matched and filtered one at a time. Once no events
+    were seen for `quiet` seconds `on_storm_end` is called on the loop with
+    the storm so the affected tasks can be rescanned once.
+
+    `absorb` is called from observer threads.
+    """
+
+    loop: BaseEventLoop
+    on_storm_start: Optional[Callable[[Storm], Any]]
+    on_storm_end: Callable[[Storm], Any]
+    rate: float
+    window: float
+    quiet: float
+    storm: Optional[Storm]
+
+    def __init__(self, on_storm_end: Callable[[Storm], Any],
+                 loop: Optional[BaseEventLoop] = None,
+                 rate: float = STORM_RATE,
+                 window: float = STORM_WINDOW,
+                 quiet: float = STORM_QUIET,
+                 on_storm_start: Optional[Callable[[Storm], Any]] = None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.on_storm_start = on_storm_start
+        self.on_storm_end = on_storm_end
+        self.rate = rate
+        self.window = window
+        self.quiet = quiet
+        self.storm = None
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+        self._last_event = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.storm is not None
+
+    def absorb(self, task: ForemonTask, ev: FileSystemEvent) -> bool:
+        """
+        Count an event, returns True if it is part of a storm and should not be
+        handled on its own.
+        """
+        now = time.monotonic()
+        with self._lock:
+            storm = self.storm
+            if storm is None:
+                if now - self._window_start > self.window:
+                    self._window_start = now
+                    self._window_count = 0
+                self._window_count += 1
+                if self._window_count <= self.rate * self.window:
+                    return False
+                # Events from the start of the window were already handled,
+                # their files are found again by the rescan.
+                storm = self.storm = Storm(time.time() - (now - self._window_start))
+                self.loop.call_soon_threadsafe(self._started, storm)
+
+            self._last_event = now
+            storm.event_count += 1
+            removed = ev.event_type in (EVENT_TYPE_DELETED, EVENT_TYPE_MOVED)
+            storm.tasks[task] = storm.tasks.get(task, False) or removed
+            return True
+
+    def _started(self, storm: Storm) -> None:
+        display_warning('event storm detected - waiting for changes to settle')
+        if self.on_storm_start is not None:
+            self.on_storm_start(storm)
+        self.loop.call_later(self.quiet, self._check_quiet)
+
+    def _check_quiet(self) -> None:
+        with self._lock:
+            idle = time.monotonic() - self._last_event
+            if idle < self.quiet:
+                storm = None
+            else:
+                storm, self.storm = self.storm, None
+                self._window_count = 0
+
+        if storm is None:
+            self.loop.call_later(self.quiet - idle, self._check_quiet)
+            return
+
+        storm.ended_at = time.time()
+        self.on_storm_end(storm)
+
+
+__all__ = ['Storm', 'StormDetector', 'rescan_changed']
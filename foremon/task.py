@@ -1,16 +1,56 @@
 import asyncio
 import atexit
+import codecs
+import time
 import weakref
 from asyncio.base_events import BaseEventLoop
-from asyncio.subprocess import Process, create_subprocess_shell
-from typing import Awaitable, Callable, Coroutine, List, MutableMapping, Optional, Set, Tuple
+from asyncio.streams import StreamReader
+from asyncio.subprocess import PIPE, Process, SubprocessStreamProtocol
+from typing import Awaitable, Callable, Coroutine, Iterable, List, MutableMapping, Optional, Set, TextIO, Tuple
 
+from .cache import InputFingerprint
+from .changes import ChangeSet
 from .config import ForemonConfig
 from .display import *
+from .reaper import (CLEANUP_ENV, SCRIPT_PIDS, find_leaked, kill_all_leaked, kill_leaked,
+                     new_marker, set_subreaper)
+from .ready import ReadyProbe
+
+# Buffer limit of piped output, longer lines are copied in chunks of this size
+STREAM_LIMIT = 2 ** 16
+# Seconds to wait for piped output after a script exits
+PIPE_DRAIN_TIMEOUT = 0.5
 
 ACTIVE_TASKS: Set['weakref.ReferenceType["ForemonTask"]'] = set()
 
 
+class ExitStreamProtocol(SubprocessStreamProtocol):
+    """
+    Resolves `exited` when the child watcher reports the exit of the script,
+    unlike `Process.wait` which also waits for its pipes to close before
+    Python 3.12.
+    """
+
+    def __init__(self, limit: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(limit=limit, loop=loop)
+        self.exited = loop.create_future()
+
+    def process_exited(self) -> None:
+        super().process_exited()
+        if not self.exited.done():
+            self.exited.set_result(None)
+
+
+async def spawn_shell(script: str, **kwargs) -> Tuple[Process, ExitStreamProtocol]:
+    """
+    Like `asyncio.create_subprocess_shell` but also returns the protocol.
+    """
+    loop = asyncio.get_event_loop()
+    transport, protocol = await loop.subprocess_shell(
+        lambda: ExitStreamProtocol(STREAM_LIMIT, loop), script, **kwargs)
+    return Process(transport, protocol, loop), protocol
+
+
 def track_ref(task: 'ForemonTask', _):
     global ACTIVE_TASKS
     ACTIVE_TASKS.add(weakref.ref(task))
@@ -36,6 +76,16 @@ def terminate_active_tasks():
             pass  # Normal occurs
         except Exception:
             pass
+    # only orphans of tasks with `cleanup_orphans` are killed
+    kill_all_leaked()
+
+
+def task_order(task: 'ForemonTask') -> Tuple[bool, int]:
+    """
+    Sort key for tasks by `config.order`, tasks without an order sort last.
+    """
+    order = task.config.order
+    return (order is None, order or 0)
 
 
 class ForemonTask:
@@ -46,19 +96,42 @@ class ForemonTask:
     """
 
     _awaitable: Optional[Awaitable]
+    _ready: Optional[asyncio.Future]
     config: ForemonConfig
     before_run_callbacks: List[Callable]
     after_run_callbacks: List[Callable]
     loop: BaseEventLoop
     run_count: int
+    # monotonic time of the first event since the last run started
+    triggered_at: Optional[float]
+    # run even if the inputs are unchanged, reset when a run starts
+    force_run: bool
+    # the last run exited with an unexpected code or signal
+    crashed: bool
+    # every script of the last run exited cleanly
+    clean_exit: bool
+    # paths changed since the last run started
+    changes: ChangeSet
+    # paths which triggered the current run
+    run_changes: ChangeSet
+    # returns the exact files the task watches, None if it watches its paths
+    watched_files: Optional[Callable[[], Optional[Iterable[str]]]]
 
     def __init__(self, config: ForemonConfig, loop: Optional[BaseEventLoop] = None):
         self._awaitable = None
+        self._ready = None
         self.config = config
         self.loop = loop or asyncio.get_event_loop()
         self.before_run_callbacks = [track_ref]
         self.after_run_callbacks = [untrack_ref]
         self.run_count = 0
+        self.triggered_at = None
+        self.force_run = False
+        self.crashed = False
+        self.clean_exit = False
+        self.changes = ChangeSet()
+        self.run_changes = ChangeSet()
+        self.watched_files = None
 
     @property
     def name(self) -> str:
@@ -69,6 +142,38 @@ class ForemonTask:
     def running(self) -> bool:
         return bool(self._awaitable is not None)
 
+    @property
+    def is_ready(self) -> bool:
+        ready = self._ready
+        return bool(ready is not None and ready.done() and ready.result())
+
+    def mark_triggered(self) -> None:
+        """
+        Record when the first event leading to the next run was seen.
+        """
+        if self.triggered_at is None:
+            self.triggered_at = time.monotonic()
+
+    def set_ready(self, ready: bool = True) -> None:
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(ready)
+
+    async def wait_ready(self) -> bool:
+        """
+        Blocks until the current run is ready or finished. Returns True if the
+        run became ready.
+        """
+        if self._ready is None:
+            return False
+        return await asyncio.shield(self._ready)
+
+    async def wait(self) -> None:
+        """
+        Blocks until the current run is finished.
+        """
+        if self._awaitable is not None:
+            await asyncio.shield(self._awaitable)
+
     def add_before_callback(self, callback: Callable) -> 'ForemonTask':
         if callback not in self.before_run_callbacks:
             self.before_run_callbacks.append(callback)
@@ -82,6 +187,9 @@ class ForemonTask:
     def terminate(self) -> None:
         pass
 
+    def send_signal(self, sig: int) -> None:
+        pass
+
     async def _run_callbacks(self, callbacks: List, context: Any, trigger: Any):
         for callback in callbacks:
             try:
@@ -98,18 +206,33 @@ class ForemonTask:
     def after_run(self, trigger: Any) -> Coroutine:
         return self._run_callbacks(self.after_run_callbacks[:], self, trigger)
 
+    def start(self, trigger: Optional[Any] = None) -> asyncio.Future:
+        """
+        Schedule `run` and return its future. `wait_ready` may be awaited as
+        soon as this returns.
+        """
+        if self._ready is None:
+            self._ready = self.loop.create_future()
+        return asyncio.ensure_future(self.run(trigger), loop=self.loop)
+
     async def run(self, trigger: Optional[Any] = None) -> None:
         if self.running:
             return
 
         # self.running will return True at this point
         self._awaitable = self.loop.create_future()
+        if self._ready is None:
+            self._ready = self.loop.create_future()
         self.run_count += 1
+        self.run_changes, self.changes = self.changes, ChangeSet()
         try:
             await self._run(trigger)
         except Exception as e:
             display_error(f'fatal error from task {self.name}', e)
         finally:
+            # A run which never became ready releases anything waiting on it
+            self.set_ready(False)
+            self._ready = None
             self._awaitable.set_result(None)
             self._awaitable = None
         return
@@ -122,19 +245,101 @@ class ScriptTask(ForemonTask):
 
     process: Optional[Process]
     pending_signals: List[int]
+    fingerprint: Optional[InputFingerprint]
 
     def __init__(self, config: ForemonConfig, loop: BaseEventLoop = None):
         super().__init__(config, loop)
         self.process = None
         self.pending_signals = []
+        self.fingerprint = None
 
     def terminate(self) -> None:
         self.send_signal(self.config.term_signal)
 
     async def _run(self, trigger: Optional[Any] = None) -> None:
+        triggered_at = self.triggered_at or time.monotonic()
+        self.triggered_at = None
+        force = self.force_run
+        self.force_run = False
+
+        fingerprint = None
+        if self.config.cache:
+            fingerprint = await self._fingerprint_inputs()
+            if not force and self.fingerprint.is_unchanged(fingerprint):
+                display_success(
+                    f'inputs of {self.name} are unchanged since the last clean exit - skipped')
+                return
+
+        self.clean_exit = False
         await self.before_run(trigger)
 
+        probe = ReadyProbe.from_config(self.config, self.loop)
+        waiter = None
+        if probe:
+            waiter = asyncio.ensure_future(
+                self._wait_ready(probe, triggered_at), loop=self.loop)
+
+        try:
+            success = await self._run_scripts(probe)
+        finally:
+            if waiter:
+                waiter.cancel()
+
+        self.clean_exit = success
+        if success and fingerprint:
+            self.fingerprint.set_success(fingerprint)
+
+        await self.after_run(trigger)
+
+        return
+
+    async def _fingerprint_inputs(self) -> str:
+        if self.fingerprint is None:
+            self.fingerprint = InputFingerprint(self.config)
+        watched = self.watched_files() if self.watched_files is not None else None
+        if watched is not None:
+            # copied on the loop, the import graph may change meanwhile
+            watched = list(watched)
+        return await self.loop.run_in_executor(None, self.fingerprint.compute, watched)
+
+    async def _run_scripts(self, probe: Optional[ReadyProbe] = None) -> bool:
+        sessions: List[int] = []
+        env = self.config.get_env()
+        changes_file = self.run_changes.update_env(env)
+        marker = None
+        if self.config.cleanup_orphans:
+            # inherited by descendants which leave the session of the script
+            marker = env[CLEANUP_ENV] = new_marker()
+        try:
+            return await self._run_batch(sessions, env, probe)
+        finally:
+            if changes_file:
+                try:
+                    os.remove(changes_file)
+                except OSError:
+                    pass
+            if marker is not None:
+                await self._cleanup_orphans(sessions, marker)
+
+    async def _cleanup_orphans(self, sessions: List[int], marker: str) -> None:
+        leaked = find_leaked(sessions, marker)
+        if not leaked:
+            return
+        count = await kill_leaked(leaked, self.config.term_signal)
+        if count:
+            display_warning(
+                f'cleaned up {count} leaked processes from {self.name}')
+
+    async def _run_batch(self, sessions: List[int], env: MutableMapping[str, str],
+                         probe: Optional[ReadyProbe] = None) -> bool:
+        """
+        Run each script in order, returns True if every script exited cleanly.
+        """
+        if self.config.cleanup_orphans:
+            set_subreaper()
+
         self.pending_signals.clear()
+        self.crashed = False
         # Execute script batch serially. If any script exits with an abnormal
         # exit code or encounters an unexpected signal then processing is
         # stopped.
@@ -145,24 +350,49 @@ class ScriptTask(ForemonTask):
             returncode: Optional[int] = None
             last_pid: int = None
 
+            # Output is only piped through foremon when it must be matched
+            piped = probe is not None and probe.wants_output
+            stdout = PIPE if piped else sys.stdout
+            stderr = PIPE if piped else sys.stderr
+
             try:
-                self.process = await create_subprocess_shell(
-                    script, stdout=sys.stdout, stderr=sys.stderr,
-                    shell=True, env=self.config.get_env(), preexec_fn=os.setsid)
+                self.process, protocol = await spawn_shell(
+                    script, stdout=stdout, stderr=stderr,
+                    env=env, preexec_fn=os.setsid)
 
                 last_pid = self.process.pid
-
-                await self.process.communicate()
+                # setsid makes each script the leader of its own session
+                sessions.append(last_pid)
+                SCRIPT_PIDS.add(last_pid)
+
+                if piped:
+                    tees = asyncio.gather(
+                        self._tee(self.process.stdout, sys.stdout, probe),
+                        self._tee(self.process.stderr, sys.stderr, probe))
+                    # Process.wait would also wait for the pipes, which
+                    # leaked descendants may never close
+                    await protocol.exited
+                    # Leaked descendants may hold the pipes open
+                    try:
+                        await asyncio.wait_for(tees, PIPE_DRAIN_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        transport = getattr(self.process, '_transport', None)
+                        if transport is not None:
+                            transport.close()
+                else:
+                    await self.process.communicate()
 
                 returncode = self.process.returncode
             finally:
                 self.process = None
+                SCRIPT_PIDS.discard(last_pid)
 
             exit_ok, should_continue = self.process_returncode(returncode)
             if exit_ok and should_continue:
                 continue
 
             if not exit_ok:
+                self.crashed = True
                 display_error(
                     f'app crashed {returncode} - waiting for file changes before restart')
             else:
@@ -172,10 +402,47 @@ class ScriptTask(ForemonTask):
         else:
             display_success(
                 'clean exit - waiting for changes before restart')
+            return True
 
-        await self.after_run(trigger)
+        return False
 
-        return
+    async def _tee(self, reader: StreamReader, stream: TextIO, probe: ReadyProbe) -> None:
+        """
+        Copy lines from a child pipe to `stream` while feeding the probe.
+        """
+        # a chunk of a long line may end within a character
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            try:
+                data = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # the last line is not terminated
+                data = e.partial
+            except asyncio.LimitOverrunError as e:
+                # line is longer than the stream limit, copied in chunks
+                data = await reader.read(e.consumed)
+            if not data:
+                break
+            line = decoder.decode(data)
+            stream.write(line)
+            stream.flush()
+            probe.feed(line)
+
+    async def _wait_ready(self, probe: ReadyProbe, triggered_at: float) -> None:
+        spawned_at = time.monotonic()
+        ready = await probe.wait()
+        now = time.monotonic()
+
+        if ready:
+            display_success(
+                f'{self.name} ready {now - triggered_at:.3f}s after trigger'
+                f' (spawn {spawned_at - triggered_at:.3f}s,'
+                f' startup {now - spawned_at:.3f}s)')
+        else:
+            display_warning(
+                f'{self.name} not ready after {probe.timeout}s')
+
+        self.set_ready(ready)
 
     def send_signal(self, sig: int) -> None:
         if not self.process:
@@ -209,4 +476,4 @@ class ScriptTask(ForemonTask):
         return False, False
 
 
-__all__ = ['ForemonTask', 'ScriptTask']
+__all__ = ['ForemonTask', 'ScriptTask', 'task_order']
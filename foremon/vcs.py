@@ -0,0 +1,159 @@
+import asyncio
+import os
+import os.path as op
+from asyncio import BaseEventLoop
+from typing import Any, Callable, Optional, Set
+
+from watchdog.events import (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED,
+                             EVENT_TYPE_MOVED, FileSystemEvent,
+                             FileSystemEventHandler)
+
+from .display import display_warning
+
+# Names of the directories holding the state of a repository
+VCS_DIRS = ('.git', '.hg')
+
+# Files and directories in a VCS directory which exist while an operation like
+# a commit, rebase or merge is in progress
+VCS_MARKERS = frozenset([
+    # git
+    'index.lock', 'rebase-merge', 'rebase-apply', 'MERGE_HEAD',
+    'CHERRY_PICK_HEAD', 'REVERT_HEAD',
+    # mercurial
+    'wlock',
+])
+
+
+def find_vcs_dir(path: str) -> Optional[str]:
+    """
+    Returns the VCS directory of the repository containing `path`. A `.git`
+    file, used by worktrees and submodules, is followed to the directory it
+    points to.
+    """
+    path = op.abspath(path)
+    while True:
+        for name in VCS_DIRS:
+            candidate = op.join(path, name)
+            if op.isdir(candidate):
+                return candidate
+            if name == '.git' and op.isfile(candidate):
+                gitdir = _read_gitdir(candidate)
+                if gitdir is not None:
+                    return gitdir
+        parent = op.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _read_gitdir(path: str) -> Optional[str]:
+    try:
+        with open(path) as fd:
+            line = fd.readline().strip()
+    except OSError:
+        return None
+    if not line.startswith('gitdir:'):
+        return None
+    gitdir = op.join(op.dirname(path), line[len('gitdir:'):].strip())
+    return op.normpath(gitdir) if op.isdir(gitdir) else None
+
+
+class VcsGuard(FileSystemEventHandler):
+    """
+    Tracks the markers of VCS operations in a VCS directory. The guard is
+    scheduled as a non-recursive watch of the directory so markers are seen as
+    they are created and removed, the directory is only listed once by `scan`
+    when the guard is added.
+
+    `on_change` is called on the loop with the guard when an operation starts
+    or finishes. Markers which exist for longer than `max_hold` seconds are
+    taken as left behind by a crashed operation and ignored until removed.
+    """
+
+    vcs_dir: str
+    markers: Set[str]
+    stale: Set[str]
+    max_hold: Optional[float]
+    loop: BaseEventLoop
+    on_change: Callable[['VcsGuard'], Any]
+
+    def __init__(self, vcs_dir: str, on_change: Callable[['VcsGuard'], Any],
+                 max_hold: Optional[float] = None, loop: Optional[BaseEventLoop] = None):
+        self.vcs_dir = vcs_dir
+        self.markers = set()
+        self.stale = set()
+        self.max_hold = max_hold
+        self.loop = loop or asyncio.get_event_loop()
+        self.on_change = on_change
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.markers - self.stale)
+
+    def scan(self) -> None:
+        try:
+            names = os.listdir(self.vcs_dir)
+        except OSError:
+            return
+        self.markers = set(VCS_MARKERS.intersection(names))
+        self._schedule_expiry()
+
+    def cancel(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule_expiry(self) -> None:
+        if not self.busy:
+            self.cancel()
+        elif self._timer is None and self.max_hold is not None:
+            self._timer = self.loop.call_later(self.max_hold, self.expire)
+
+    def expire(self) -> None:
+        """
+        Ignore the current markers until they are removed.
+        """
+        self._timer = None
+        if not self.busy:
+            return
+        display_warning(
+            f'{", ".join(sorted(self.markers - self.stale))} in {self.vcs_dir} exists'
+            f' for {self.max_hold}s, ignoring it until it is removed')
+        self.stale |= self.markers
+        self.on_change(self)
+
+    def _marker(self, path: Any) -> Optional[str]:
+        path = os.fsdecode(path)
+        name = op.basename(path)
+        if name in VCS_MARKERS and op.dirname(path) == self.vcs_dir:
+            return name
+        return None
+
+    def dispatch(self, event: FileSystemEvent) -> None:
+        # called from observer threads, events for other files are ignored here
+        src = self._marker(event.src_path)
+        dest = self._marker(getattr(event, 'dest_path', ''))
+        if src or dest:
+            self.loop.call_soon_threadsafe(self.update, event.event_type, src, dest)
+
+    def update(self, event_type: str, src: Optional[str], dest: Optional[str] = None) -> None:
+        busy = self.busy
+        # a marker created or removed again belongs to a new operation
+        self.stale.discard(src)
+        self.stale.discard(dest)
+        if event_type == EVENT_TYPE_CREATED and src:
+            self.markers.add(src)
+        elif event_type == EVENT_TYPE_DELETED and src:
+            self.markers.discard(src)
+        elif event_type == EVENT_TYPE_MOVED:
+            # a commit renames index.lock over the index
+            self.markers.discard(src)
+            if dest:
+                self.markers.add(dest)
+        self._schedule_expiry()
+        if busy != self.busy:
+            self.on_change(self)
+
+
+__all__ = ['VcsGuard', 'find_vcs_dir']
@@ -0,0 +1,88 @@
+from typing import Any, Dict, Iterable, Tuple
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+# A watched path and whether it is watched recursively
+WatchKey = Tuple[str, bool]
+
+
+class WatchSet:
+    """
+    The watches scheduled for one event handler. Watches are updated by
+    difference so a new set of paths only schedules and removes the watches
+    which changed. Observers share a watch between handlers of the same path,
+    a shared watch is only unscheduled once its last handler is removed.
+    `options` are passed to `schedule` of the observer.
+    """
+
+    observer: BaseObserver
+    handler: FileSystemEventHandler
+    options: Dict[str, Any]
+    watches: Dict[WatchKey, ObservedWatch]
+
+    def __init__(self, observer: BaseObserver, handler: FileSystemEventHandler, **options: Any):
+        self.observer = observer
+        self.handler = handler
+        self.options = options
+        self.watches = {}
+
+    def __len__(self) -> int:
+        return len(self.watches)
+
+    def __contains__(self, key: WatchKey) -> bool:
+        return key in self.watches
+
+    def update(self, keys: Iterable[WatchKey]) -> Tuple[int, int]:
+        """
+        Watch exactly `keys`, returns the number of watches added and removed.
+        """
+        wanted = set(keys)
+        removed = [k for k in self.watches if k not in wanted]
+        added = [k for k in wanted if k not in self.watches]
+
+        for key in removed:
+            self._unschedule(self.watches.pop(key))
+
+        for path, recursive in added:
+            self.watches[(path, recursive)] = self.observer.schedule(
+                self.handler, path, recursive=recursive, **self.options)
+
+        return len(added), len(removed)
+
+    def clear(self) -> None:
+        self.update(())
+
+    def _unschedule(self, watch: ObservedWatch) -> None:
+        unschedule_handler(self.observer, self.handler, watch)
+
+
+def unschedule_handler(observer: BaseObserver, handler: FileSystemEventHandler,
+                       watch: ObservedWatch) -> None:
+    """
+    Remove `handler` from `watch`, the watch is unscheduled with its last
+    handler.
+    """
+    with observer._lock:
+        handlers = observer._handlers.get(watch, ())
+        if handler not in handlers:
+            return
+        if len(handlers) > 1:
+            observer.remove_handler_for_watch(handler, watch)
+        else:
+            observer.unschedule(watch)
+
+
+def remove_handler(observer: BaseObserver, handler: FileSystemEventHandler) -> int:
+    """
+    Remove `handler` from every watch of `observer`, returns the number of
+    watches it was removed from.
+    """
+    with observer._lock:
+        watches = [w for w, handlers in observer._handlers.items() if handler in handlers]
+        for watch in watches:
+            unschedule_handler(observer, handler, watch)
+    return len(watches)
+
+
+__all__ = ['WatchSet', 'remove_handler', 'unschedule_handler']
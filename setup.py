@@ -23,7 +23,7 @@ long_description = read('README.md')
 install_requires = """
 ansicolors>=1.1.8
 click>=7.1.2
-watchdog>=1.0.2
+watchdog>=1.0.2,<3
 toml>=0.10.2
 pydantic>=1.7.3
 """
@@ -81,7 +81,7 @@ setup(
     'build_ext': build_ext,
   },
   entry_points={'console_scripts': [
-    'foremon = foremon.cli:main',
+    'foremon = foremon.__main__:main',
   ]},
   python_requires='>=3.6.1',
   # Due to README.md, requirements.txt, etc...
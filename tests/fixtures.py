@@ -10,7 +10,10 @@ import pytest
 from _pytest.capture import CaptureFixture
 from _pytest.fixtures import SubRequest
 from colors import color, strip_color
+from foremon.config import ForemonConfig
 from foremon.display import *
+from foremon.monitor import Monitor
+from foremon.task import ScriptTask
 
 from .fixtures import *
 
@@ -122,6 +125,36 @@ def sampledir():
     return op.join(op.dirname(__file__), 'samples')
 
 
+@pytest.fixture
+def cache_dir(tempfiles: Tempfiles, monkeypatch) -> str:
+    path = tempfiles.make_dir('cache')
+    monkeypatch.setenv('XDG_CACHE_HOME', path)
+    return op.join(path, 'foremon')
+
+
+def make_config(tempfiles: Tempfiles, **fields) -> ForemonConfig:
+    """
+    A config running `true` in the temporary directory, `fields` override any
+    setting. Unless given `src` is watched and events for files written with
+    the same content are passed, the tests rewrite files a lot.
+    """
+    fields.setdefault('cwd', tempfiles.root)
+    if 'paths' not in fields and 'files_from' not in fields:
+        fields['paths'] = [tempfiles.make_dir('src')]
+    fields.setdefault('scripts', ['true'])
+    fields.setdefault('ignore_unchanged', False)
+    return ForemonConfig(**fields)
+
+
+def make_monitor(tempfiles: Tempfiles, dwell: float = 0.1, **fields) -> Monitor:
+    """
+    A monitor with a task of `make_config(tempfiles, **fields)`.
+    """
+    monitor = Monitor(dwell=dwell, pipe=None)
+    monitor.add_task(ScriptTask(make_config(tempfiles, **fields)))
+    return monitor
+
+
 class CapLines:
     # Utilities for accessing cap-fd
     stdout_lines: List[str]
@@ -201,6 +234,9 @@ __all__ = [
     'get_sample_file',
     'get_sample_files',
     'get_version_file',
+    'cache_dir',
+    'make_config',
+    'make_monitor',
     'mkdirp',
     'pytest',
     'pytestmark',
@@ -6,7 +6,7 @@ from unittest.mock import MagicMock
 from foremon.app import AUTO_RELOAD_ALIAS, Foremon, ReloadTask
 from foremon.config import Events, ForemonOptions
 from foremon.display import *
-from foremon.task import ScriptTask
+from foremon.task import ScriptTask, task_order
 from pytest_mock.plugin import MockerFixture
 from watchdog.events import FileSystemEvent
 
@@ -69,6 +69,73 @@ async def test_app_log_event_type(output: CapLines, src_path, event_type):
     assert not output.stderr_lines
 
 
+def test_app_reload_changed_tasks(norun, mocker: MockerFixture, output: CapLines,
+                                  tempfiles: Tempfiles):
+    src = tempfiles.make_dir('src')
+    config_file = tempfiles.make_file("config.toml", content=f"""
+    [tool.foremon]
+    scripts = ["true"]
+    paths = ["{src}"]
+
+        [tool.foremon.server]
+        scripts = ["echo server"]
+        paths = ["{src}"]
+
+        [tool.foremon.docs]
+        scripts = ["echo docs"]
+        paths = ["{src}"]
+
+        [tool.foremon.lint]
+        scripts = ["echo lint"]
+        paths = ["{src}"]
+    """)
+
+    options = ForemonOptions(config_file=config_file, use_all=True, verbose=True)
+    foremon = Foremon(options)
+    foremon.run_forever()
+    before = {task.name: task for task in foremon.tasks}
+
+    tempfiles.make_file("config.toml", content=f"""
+    [tool.foremon]
+    scripts = ["true"]
+    paths = ["{src}"]
+
+        [tool.foremon.tests]
+        scripts = ["echo tests"]
+        paths = ["{src}"]
+
+        [tool.foremon.server]
+        scripts = ["echo server"]
+        paths = ["{src}"]
+
+        [tool.foremon.docs]
+        scripts = ["echo docs --strict"]
+        paths = ["{src}"]
+        events = ["modified", "created"]
+    """)
+
+    queue = mocker.patch.object(foremon.monitor, 'queue_task_event')
+    foremon.reload()
+    after = {task.name: task for task in foremon.tasks}
+
+    assert sorted(after) == sorted([AUTO_RELOAD_ALIAS, 'default', 'docs', 'server', 'tests'])
+    for name in (AUTO_RELOAD_ALIAS, 'default', 'server'):
+        assert after[name] is before[name]
+    assert after['docs'] is not before['docs']
+    assert after['docs'].config.scripts == ['echo docs --strict']
+    assert before['docs'] not in foremon.monitor.watch_sets
+    assert before['lint'] not in foremon.monitor.watch_sets
+    # only new and changed tasks run, in the order of the config
+    assert [c.args[0].name for c in queue.call_args_list] == ['tests', 'docs']
+    assert [t.name for t in sorted(after.values(), key=task_order)][1:3] == ['tests', 'server']
+
+    assert output.stderr_expect('task tests was added')
+    assert output.stderr_expect('task docs changed events, scripts')
+    assert output.stderr_expect('task lint was removed')
+    assert output.stderr_expect(
+        'reloaded 1 changed, 1 added, 1 removed and kept 2 unchanged tasks')
+
+
 async def test_app_auto_reload_config(norun, mocker:MockerFixture, output: CapLines, tempfiles: Tempfiles):
 
     config_file = tempfiles.make_file("config.toml", content="""
@@ -97,9 +164,9 @@ async def test_app_auto_reload_config(norun, mocker:MockerFixture, output: CapLi
     event.event_type = Events.modified
 
     await task.run(event)
-    # A new instance is created on reload
+    # The reload task itself is not changed by a reload
     task2 = foremon.get_task(AUTO_RELOAD_ALIAS)
-    assert task != task2
+    assert task is task2
 
     # Checks that the reload took effect
     default = foremon.get_task('default')
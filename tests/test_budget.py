@@ -0,0 +1,164 @@
+import asyncio
+import errno
+import gc
+import os.path as op
+
+import pytest
+from foremon.budget import *
+from foremon.config import *
+from foremon.monitor import Monitor
+from foremon.multiplex import MultiplexedObserver
+from foremon.scan import PathFilter
+from foremon.task import ScriptTask
+from pytest_mock.plugin import MockerFixture
+
+from .fixtures import *
+
+
+def make_tree(tempfiles: Tempfiles) -> str:
+    # src needs 3 watches, docs 2 and node_modules is ignored
+    tempfiles.make_files([
+        'src/a/b/x.py', 'docs/c/y.md', 'node_modules/d/e/f/z.js', 'top.py'])
+    return tempfiles.root
+
+
+def test_read_watch_limit(tempfiles: Tempfiles):
+    path = tempfiles.make_file('limit', '8192\n')
+    assert read_watch_limit(path) == 8192
+    with open(path, 'w') as fd:
+        fd.write('none')
+    assert read_watch_limit(path) is None
+    assert read_watch_limit(op.join(tempfiles.root, 'missing')) is None
+
+
+def test_budget_plan(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    src, docs = op.join(root, 'src'), op.join(root, 'docs')
+
+    # a tree which was not walked yet may take the watches left
+    budget = WatchBudget(4, used=1, reserve=0)
+    plan = budget.plan('a', [(root, True)])
+    assert plan.native == {(root, True): 1}
+    assert plan.polled == []
+    assert plan.limits == {(root, True): 3}
+
+    budget.record(root, 6, {src: 3, docs: 2})
+    assert budget.planned['a'] == {(root, True): 6}
+
+    # the root and docs fit, src is polled
+    plan = budget.plan('a', [(root, True)])
+    assert plan.native == {(root, False): 1, (docs, True): 2}
+    assert plan.polled == [(src, True)]
+    assert plan.limits == {}
+
+
+def test_budget_shared_watches(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    src = op.join(root, 'src')
+    budget = WatchBudget(12, used=0, reserve=0)
+    budget.record(root, 10, {src: 3, op.join(root, 'docs'): 2,
+                             op.join(root, 'node_modules'): 4})
+    budget.record(src, 3, {op.join(src, 'a'): 2})
+    assert budget.plan('a', [(root, True)]).polled == []
+    # the same watch is shared, src only fits in part
+    plan = budget.plan('b', [(root, True)])
+    assert plan.polled == []
+    plan = budget.plan('c', [(src, True)])
+    assert plan.native == {(src, False): 1}
+    assert plan.polled == [(op.join(src, 'a'), True)]
+
+    budget.release('a')
+    budget.release('b')
+    assert budget.plan('c', [(src, True)]).polled == []
+
+
+@pytest.mark.skipif(not op.exists('/proc/self/fdinfo'), reason='requires procfs')
+def test_budget_walk_counts(tempfiles: Tempfiles, mocker: MockerFixture):
+    root = make_tree(tempfiles)
+    walked = []
+    observer = MultiplexedObserver(on_walked=lambda *args: walked.append(args))
+    observer.schedule(object(), root, recursive=True,
+                      path_filter=PathFilter(['*'], ['node_modules/*']))
+    # the kernel runs out of watches after the first directory
+    add_watch = mocker.patch('foremon.multiplex.MultiplexedEmitter.add_watch', side_effect=[
+        None, OSError(errno.ENOSPC, 'No space left on device')])
+    observer.start()
+    try:
+        assert observer.walker.wait(2.0)
+    finally:
+        observer.stop()
+        observer.join()
+
+    # the tree is counted to its end
+    (watch, needed, children, full), = walked
+    assert watch.path == root
+    assert needed == 6
+    assert children == {op.join(root, 'src'): 3, op.join(root, 'docs'): 2}
+    assert full
+    assert add_watch.call_count == 2
+
+
+@pytest.mark.skipif(not op.exists('/proc/self/fdinfo'), reason='requires procfs')
+def test_count_user_watches(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    # release the watches of observers left behind by other tests
+    gc.collect()
+    before = count_user_watches()
+    observer = MultiplexedObserver()
+    observer.schedule(object(), root, recursive=True)
+    observer.start()
+    try:
+        observer.walker.wait(2.0)
+        # other programs may add watches meanwhile
+        assert count_user_watches() - before >= 10
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def test_budget_monitor_polls(output: CapLines, tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    monitor = Monitor(pipe=None)
+    if not isinstance(monitor.observer, MultiplexedObserver):
+        pytest.skip('requires inotify')
+    monitor.budget = WatchBudget(4, used=1, reserve=0)
+    task = ScriptTask(make_config(tempfiles, paths=[root], ignore=['node_modules/*']))
+    monitor.add_task(task)
+    # nothing is walked while adding the task
+    assert set(monitor.watch_sets[task].watches) == {(root, True)}
+    assert task not in monitor.budget_polls
+
+    # the walk reached the watch limit
+    src, docs = op.join(root, 'src'), op.join(root, 'docs')
+    monitor._record_walk(root, 6, {src: 3, docs: 2}, True)
+    assert set(monitor.watch_sets[task].watches) == {(root, False), (docs, True)}
+    assert set(monitor.budget_polls[task].watches) == {(src, True)}
+    assert monitor.poller is not None
+    assert output.stderr_expect(r'not enough inotify watches for .*src, polling it every 5s')
+    monitor.reset()
+
+
+async def test_budget_first_walk_over_limit(output: CapLines, tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    monitor = Monitor(pipe=None)
+    if not isinstance(monitor.observer, MultiplexedObserver):
+        pytest.skip('requires inotify')
+    # the tree needs 6 watches, 3 are left and nothing was walked yet
+    monitor.budget = WatchBudget(4, used=1, reserve=0)
+    task = ScriptTask(make_config(tempfiles, paths=[root], ignore=['node_modules/*']))
+    monitor.add_task(task)
+    monitor.observer.start()
+    try:
+        assert monitor.observer.walker.wait(2.0)
+        # the walk is recorded on the loop
+        await asyncio.sleep(0.1)
+        assert monitor.observer.walker.wait(2.0)
+    finally:
+        monitor.observer.stop()
+        monitor.observer.join()
+
+    assert output.stderr_expect(r'.* needs more than the 3 inotify watches left for it')
+    src, docs = op.join(root, 'src'), op.join(root, 'docs')
+    assert set(monitor.watch_sets[task].watches) == {(root, False), (docs, True)}
+    assert set(monitor.budget_polls[task].watches) == {(src, True)}
+    monitor.reset()
@@ -0,0 +1,149 @@
+import os
+import os.path as op
+import sys
+
+from foremon.cache import CACHE_LIMIT, InputFingerprint, evict, kind_dir, write_cache
+from foremon.config import *
+from foremon.snapshot import TreeSnapshot
+from foremon.task import ScriptTask
+
+from .fixtures import *
+
+
+# Settings of the configs which skip unchanged inputs
+CACHED = dict(cache=True, patterns=['*.py'], scripts=['echo ran'])
+
+
+def test_cache_fingerprint_persists(cache_dir: str, tempfiles: Tempfiles):
+    src = tempfiles.make_file('src/a.py', 'a = 1')
+    tempfiles.make_file('src/notes.txt', 'not an input')
+    config = make_config(tempfiles, **CACHED)
+
+    fp = InputFingerprint(config)
+    first = fp.compute()
+    assert list(fp.files) == [src]
+    fp.set_success(first)
+
+    # A new instance, like after restarting foremon, loads the last run
+    fp = InputFingerprint(config)
+    assert fp.is_unchanged(fp.compute())
+
+    # Same content with a new mtime has the same fingerprint
+    os.utime(src, (0, 0))
+    assert fp.compute() == first
+
+    tempfiles.make_file('src/a.py', 'a = 2')
+    assert fp.compute() != first
+
+
+def test_cache_evict(tempfiles: Tempfiles):
+    root = tempfiles.make_dir('evict')
+    for i in range(CACHE_LIMIT + 4):
+        path = tempfiles.make_file(f'evict/{i}.json')
+        os.utime(path, (i, i))
+
+    evict(root)
+
+    remaining = sorted(int(f.split('.')[0]) for f in os.listdir(root))
+    assert len(remaining) == CACHE_LIMIT
+    assert remaining[0] == 4
+
+
+def test_cache_evict_per_kind(cache_dir: str, tempfiles: Tempfiles):
+    store = TreeSnapshot(make_config(tempfiles, **CACHED))
+    store.save({})
+    for i in range(CACHE_LIMIT + 4):
+        write_cache(op.join(kind_dir(None, 'inputs'), f'{i}.json'), {})
+
+    assert len(os.listdir(op.join(cache_dir, 'inputs'))) == CACHE_LIMIT
+    assert op.exists(store.path)
+
+
+async def test_cache_skips_unchanged(output: CapLines, cache_dir: str, tempfiles: Tempfiles):
+    tempfiles.make_file('src/a.py', 'a = 1')
+    task = ScriptTask(make_config(tempfiles, **CACHED))
+
+    await task.run()
+    assert output.stdout_expect('ran')
+    output.cleanup()
+
+    await task.run()
+    assert output.stderr_expect('inputs of default are unchanged.*skipped')
+    assert not output.stdout_expect('ran')
+    output.cleanup()
+
+    task.force_run = True
+    await task.run()
+    assert output.stdout_expect('ran')
+    output.cleanup()
+
+    tempfiles.make_file('src/a.py', 'a = 2')
+    await task.run()
+    assert output.stdout_expect('ran')
+
+
+async def test_cache_runs_changed_command(output: CapLines, cache_dir: str, tempfiles: Tempfiles):
+    tempfiles.make_file('src/a.py', 'a = 1')
+    config = make_config(tempfiles, **CACHED)
+    await ScriptTask(config).run()
+    assert output.stdout_expect('ran')
+    output.cleanup()
+
+    # like a reload where only the scripts changed
+    config.scripts = ['echo changed']
+    await ScriptTask(config).run()
+    assert output.stdout_expect('changed')
+    output.cleanup()
+
+    config.environment = {'MODE': 'release'}
+    await ScriptTask(config).run()
+    assert output.stdout_expect('changed')
+    output.cleanup()
+
+    await ScriptTask(config).run()
+    assert output.stderr_expect('inputs of default are unchanged.*skipped')
+
+
+async def test_cache_auto_paths(output: CapLines, cache_dir: str, tempfiles: Tempfiles):
+    main = tempfiles.make_file('main.py', 'import pkg.a\nprint("ran")\n')
+    tempfiles.make_file('pkg/__init__.py', '')
+    module = tempfiles.make_file('pkg/a.py', 'a = 1\n')
+    monitor = make_monitor(tempfiles, paths=AUTO_PATHS, cache=True,
+                           scripts=[f'{sys.executable} {main}'])
+    task, = monitor.all_tasks
+
+    await task.run()
+    assert output.stdout_expect('ran')
+    output.cleanup()
+    await task.run()
+    assert output.stderr_expect('inputs of default are unchanged.*skipped')
+    output.cleanup()
+
+    # the imported module is an input although no path is watched recursively
+    tempfiles.make_file('pkg/a.py', 'a = 2\n')
+    assert module in task.fingerprint.files
+    await task.run()
+    assert output.stdout_expect('ran')
+    monitor.reset()
+
+
+async def test_cache_files_from(output: CapLines, cache_dir: str, tempfiles: Tempfiles):
+    tempfiles.make_file('listed.txt', '1')
+    tempfiles.make_file('other.txt', '1')
+    monitor = make_monitor(tempfiles, files_from='echo listed.txt', cache=True,
+                           scripts=['echo ran'])
+    task, = monitor.all_tasks
+
+    await task.run()
+    assert list(task.fingerprint.files) == [op.join(tempfiles.root, 'listed.txt')]
+    output.cleanup()
+
+    tempfiles.make_file('other.txt', '2')
+    await task.run()
+    assert output.stderr_expect('inputs of default are unchanged.*skipped')
+    output.cleanup()
+
+    tempfiles.make_file('listed.txt', '2')
+    await task.run()
+    assert output.stdout_expect('ran')
+    monitor.reset()
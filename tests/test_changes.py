@@ -0,0 +1,48 @@
+import os
+
+from foremon.changes import *
+from watchdog.events import FileMovedEvent
+
+from .fixtures import *
+
+
+def test_changes_dedupe_in_order():
+    changes = ChangeSet(['b', 'a', 'b'])
+    changes.add_event(FileMovedEvent('c', 'a'))
+    assert list(changes) == ['b', 'a', 'c']
+    assert not changes.overflow
+
+
+def test_changes_overflow():
+    changes = ChangeSet(map(str, range(5)), limit=3)
+    assert len(changes) == 3
+    assert changes.overflow
+    assert changes.describe(2) == '0, 1 (+1+ more)'
+
+    other = ChangeSet(['x'])
+    other.update(changes)
+    assert other.overflow
+    other.clear()
+    assert not other.overflow and not len(other)
+
+
+def test_changes_update_env():
+    env = {}
+    changes = ChangeSet(['a.py', 'b.py'])
+    assert changes.update_env(env) is None
+    assert env[ENV_CHANGED_FILES] == 'a.py\nb.py'
+    assert env[ENV_CHANGED_FILES_OVERFLOW] == '0'
+    assert ENV_CHANGED_FILES_LIST not in env
+
+
+def test_changes_update_env_large():
+    env = {}
+    paths = [f'src/{i}.py' for i in range(500)]
+    path = ChangeSet(paths).update_env(env)
+    try:
+        assert env[ENV_CHANGED_FILES] == ''
+        assert env[ENV_CHANGED_FILES_LIST] == path
+        with open(path) as fd:
+            assert fd.read().splitlines() == paths
+    finally:
+        os.remove(path)
@@ -106,6 +106,14 @@ def test_cli_dwell_clamps(noninteractive: MagicMock, cli):
     assert f.options.dwell == 0.0
 
 
+def test_cli_force(noninteractive: MagicMock, cli):
+
+    cli('--force -- true')
+    f: Foremon = noninteractive.call_args[0][0]
+    assert f.options.force
+    assert all(task.force_run for task in f.tasks)
+
+
 def test_cli_ignore(noninteractive: MagicMock, cli):
 
     cli('-V --dry-run -i "*.test1" -i "*.test2" -- true')
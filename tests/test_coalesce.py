@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os.path as op
+from typing import List
+
+from foremon.coalesce import SaveCoalescer, is_editor_temp
+from foremon.config import DEFAULT_EVENTS, ForemonConfig
+from foremon.handler import TaskEventHandler
+from foremon.monitor import Monitor
+from foremon.task import ScriptTask
+from watchdog.events import (FileCreatedEvent, FileDeletedEvent,
+                             FileModifiedEvent, FileMovedEvent,
+                             FileSystemEvent)
+
+from .fixtures import *
+
+EVENT_TYPES = {
+    'created': FileCreatedEvent,
+    'deleted': FileDeletedEvent,
+    'modified': FileModifiedEvent,
+    'moved': FileMovedEvent,
+}
+
+
+def load_recording(name: str):
+    with open(get_sample_file(op.join('events', name))) as fd:
+        recording = json.load(fd)
+    events = [EVENT_TYPES[ev[0]](*ev[1:]) for ev in recording['events']]
+    return recording['file'], events
+
+
+async def replay(recorded: List[FileSystemEvent], **config) -> List[FileSystemEvent]:
+    """
+    Replays events through the handler and event filters of a monitor.
+    """
+    conf = ForemonConfig(scripts=['true'], ignore_defaults=[],
+                         ignore_unchanged=False, **config)
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(conf)
+    handler = TaskEventHandler(task, monitor._on_event)
+
+    result = []
+    monitor._accept_event = lambda task, ev: result.append(ev)
+    for ev in recorded:
+        handler.dispatch(ev)
+    await asyncio.sleep(0.01)
+    return result
+
+
+@pytest.mark.parametrize('recording', [
+    'emacs.json',
+    'gedit.json',
+    'jetbrains.json',
+    'kate.json',
+    'vim-backup.json',
+    'vim.json',
+    'vscode.json',
+])
+@pytest.mark.parametrize('events', [
+    DEFAULT_EVENTS,
+    ['created', 'modified', 'deleted', 'moved'],
+])
+async def test_coalesce_editor_saves(recording: str, events: List[str]):
+    path, recorded = load_recording(recording)
+
+    result = await replay(recorded, events=events)
+
+    assert result
+    assert {(ev.event_type, ev.src_path) for ev in result} == {('modified', path)}
+
+
+async def test_coalesce_disabled():
+    _, recorded = load_recording('jetbrains.json')
+
+    result = await replay(recorded, coalesce_saves=False)
+
+    assert {ev.src_path for ev in result} != {'src/main.py'}
+
+
+def test_coalesce_keeps_other_events():
+    c = SaveCoalescer()
+
+    rename = FileMovedEvent('a.py', 'b.py')
+    assert c.coalesce(rename) is rename
+
+    # Re-created outside of the save window
+    c.window = 0.0
+    c.coalesce(FileDeletedEvent('a.py'))
+    created = FileCreatedEvent('a.py')
+    assert c.coalesce(created) is created
+
+
+def test_coalesce_per_task():
+    c = SaveCoalescer()
+
+    # both tasks watch the file an editor deletes and re-creates
+    for task in ('a', 'b'):
+        assert c.coalesce(FileDeletedEvent('a.py'), task).event_type == 'deleted'
+    for task in ('a', 'b'):
+        assert c.coalesce(FileCreatedEvent('a.py'), task).event_type == 'modified'
+
+    # a removal seen by one task does not turn another's creation into a save
+    c.coalesce(FileDeletedEvent('b.py'), 'a')
+    assert c.coalesce(FileCreatedEvent('b.py'), 'b').event_type == 'created'
+
+
+@pytest.mark.parametrize('path, expect', [
+    ('src/.main.py.swp', True),
+    ('src/main.py~', True),
+    ('src/4913', True),
+    ('src/main.py___jb_tmp___', True),
+    ('src/main.py', False),
+    ('src/swp.py', False),
+    ('src/4913.py', False),
+])
+def test_coalesce_is_editor_temp(path: str, expect: bool):
+    assert is_editor_temp(path) == expect
@@ -226,3 +226,30 @@ def test_config_order_set_explicit(mocker: MockerFixture):
         expect = expected[config.alias]
         # print(config.alias, result, expect)
         assert config.order == expect
+
+
+def test_config_actions():
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    scripts = ['true']
+        [tool.foremon.actions]
+        "*.conf" = "SIGHUP"
+        "*.ini" = 10
+        "*.py" = "Restart"
+    """).tool.foremon
+
+    assert conf.actions == {
+        '*.conf': signal.SIGHUP,
+        '*.ini': signal.SIGUSR1,
+        '*.py': RESTART_ACTION,
+    }
+    assert not conf.configs
+
+
+def test_config_actions_invalid():
+    with pytest.raises(ValidationError):
+        PyProjectConfig.parse_toml("""
+        [tool.foremon]
+            [tool.foremon.actions]
+            "*.conf" = "SIGNOPE"
+        """)
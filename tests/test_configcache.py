@@ -0,0 +1,104 @@
+import os
+import os.path as op
+
+from foremon.app import Foremon
+from foremon.config import *
+from foremon.configcache import *
+from foremon.configcache import CONFIG_MAGIC
+from pytest_mock.plugin import MockerFixture
+
+from .fixtures import *
+
+CONFIG = """
+[tool.foremon]
+scripts = ["echo default"]
+paths = ["$PROJECT_SRC"]
+
+    [tool.foremon.other]
+    scripts = ["echo other"]
+    events = ["modified", "closed"]
+    term_signal = "SIGINT"
+"""
+
+
+@pytest.fixture
+def cache_dir(tempfiles: Tempfiles, monkeypatch) -> str:
+    path = tempfiles.make_dir('cache')
+    monkeypatch.setenv('XDG_CACHE_HOME', path)
+    monkeypatch.setenv('PROJECT_SRC', '/src')
+    return op.join(path, 'foremon')
+
+
+def test_config_cache_hits(cache_dir: str, tempfiles: Tempfiles):
+    path = tempfiles.make_file('pyproject.toml', CONFIG)
+    cache = ConfigCache()
+    project, cached = cache.load(path)
+    assert not cached
+    assert os.listdir(op.join(cache_dir, 'configs'))
+
+    again, cached = cache.load(path)
+    assert cached
+    assert again == project
+    # every load returns a copy which can be modified
+    assert again.tool.foremon is not project.tool.foremon
+
+    project, cached = ConfigCache().load(path)
+    assert cached
+    config = project.tool.foremon
+    assert config.paths == ['/src']
+    assert [c.order for c in config.get_configs()] == [0, 1]
+    other = config.configs[0]
+    assert other.events == [Events.modified, Events.closed]
+    assert other.term_signal == 2
+
+
+def test_config_cache_key(cache_dir: str, tempfiles: Tempfiles, monkeypatch):
+    path = tempfiles.make_file('pyproject.toml', CONFIG)
+    cache = ConfigCache()
+    cache.load(path)
+
+    monkeypatch.setenv('UNRELATED', 'x')
+    assert cache.load(path)[1]
+
+    monkeypatch.setenv('PROJECT_SRC', '/other')
+    project, cached = cache.load(path)
+    assert not cached
+    assert project.tool.foremon.paths == ['/other']
+
+    monkeypatch.setenv('FOREMON_RETURNCODE', '3')
+    project, cached = cache.load(path)
+    assert not cached
+    assert project.tool.foremon.returncode == 3
+
+    with open(path, 'a') as fd:
+        fd.write('\n    skip = true\n')
+    project, cached = cache.load(path)
+    assert not cached
+    assert project.tool.foremon.configs[0].skip
+
+
+def test_config_cache_corrupt(cache_dir: str, tempfiles: Tempfiles):
+    path = tempfiles.make_file('pyproject.toml', CONFIG)
+    ConfigCache().load(path)
+    name, = os.listdir(op.join(cache_dir, 'configs'))
+    with open(op.join(cache_dir, 'configs', name), 'wb') as fd:
+        fd.write(CONFIG_MAGIC + b'\x01garbage')
+
+    project, cached = ConfigCache().load(path)
+    assert not cached
+    assert project.tool.foremon.scripts == ['echo default']
+
+
+def test_app_reports_config_load(cache_dir: str, tempfiles: Tempfiles, output: CapLines,
+                                 mocker: MockerFixture, monkeypatch):
+    monkeypatch.setenv('PROJECT_SRC', tempfiles.make_dir('src'))
+    mocker.patch('foremon.app.Foremon.get_pipe', lambda _: None)
+    mocker.patch('foremon.app.Foremon._run')
+    path = tempfiles.make_file('pyproject.toml', CONFIG)
+    options = ForemonOptions(config_file=path, verbose=True, no_guess=True)
+    app = Foremon(options)
+    app.run_forever()
+    app.reload()
+    assert output.stderr_expect(r'config loaded in [\d.]+ms$')
+    assert output.stderr_expect(r'config loaded in [\d.]+ms from cache')
+    assert app.config.scripts == ['echo default']
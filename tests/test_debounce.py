@@ -3,6 +3,7 @@ from foremon.task import ForemonTask
 from typing import Callable
 
 from foremon.debounce import Debounce, EventContainer
+from watchdog.events import FileModifiedEvent
 from pytest_mock.plugin import MockerFixture
 from itertools import count
 from .fixtures import *
@@ -92,3 +93,17 @@ async def test_debounce_dwell_high_volume_submit(output: CapLines, MockTask):
     assert 'y' in result
 
     assert output.stderr_expect('detected high event volume.*')
+
+
+async def test_debounce_collects_changes(MockTask):
+    result = []
+    dwell = 0.1
+    d = Debounce(dwell, lambda *args: result.append(args))
+    task = MockTask('x')
+    for path in ['a.py', 'b.py', 'a.py']:
+        d.submit(task, FileModifiedEvent(path))
+    await asyncio.sleep(dwell * 2)
+    assert len(result) == 1
+    _, ev, changes = result[0]
+    assert ev.src_path == 'a.py'
+    assert list(changes) == ['a.py', 'b.py']
@@ -0,0 +1,127 @@
+import os.path as op
+
+from foremon.app import AUTO_RELOAD_ALIAS, Foremon
+from foremon.config import *
+from foremon.configcache import ConfigCache
+from foremon.discover import *
+from pytest_mock.plugin import MockerFixture
+
+from .fixtures import *
+
+
+@pytest.fixture
+def monorepo(tempfiles: Tempfiles, monkeypatch) -> str:
+    monkeypatch.setenv('XDG_CACHE_HOME', tempfiles.make_dir('cache'))
+    tempfiles.make_file('repo/pyproject.toml', """
+    [tool.foremon]
+    scripts = ["echo root"]
+    include = ["packages/*", "tools/lint/pyproject.toml"]
+    """)
+    tempfiles.make_file('repo/packages/api/pyproject.toml', """
+    [tool.foremon]
+    scripts = ["echo api"]
+    paths = ["src"]
+
+        [tool.foremon.test]
+        scripts = ["pytest"]
+        paths = ["src", "tests"]
+        cwd = "tests"
+    """)
+    tempfiles.make_file('repo/packages/web/pyproject.toml', """
+    [tool.poetry]
+    name = "web"
+    """)
+    tempfiles.make_file('repo/packages/broken/pyproject.toml', """
+    [tool.foremon]
+    scripts = "not a list
+    """)
+    tempfiles.make_file('repo/packages/docs/index.md')
+    tempfiles.make_file('repo/tools/lint/pyproject.toml', """
+    [tool.foremon]
+    scripts = ["flake8"]
+    """)
+    tempfiles.make_files(['repo/packages/api/src/app.py', 'repo/packages/api/tests/test_app.py',
+                          'repo/tools/lint/lint.py'])
+    return op.join(tempfiles.root, 'repo')
+
+
+def test_find_package_configs(monorepo: str):
+    root = op.join(monorepo, 'pyproject.toml')
+    files = find_package_configs(monorepo, ['packages/*', 'tools/**/pyproject.toml', '*'],
+                                 exclude=[root])
+    assert [op.relpath(f, monorepo) for f in files] == [
+        'packages/api/pyproject.toml', 'packages/broken/pyproject.toml',
+        'packages/web/pyproject.toml', 'tools/lint/pyproject.toml']
+
+
+def test_merge_packages(monorepo: str, output: CapLines):
+    config = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    scripts = ["echo root"]
+        [tool.foremon.docs]
+        scripts = ["mkdocs build"]
+    """).tool.foremon
+    packages = load_packages(monorepo, ['packages/*', 'tools/*'], ConfigCache())
+    assert [name for name, _ in packages] == ['packages/api', 'tools/lint']
+    assert output.stderr_expect('cannot load .*packages/broken/pyproject.toml, skipped')
+
+    assert merge_packages(config, monorepo, packages) == 3
+    configs = config.get_configs()
+    assert [c.alias for c in configs] == [
+        '', 'docs', 'packages/api', 'packages/api:test', 'tools/lint']
+    assert [c.order for c in configs] == [0, 1, 2, 3, 4]
+
+    api = op.join(monorepo, 'packages/api')
+    assert configs[2].cwd == api
+    assert configs[2].paths == [op.join(api, 'src')]
+    assert configs[3].cwd == op.join(api, 'tests')
+    assert configs[3].paths == [op.join(api, 'src'), op.join(api, 'tests')]
+    assert configs[4].paths == [op.join(monorepo, 'tools/lint')]
+
+
+def test_packages_cached(monorepo: str):
+    cache = ConfigCache()
+    load_packages(monorepo, ['packages/*'], cache)
+    assert sorted(op.relpath(f, monorepo) for f in cache.memory) == [
+        'packages/api/pyproject.toml', 'packages/web/pyproject.toml']
+    loaded = [cache.load(f)[1] for f in cache.memory]
+    assert all(loaded)
+
+
+def test_app_includes_packages(monorepo: str, output: CapLines, mocker: MockerFixture):
+    mocker.patch('foremon.app.Foremon.get_pipe', lambda _: None)
+    mocker.patch('foremon.app.Foremon._run')
+    options = ForemonOptions(config_file=op.join(monorepo, 'pyproject.toml'),
+                             use_all=True, verbose=True, no_guess=True)
+    app = Foremon(options)
+    assert app.run_forever() == 0
+    assert sorted(t.name for t in app.tasks) == sorted([
+        AUTO_RELOAD_ALIAS, 'default', 'packages/api', 'packages/api:test', 'tools/lint'])
+    assert output.stderr_expect(r'included 3 configs from 2 packages in [\d.]+ms')
+
+    # every package is served by the same observer
+    observers = {app.monitor.watch_sets[t].observer for t in app.tasks}
+    assert observers == {app.monitor.observer}
+
+
+def test_app_reloads_package(monorepo: str, tempfiles: Tempfiles, mocker: MockerFixture):
+    mocker.patch('foremon.app.Foremon.get_pipe', lambda _: None)
+    mocker.patch('foremon.app.Foremon._run')
+    options = ForemonOptions(config_file=op.join(monorepo, 'pyproject.toml'),
+                             use_all=True, no_guess=True)
+    app = Foremon(options)
+    app.run_forever()
+    before = {task.name: task for task in app.tasks}
+
+    tempfiles.make_file('repo/tools/lint/pyproject.toml', """
+    [tool.foremon]
+    scripts = ["flake8 --max-line-length=100"]
+    """)
+    queue = mocker.patch.object(app.monitor, 'queue_task_event')
+    app.reload()
+    after = {task.name: task for task in app.tasks}
+
+    assert [c.args[0].name for c in queue.call_args_list] == ['tools/lint']
+    assert after['tools/lint'].config.scripts == ['flake8 --max-line-length=100']
+    for name in ('default', 'packages/api', 'packages/api:test'):
+        assert after[name] is before[name]
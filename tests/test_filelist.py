@@ -0,0 +1,79 @@
+import asyncio
+import os.path as op
+
+from foremon.config import *
+from foremon.filelist import *
+from foremon.handler import TaskEventHandler
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+from .fixtures import *
+
+
+def test_filelist_run(tempfiles: Tempfiles):
+    tempfiles.make_dir('a')
+    files = run_files_from("printf 'a/x.py\\n\\n/abs/y.py\\n'", tempfiles.root)
+    assert files == [op.join(tempfiles.root, 'a/x.py'), '/abs/y.py']
+
+
+def test_filelist_run_fails(output: CapLines, tempfiles: Tempfiles):
+    tempfiles.make_dir(tempfiles.root)
+    assert run_files_from('exit 3', tempfiles.root) == []
+    assert output.stderr_expect('.*cannot list files with `exit 3`, exited 3')
+
+
+def test_filelist_update():
+    files = FileList('true', '.')
+    assert files.update(['/a/x', '/b/y']) == ({'/a/x', '/b/y'}, set())
+    assert files.update(['/a/x', '/a/z']) == ({'/a/z'}, {'/b/y'})
+    assert files.directories == {'/a'}
+    assert '/a/z' in files
+
+
+def list_monitor(tempfiles: Tempfiles):
+    monitor = make_monitor(tempfiles, paths=['does-not-exist'], events=['created', 'modified'],
+                           files_from=f'cat {tempfiles.root}/files.txt')
+    task, = monitor.all_tasks
+    accepted = []
+    monitor._accept_event = lambda task, ev: accepted.append(ev.src_path)
+    return monitor, task, accepted
+
+
+def test_filelist_monitor_watches(tempfiles: Tempfiles):
+    tempfiles.make_file('files.txt', 'a/x.py\nb/c/y.py\n')
+    x = tempfiles.make_file('a/x.py')
+    tempfiles.make_file('b/c/y.py')
+    monitor, task, accepted = list_monitor(tempfiles)
+
+    keys = sorted(monitor.watch_sets[task].watches)
+    assert keys == [(op.join(tempfiles.root, 'a'), False),
+                    (op.join(tempfiles.root, 'b/c'), False)]
+
+    handler = monitor.watch_sets[task].handler
+    assert isinstance(handler, TaskEventHandler)
+    events = []
+    handler.callback = lambda task, ev: events.append(ev.src_path)
+    handler.dispatch(FileModifiedEvent(x))
+    handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, 'a/other.py')))
+    assert events == [x]
+    monitor.reset()
+
+
+async def test_filelist_monitor_refresh(output: CapLines, tempfiles: Tempfiles):
+    tempfiles.make_file('files.txt', 'a/x.py\n')
+    tempfiles.make_file('a/x.py')
+    monitor, task, accepted = list_monitor(tempfiles)
+
+    new = tempfiles.make_file('d/new.py')
+    tempfiles.make_file('files.txt', 'a/x.py\nd/new.py\n')
+    monitor._refresh_file_list(task, FileCreatedEvent(new))
+    # shares the pending refresh
+    monitor._refresh_file_list(task, FileCreatedEvent(new + '.tmp'))
+    assert len(monitor.unlisted_events[task]) == 2
+
+    await asyncio.sleep(0.2)
+    assert new in monitor.file_lists[task]
+    assert (op.join(tempfiles.root, 'd'), False) in monitor.watch_sets[task]
+    assert output.stderr_expect('.*files of default changed, 1 added and 0 removed')
+    # The event which started the refresh is not lost
+    assert accepted == [new]
+    monitor.reset()
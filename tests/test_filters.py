@@ -0,0 +1,101 @@
+import asyncio
+import os
+import time
+
+from foremon.filters import ContentFilter
+from watchdog.events import DirModifiedEvent, FileDeletedEvent, FileModifiedEvent
+
+from .fixtures import *
+
+
+def test_filter_content_check(tempfiles: Tempfiles):
+    path = tempfiles.make_file('a.txt', 'hello')
+    f = ContentFilter(lambda *_: None)
+
+    # Nothing to compare to
+    assert f.check(path)
+    # Same observation, same answer
+    assert f.check(path)
+
+    os.utime(path, (1, 1))
+    assert not f.check(path)
+
+    tempfiles.make_file('a.txt', 'world')
+    assert f.check(path)
+
+    assert f.check(path + '.missing')
+
+
+def test_filter_content_bounded(tempfiles: Tempfiles):
+    f = ContentFilter(lambda *_: None, size=2)
+    for name in 'abc':
+        f.check(tempfiles.make_file(name, name))
+    assert len(f.digests) == 2
+    assert list(map(os.path.basename, f.digests)) == ['b', 'c']
+
+
+async def test_filter_content_submit(tempfiles: Tempfiles):
+    path = tempfiles.make_file('a.txt', 'hello')
+    result = []
+    f = ContentFilter(lambda task, ev: result.append(ev))
+
+    async def submit(ev):
+        f.submit('task', ev)
+        await asyncio.sleep(0.1)
+
+    await submit(FileModifiedEvent(path))
+    os.utime(path, (1, 1))
+    await submit(FileModifiedEvent(path))
+    # Events which are not checked pass straight through
+    f.submit('task', FileDeletedEvent(path))
+    f.submit('task', DirModifiedEvent(tempfiles.root))
+    f.shutdown()
+
+    assert [ev.event_type for ev in result] == ['modified', 'deleted', 'modified']
+
+
+async def test_filter_content_path_order(tempfiles: Tempfiles):
+    a, b = tempfiles.make_file('a.txt', 'a'), tempfiles.make_file('b.txt', 'b')
+    result = []
+    f = ContentFilter(lambda task, ev: result.append((ev.event_type, ev.src_path)))
+    delays = [0.2, 0.0]
+
+    def check(path: str) -> bool:
+        # the first hash of a is slower than everything after it
+        if path == a and delays:
+            time.sleep(delays.pop(0))
+        return True
+
+    f.check = check
+    f.submit('task', FileModifiedEvent(a))
+    f.submit('task', FileModifiedEvent(a))
+    f.submit('task', FileDeletedEvent(a))
+    f.submit('task', FileModifiedEvent(b))
+    while len(result) < 4:
+        await asyncio.sleep(0.01)
+    f.shutdown()
+
+    # other paths do not wait for a
+    assert result == [('modified', b), ('modified', a), ('modified', a), ('deleted', a)]
+    assert f.pending == {}
+
+
+async def test_filter_content_shutdown(tempfiles: Tempfiles):
+    path = tempfiles.make_file('a.txt', 'a')
+    result = []
+    errors = []
+    asyncio.get_event_loop().set_exception_handler(lambda loop, context: errors.append(context))
+    f = ContentFilter(lambda task, ev: result.append(ev))
+
+    def check(path: str) -> bool:
+        time.sleep(0.1)
+        return True
+
+    f.check = check
+    f.submit('task', FileModifiedEvent(path))
+    # the check is still running
+    f.shutdown()
+    await asyncio.sleep(0.2)
+
+    assert errors == []
+    assert result == []
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import os.path as op
+import time
+
+import pytest
+from foremon.config import *
+from foremon.gitignore import *
+from foremon.handler import TaskEventHandler
+from foremon.multiplex import MultiplexedObserver
+from foremon.scan import PathFilter, walk_dirs_parallel
+from foremon.task import ScriptTask
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+from .fixtures import *
+
+RULES = """
+# comment
+*.log
+!keep.log
+build/
+/top.txt
+docs/**/*.md
+out/**
+\\#hash
+[ab].txt
+"""
+
+
+@pytest.mark.parametrize('path,is_dir,expect', [
+    ('a.log', False, True),
+    ('src/deep/a.log', False, True),
+    ('src/keep.log', False, False),
+    ('build', True, True),
+    ('build', False, None),
+    ('src/build', True, True),
+    ('top.txt', False, True),
+    ('src/top.txt', False, None),
+    ('docs/a.md', False, True),
+    ('docs/x/y/a.md', False, True),
+    ('src/docs/a.md', False, None),
+    ('out/x/y', False, True),
+    ('out', True, None),
+    ('#hash', False, True),
+    ('a.txt', False, True),
+    ('c.txt', False, None),
+])
+def test_gitignore_rules(path: str, is_dir: bool, expect):
+    assert GitIgnore('/', RULES.splitlines()).match(path, is_dir) is expect
+
+
+def make_tree(tempfiles: Tempfiles) -> str:
+    tempfiles.make_file('.git/info/exclude', 'secret/\n')
+    tempfiles.make_file('.gitignore', '*.tmp\nnode_modules/\ndist/\n')
+    tempfiles.make_file('pkg/.gitignore', '!keep.tmp\n*.gen.py\n')
+    tempfiles.make_files([
+        'src/a.py', 'src/a.tmp', 'pkg/keep.tmp', 'pkg/b.gen.py', 'secret/key.py',
+        'node_modules/lib/index.js', 'dist/keep.tmp'])
+    return op.realpath(tempfiles.root)
+
+
+def test_ignore_tree(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    tree = get_ignore_tree(op.join(root, 'src'))
+    assert tree.root == root
+    assert get_ignore_tree(op.join(root, 'pkg')) is tree
+
+    def ignored(path, is_dir=False):
+        return tree.is_ignored(op.join(root, path), is_dir)
+
+    assert not ignored('src/a.py')
+    assert ignored('src/a.tmp')
+    # a deeper file takes precedence
+    assert not ignored('pkg/keep.tmp')
+    assert ignored('pkg/b.gen.py')
+    assert not ignored('src/b.gen.py')
+    assert ignored('secret', True)
+    assert ignored('secret/key.py')
+    assert ignored('node_modules/lib/index.js')
+    assert ignored('dist/keep.tmp')
+
+
+def test_ignore_tree_reload(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    tree = IgnoreTree(root)
+    path = op.join(root, 'src/a.py')
+    assert not tree.is_ignored(path)
+
+    tempfiles.make_file('src/.gitignore', 'a.py\n')
+    # compiled rules are kept until the file is reported changed
+    assert not tree.is_ignored(path)
+    tree.reload(op.join(root, 'src/.gitignore'))
+    assert tree.is_ignored(path)
+
+
+def test_ignore_vcs_prunes(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    config = make_config(tempfiles, paths=[root], ignore_vcs=True)
+    path_filter = PathFilter.from_config(config)
+    dirs = sorted(op.relpath(p, root)
+                  for p in walk_dirs_parallel(root, path_filter.prune))
+    assert dirs == ['pkg', 'src']
+    assert path_filter.match(op.join(root, 'src/a.py'))
+    assert not path_filter.match(op.join(root, 'src/a.tmp'))
+
+    config.ignore_vcs = False
+    assert PathFilter.from_config(config).vcs_ignore is None
+
+
+def test_ignore_vcs_events(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    config = make_config(tempfiles, paths=[root], ignore_vcs=True)
+    task = ScriptTask(config)
+    seen = []
+    changed = []
+    handler = TaskEventHandler(task, lambda task, ev: seen.append(op.relpath(ev.src_path, root)),
+                               vcs_ignore=VcsIgnore.from_paths(config.paths),
+                               on_ignore_change=changed.append)
+
+    for path in ('src/a.py', 'src/a.tmp', 'pkg/keep.tmp', 'node_modules/lib/index.js'):
+        handler.dispatch(FileModifiedEvent(op.join(root, path)))
+    assert seen == ['src/a.py', 'pkg/keep.tmp']
+    assert changed == []
+
+    tempfiles.make_file('src/.gitignore', 'a.py\n')
+    handler.dispatch(FileCreatedEvent(op.join(root, 'src/.gitignore')))
+    assert changed == [task]
+    seen.clear()
+    handler.dispatch(FileModifiedEvent(op.join(root, 'src/a.py')))
+    assert seen == []
+
+
+@pytest.mark.skipif(not op.exists('/proc/self/task'), reason='inotify is only available on linux')
+async def test_ignore_vcs_rewalk(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    monitor = make_monitor(tempfiles, paths=[root], ignore_vcs=True)
+    observer = monitor.observer
+    if not isinstance(observer, MultiplexedObserver):
+        pytest.skip('requires inotify')
+
+    def watched():
+        emitter, = [e for e in observer.emitters if e.watch.path == root]
+        # copied at once, the walker may add watches meanwhile
+        paths = list(emitter._inotify.inotify._wd_for_path)
+        return sorted(op.relpath(os.fsdecode(p), root) for p in paths)
+
+    observer.start()
+    try:
+        assert observer.walker.wait(2.0)
+        assert watched() == ['.', 'pkg', 'src']
+        with open(op.join(root, '.gitignore'), 'w') as fd:
+            fd.write('node_modules/\n')
+        # the rewalk starts once the event for .gitignore arrives
+        deadline = time.monotonic() + 5.0
+        while 'dist' not in watched() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        assert observer.walker.wait(2.0)
+        assert watched() == ['.', 'dist', 'pkg', 'src']
+    finally:
+        observer.stop()
+        observer.join()
+    monitor.reset()
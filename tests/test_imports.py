@@ -0,0 +1,149 @@
+import os
+import os.path as op
+import pickle
+
+from foremon.config import *
+from foremon.imports import *
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+
+from .fixtures import *
+
+
+def make_project(tempfiles: Tempfiles) -> None:
+    tempfiles.make_file('main.py', 'import pkg.a\n')
+    tempfiles.make_file('pkg/__init__.py', '')
+    tempfiles.make_file('pkg/__main__.py', 'from .a import run\n')
+    tempfiles.make_file('pkg/a.py', 'import os\nfrom . import b\n')
+    tempfiles.make_file('pkg/b.py', 'def f():\n    from .sub import c\n')
+    tempfiles.make_file('pkg/sub/c.py', '')
+    tempfiles.make_file('pkg/unused.py', 'import pkg.a\n')
+
+
+def test_imports_parse(tempfiles: Tempfiles):
+    path = tempfiles.make_file(
+        'x.py', 'import a.b, c\nfrom d import e\nfrom .. import f\nfrom . import *\n')
+    assert parse_imports(path) == [
+        (0, 'a.b'), (0, 'c'), (0, 'd'), (0, 'd.e'), (2, ''), (2, 'f'), (1, '')]
+
+    bad = tempfiles.make_file('bad.py', 'import (')
+    assert parse_imports(bad) == []
+
+
+@pytest.mark.parametrize('script, entries', [
+    ('python main.py', ['main.py']),
+    ('python -u -m pkg', ['pkg/__init__.py', 'pkg/__main__.py']),
+    ("python -c 'from pkg.a import run; run()'", ['pkg/__init__.py', 'pkg/a.py']),
+    ('make all', []),
+])
+def test_imports_entry_files(tempfiles: Tempfiles, script, entries):
+    make_project(tempfiles)
+    config = make_config(tempfiles, scripts=[script], paths=[tempfiles.root], follow_imports=True)
+    expected = [op.join(tempfiles.root, e) for e in entries]
+    assert guess_entry_files(config) == expected
+
+
+def test_imports_closure(tempfiles: Tempfiles):
+    make_project(tempfiles)
+    config = make_config(tempfiles, scripts=['python main.py'], paths=[tempfiles.root],
+                         follow_imports=True)
+    graph = ImportGraph(guess_entry_files(config), get_import_roots(config))
+
+    def rel(paths):
+        return sorted(op.relpath(p, tempfiles.root) for p in paths)
+
+    assert rel(graph.closure) == [
+        'main.py', 'pkg/__init__.py', 'pkg/a.py', 'pkg/b.py', 'pkg/sub/c.py']
+    assert op.join(tempfiles.root, 'pkg/unused.py') not in graph
+
+    # Only the modified file is parsed again
+    parsed = dict(graph.imports)
+    unused = tempfiles.make_file('pkg/a.py', 'from . import unused\n')
+    graph.update(FileModifiedEvent(unused))
+    assert rel(graph.closure) == [
+        'main.py', 'pkg/__init__.py', 'pkg/a.py', 'pkg/unused.py']
+    assert all(graph.imports[p] is parsed[p] for p in parsed
+               if not p.endswith('a.py'))
+
+    # An unchanged import list keeps the closure
+    closure = graph.closure
+    tempfiles.make_file('pkg/a.py', 'from . import unused\nx = 1\n')
+    graph.update(FileModifiedEvent(op.join(tempfiles.root, 'pkg/a.py')))
+    assert graph.closure is closure
+
+
+def test_imports_is_related(tempfiles: Tempfiles):
+    make_project(tempfiles)
+    config = make_config(tempfiles, scripts=['python main.py'], paths=[tempfiles.root],
+                         follow_imports=True)
+    graph = ImportGraph(guess_entry_files(config), get_import_roots(config))
+    root = tempfiles.root
+
+    assert graph.is_related(FileModifiedEvent(op.join(root, 'pkg/b.py')))
+    assert not graph.is_related(FileModifiedEvent(op.join(root, 'pkg/unused.py')))
+    assert graph.is_related(FileModifiedEvent(op.join(root, 'data.json')))
+
+    # A deleted module was imported before the event
+    path = op.join(root, 'pkg/sub/c.py')
+    os.remove(path)
+    assert graph.is_related(FileDeletedEvent(path))
+    assert path not in graph
+
+    # A created module which resolves an import
+    tempfiles.make_file('pkg/sub/c.py', '')
+    assert graph.is_related(FileCreatedEvent(path))
+
+
+async def test_imports_monitor_drops_unrelated(output: CapLines, tempfiles: Tempfiles):
+    make_project(tempfiles)
+    monitor = make_monitor(tempfiles, scripts=['python main.py'], paths=[tempfiles.root],
+                           follow_imports=True)
+    task, = monitor.all_tasks
+
+    accepted = []
+    monitor._accept_event = lambda task, ev: accepted.append(ev.src_path)
+
+    used = op.join(tempfiles.root, 'pkg/b.py')
+    unused = op.join(tempfiles.root, 'pkg/unused.py')
+    monitor.submit_event(task, FileModifiedEvent(unused))
+    monitor.submit_event(task, FileModifiedEvent(used))
+    assert accepted == [used]
+    assert output.stderr_expect('.*unused.py is not imported by default, ignored')
+
+
+def test_imports_auto_paths_config():
+    config = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    paths = "auto"
+
+        [tool.foremon.listed]
+        paths = ["auto", "src"]
+    """).tool.foremon
+    assert config.auto_paths
+    assert config.paths == []
+
+    # in a list `auto` is a literal path
+    listed = config.configs[0]
+    assert not listed.auto_paths
+    assert listed.paths == ['auto', 'src']
+    assert pickle.loads(pickle.dumps(config)).auto_paths
+
+
+async def test_imports_auto_paths(output: CapLines, tempfiles: Tempfiles):
+    make_project(tempfiles)
+    tempfiles.make_file('other/d.py', '')
+    tempfiles.make_file('unrelated/e.py', '')
+    monitor = make_monitor(tempfiles, scripts=['python main.py'], paths=AUTO_PATHS)
+    task, = monitor.all_tasks
+
+    def watched():
+        return sorted(op.relpath(p, tempfiles.root)
+                      for p, _ in monitor.watch_sets[task].watches)
+
+    assert watched() == ['.', 'pkg', 'pkg/sub']
+    assert all(not recursive for _, recursive in monitor.watch_sets[task].watches)
+
+    path = tempfiles.make_file('pkg/b.py', 'import other.d\n')
+    monitor.submit_event(task, FileModifiedEvent(path))
+    assert watched() == ['.', 'other', 'pkg']
+    assert output.stderr_expect('.*watching 1 more and 1 fewer directories')
+    monitor.reset()
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import os.path as op
+from typing import Optional
+
+from foremon.config import *
+from foremon.handler import TaskEventHandler
+from foremon.links import *
+from foremon.multiplex import MultiplexedObserver
+from foremon.scan import scan_config
+from foremon.task import ScriptTask
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+
+from .fixtures import *
+
+
+def make_tree(tempfiles: Tempfiles) -> str:
+    """
+    Two services link the same shared library, one links a directory outside
+    of the project and the library links back to its parent.
+    """
+    tempfiles.make_files([
+        'project/shared/lib/util.py', 'project/services/a/main.py',
+        'project/services/b/main.py', 'external/vendor.py'])
+    root = op.realpath(tempfiles.root)
+    project = op.join(root, 'project')
+    os.symlink('../../shared/lib', op.join(project, 'services/a/lib'))
+    os.symlink(op.join(project, 'shared/lib'), op.join(project, 'services/b/lib'))
+    os.symlink(op.join(root, 'external'), op.join(project, 'services/a/vendor'))
+    os.symlink('..', op.join(project, 'shared/lib/parent'))
+    return root
+
+
+def test_links_build(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    project = op.join(root, 'project')
+    links = LinkMap.build([project], lambda p: False)
+
+    # the shared library is inside the project and watched with it
+    assert links.watched == [project, op.join(root, 'external')]
+    assert links.followed == 3
+    assert links.watch_keys(True) == [(p, True) for p in links.watched]
+
+    util = op.join(project, 'shared/lib/util.py')
+    assert sorted(links.logical_paths(util)) == [
+        op.join(project, 'services/a/lib/util.py'),
+        op.join(project, 'services/b/lib/util.py'),
+        util]
+    assert links.logical_paths(op.join(root, 'external/vendor.py')) == [
+        op.join(project, 'services/a/vendor/vendor.py')]
+
+
+def test_links_dedup_roots(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    lib = op.join(root, 'project/shared/lib')
+    alias = op.join(root, 'project/services/a/lib')
+    links = LinkMap.build([alias, lib], lambda p: False)
+
+    # the same inode listed twice is watched once
+    assert links.watched == [lib]
+    assert sorted(links.logical_paths(op.join(lib, 'util.py'))) == [
+        op.join(alias, 'util.py'), op.join(lib, 'util.py')]
+
+
+def test_links_cycle(tempfiles: Tempfiles):
+    tempfiles.make_files(['a/x.py', 'b/y.py'])
+    root = op.realpath(tempfiles.root)
+    a, b = op.join(root, 'a'), op.join(root, 'b')
+    os.symlink(b, op.join(a, 'to_b'))
+    os.symlink(a, op.join(b, 'to_a'))
+    links = LinkMap.build([a], lambda p: False)
+
+    assert sorted(links.watched) == [a, b]
+    # each link is followed once per path
+    assert sorted(links.logical_paths(op.join(a, 'x.py'))) == [
+        op.join(a, 'to_b/to_a/x.py'), op.join(a, 'x.py')]
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_links_scan_config(tempfiles: Tempfiles, workers: Optional[int]):
+    root = make_tree(tempfiles)
+    project = op.join(root, 'project')
+    config = make_config(tempfiles, paths=[project], patterns=['*.py'], follow_symlinks=True)
+
+    # every logical path of each file, the link to the parent ends
+    files = sorted(op.relpath(path, project) for path, _ in scan_config(config, workers))
+    assert files == [
+        'services/a/lib/util.py', 'services/a/main.py', 'services/a/vendor/vendor.py',
+        'services/b/lib/util.py', 'services/b/main.py', 'shared/lib/util.py']
+
+    config.follow_symlinks = False
+    files = sorted(op.relpath(path, project) for path, _ in scan_config(config, workers))
+    assert files == ['services/a/main.py', 'services/b/main.py', 'shared/lib/util.py']
+
+
+def test_links_map_event(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    project = op.join(root, 'project')
+    config = make_config(tempfiles, paths=[project], ignore=['shared/lib/*'],
+                         follow_symlinks=True)
+    task = ScriptTask(config)
+    links = LinkMap.build(config.paths, lambda p: False)
+    seen = []
+    handler = TaskEventHandler(task, lambda task, ev: seen.append(ev), links=links)
+
+    handler.dispatch(FileModifiedEvent(op.join(project, 'shared/lib/util.py')))
+    assert sorted(ev.src_path for ev in seen) == [
+        op.join(project, 'services/a/lib/util.py'),
+        op.join(project, 'services/b/lib/util.py')]
+
+    seen.clear()
+    handler.dispatch(FileMovedEvent(op.join(root, 'external/vendor.py'),
+                                    op.join(root, 'external/old.py')))
+    moved, = seen
+    assert moved.src_path == op.join(project, 'services/a/vendor/vendor.py')
+    assert moved.dest_path == op.join(project, 'services/a/vendor/old.py')
+
+
+async def test_monitor_follows_symlinks(tempfiles: Tempfiles):
+    root = make_tree(tempfiles)
+    service = op.join(root, 'project/services/a')
+    monitor = make_monitor(tempfiles, paths=[service], follow_symlinks=True)
+    task, = monitor.all_tasks
+    assert sorted(monitor.watch_sets[task].watches) == [
+        (op.join(root, 'external'), True),
+        (service, True),
+        (op.join(root, 'project/shared/lib'), True)]
+
+    queued = []
+    monitor.queue_task_event = lambda task, ev, changes: queued.append(set(changes))
+    monitor.debounce.callback = monitor.queue_task_event
+    for observer in monitor.observers:
+        observer.start()
+    try:
+        if isinstance(monitor.observer, MultiplexedObserver):
+            monitor.observer.walker.wait(2.0)
+        with open(op.join(root, 'project/shared/lib/util.py'), 'w') as fd:
+            fd.write('changed')
+        await asyncio.sleep(0.5)
+    finally:
+        for observer in monitor.observers:
+            observer.stop()
+            observer.join()
+
+    assert queued == [{op.join(service, 'lib/util.py')}]
+    monitor.reset()
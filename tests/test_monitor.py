@@ -1,8 +1,9 @@
 from foremon.display import display_debug
-from foremon.config import PyProjectConfig
+from foremon.config import RESTART_ACTION, PyProjectConfig
 from foremon.monitor import Monitor
 from foremon.task import ScriptTask
 from pytest_mock.plugin import MockerFixture
+from watchdog.events import FileModifiedEvent
 
 from .cli_fixtures import *
 from .fixtures import *
@@ -132,3 +133,96 @@ async def test_monitor_signaled(output: CapLines, amonitor: Monitor, mocker: Moc
     mocker.patch('foremon.queue.queueiter.__init__', raiser)
     await amonitor.start_interactive()
     assert output.stderr_expect(text)
+
+
+async def test_monitor_waits_for_ready(output: CapLines, tempfiles: Tempfiles):
+
+    trigger = tempfiles.make_file('trigger')
+
+    conf = PyProjectConfig.parse_toml(f"""
+        [tool.foremon]
+        paths = ["{trigger}"]
+        ready_pattern = "serving"
+        scripts = ["echo serving; sleep 5"]
+
+            [tool.foremon.downstream]
+            paths = ["{trigger}"]
+            scripts = ["echo downstream"]
+        """).tool.foremon
+
+    monitor = Monitor(pipe=None)
+    monitor.add_task(ScriptTask(conf))
+    monitor.add_task(ScriptTask(conf.configs[0]))
+
+    def do_exit():
+        monitor.handle_input('exit')
+
+    # The server never exits on its own, downstream only runs if the queue is
+    # released once the server is ready.
+    monitor.loop.call_later(1.0, do_exit)
+    await monitor.start_interactive()
+    assert output.stdout_expect('serving')
+    assert output.stdout_expect('downstream')
+
+
+async def test_monitor_action_sends_signal(output: CapLines, tempfiles: Tempfiles):
+
+    trigger = tempfiles.make_file('trigger')
+
+    monitor = monitor_from_toml(f"""
+        [tool.foremon]
+        paths = ["{trigger}"]
+        scripts = ["trap 'echo reloaded' HUP; echo up; while true; do sleep 0.05; done"]
+            [tool.foremon.actions]
+            "*.conf" = "SIGHUP"
+        """)
+
+    task = list(monitor.all_tasks)[0]
+
+    def do_exit():
+        monitor.handle_input('exit')
+
+    def do_change():
+        # Not matched by an action, restarts
+        assert monitor.get_actions(task, ['app.py', '/srv/app.conf']) == {RESTART_ACTION}
+        monitor.queue_task_event(task, FileModifiedEvent('/srv/app.conf'))
+        monitor.loop.call_later(0.3, do_exit)
+
+    monitor.loop.call_later(0.3, do_change)
+    await monitor.start_interactive()
+    assert output.stderr_expect('starting.*')
+    assert output.stderr_expect('sending SIGHUP to default')
+    assert not output.stderr_expect('starting.*')
+    assert output.stdout_expect('up')
+    assert output.stdout_expect('reloaded')
+
+
+def test_monitor_remove_task(tempfiles: Tempfiles):
+    src = tempfiles.make_dir('src')
+    config = PyProjectConfig.parse_toml(f"""
+        [tool.foremon]
+        paths = ["{src}"]
+        scripts = ["true"]
+        """).tool.foremon
+    monitor = Monitor(pipe=None)
+    first, second = ScriptTask(config), ScriptTask(config.copy(deep=True))
+    monitor.add_task(first)
+    monitor.add_task(second)
+    watch, = monitor.watch_sets[second].watches.values()
+    guard = monitor.vcs_guards.get(second)
+
+    monitor.remove_task(first)
+    assert monitor.all_tasks == {second}
+    assert first not in monitor.watch_sets
+    # shared watches and guards stay for the other task
+    handlers = monitor.observer._handlers[watch]
+    assert monitor.watch_sets[second].handler in handlers
+    assert len(handlers) == 1
+    if guard is not None:
+        assert any(guard in h for h in monitor.observer._handlers.values())
+
+    monitor.remove_task(second)
+    assert watch not in monitor.observer._handlers
+    assert not monitor.vcs_guards
+    if guard is not None:
+        assert not any(guard in h for h in monitor.observer._handlers.values())
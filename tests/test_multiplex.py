@@ -0,0 +1,270 @@
+import asyncio
+import os
+import os.path as op
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+import pytest
+from foremon.config import *
+from foremon.display import display_info
+from foremon.monitor import Monitor
+from foremon.multiplex import *
+from foremon.multiplex import _WAKE
+from foremon.scan import PathFilter, walk_dirs_parallel
+from foremon.task import ScriptTask
+from watchdog.events import FileModifiedEvent, FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from .fixtures import *
+
+pytestmark = [pytestmark, pytest.mark.skipif(
+    not hasattr(os, 'sched_getaffinity') or not op.exists('/proc/self/task'),
+    reason='inotify is only available on linux')]
+
+# Number of paths in the thread and wakeup comparison
+BENCH_PATHS = 30
+# Number of directories in the startup comparison
+BENCH_DIRS = int(os.environ.get('BENCH_DIRS', '2000'))
+# Seconds of the idle window, the full measurement uses IDLE_SECONDS=60
+IDLE_SECONDS = float(os.environ.get('IDLE_SECONDS', '3'))
+
+
+class Collect(FileSystemEventHandler):
+
+    def __init__(self):
+        self.events: List[FileSystemEvent] = []
+
+    def on_any_event(self, event: FileSystemEvent):
+        if not event.is_directory:
+            self.events.append(event)
+
+    def wait(self, event_type: str, timeout: float = 2.0) -> List[FileSystemEvent]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(e.event_type == event_type for e in self.events):
+                break
+            time.sleep(0.01)
+        return self.events
+
+
+def thread_ids() -> List[str]:
+    return os.listdir('/proc/self/task')
+
+
+def context_switches(tids: Optional[Iterable[str]] = None) -> int:
+    """
+    Voluntary context switches of the threads `tids` or every thread in this
+    process, a thread which wakes up from a timeout counts one.
+    """
+    total = 0
+    for tid in tids or thread_ids():
+        try:
+            with open(f'/proc/self/task/{tid}/status') as fd:
+                for line in fd:
+                    if line.startswith('voluntary_ctxt_switches'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def rss_kb() -> int:
+    with open('/proc/self/status') as fd:
+        for line in fd:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1])
+    return 0
+
+
+def test_multiplexed_events(tempfiles: Tempfiles):
+    dirs = [tempfiles.make_dir(f'd{i}') for i in range(3)]
+    handler = Collect()
+    observer = MultiplexedObserver()
+    for path in dirs:
+        observer.schedule(handler, path, recursive=True)
+    threads = threading.active_count()
+    observer.start()
+    try:
+        assert observer.walker.wait(2.0)
+        # the observer and the multiplexer
+        assert threading.active_count() == threads + 2
+        tempfiles.make_file('d0/a.txt')
+        tempfiles.make_file('d1/sub/b.txt')
+        os.rename(tempfiles.make_file('d2/c.txt'), op.join(dirs[2], 'd.txt'))
+        events = handler.wait('moved')
+    finally:
+        observer.stop()
+        observer.join()
+
+    kinds = [(e.event_type, op.basename(e.src_path)) for e in events]
+    assert ('created', 'a.txt') in kinds
+    assert ('created', 'b.txt') in kinds
+    # moves are paired within a watch
+    moved, = [e for e in events if e.event_type == 'moved']
+    assert op.basename(moved.src_path) == 'c.txt'
+    assert op.basename(moved.dest_path) == 'd.txt'
+    assert not observer.multiplexer.is_alive()
+
+
+def test_multiplexed_unschedule(tempfiles: Tempfiles):
+    path = tempfiles.make_dir('d')
+    handler = Collect()
+    observer = MultiplexedObserver()
+    observer.start()
+    try:
+        watch = observer.schedule(handler, path, recursive=False)
+        assert len(observer.multiplexer) == 1
+        observer.unschedule(watch)
+        assert len(observer.multiplexer) == 0
+        tempfiles.make_file('d/a.txt')
+        time.sleep(0.1)
+        assert handler.events == []
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def test_multiplexed_stop_pending_events(tempfiles: Tempfiles):
+    path = tempfiles.make_dir('d')
+    handler = Collect()
+    observer = MultiplexedObserver()
+    watch = observer.schedule(handler, path, recursive=False)
+    # an event not dispatched yet is compared with the wake up when stopping
+    pending = (FileModifiedEvent(op.join(path, 'a.txt')), watch)
+    observer.event_queue.put(pending)
+    observer.stop()
+    # watchdog may queue its own items when stopping, only these two matter
+    queued = list(observer.event_queue.queue)
+    assert pending in queued
+    assert any(item is _WAKE for item in queued)
+
+
+def test_walk_dirs_parallel(tempfiles: Tempfiles):
+    tempfiles.make_files(['a/b/c/x.txt', 'a/node_modules/d/y.txt', 'e/z.txt'])
+    path_filter = PathFilter(['*'], ['node_modules/*'])
+    dirs = sorted(op.relpath(p, tempfiles.root)
+                  for p in walk_dirs_parallel(tempfiles.root, path_filter.prune, workers=4))
+    assert dirs == ['a', 'a/b', 'a/b/c', 'e']
+
+
+def test_multiplexed_walk_prunes(tempfiles: Tempfiles):
+    tempfiles.make_files(['src/deep/a.txt', 'node_modules/pkg/b.txt'])
+    handler = Collect()
+    observer = MultiplexedObserver(workers=4)
+    observer.schedule(handler, tempfiles.root, recursive=True,
+                      path_filter=PathFilter(['*'], ['node_modules/*']))
+    observer.start()
+    try:
+        assert observer.walker.wait(2.0)
+        emitter, = observer.emitters
+        watched = sorted(op.relpath(os.fsdecode(p), tempfiles.root)
+                         for p in emitter._inotify.inotify._wd_for_path)
+        assert watched == ['.', 'src', 'src/deep']
+
+        tempfiles.make_file('node_modules/pkg/c.txt')
+        tempfiles.make_file('src/deep/d.txt')
+        events = handler.wait('modified')
+    finally:
+        observer.stop()
+        observer.join()
+
+    names = set(op.basename(e.src_path) for e in events)
+    assert 'd.txt' in names
+    assert 'c.txt' not in names
+
+
+def test_multiplexed_startup_benchmark(tempfiles: Tempfiles):
+    # half of the tree is ignored, like a node_modules next to the sources
+    for i in range(BENCH_DIRS):
+        top = 'src' if i % 2 else 'node_modules'
+        tempfiles.make_file(f'{top}/{i % 20}/{i}/file.txt')
+    path_filter = PathFilter(['*'], ['node_modules/*'])
+
+    for name in ('before', 'after'):
+        if name == 'before':
+            observer = Observer()
+            observer.schedule(Collect(), tempfiles.root, recursive=True)
+        else:
+            observer = MultiplexedObserver()
+            observer.schedule(Collect(), tempfiles.root, recursive=True,
+                              path_filter=path_filter)
+        started = time.monotonic()
+        observer.start()
+        start = time.monotonic() - started
+        if name == 'after':
+            observer.walker.wait()
+        walked = time.monotonic() - started
+        observer.stop()
+        observer.join()
+        display_info(f'{BENCH_DIRS} dirs {name}: start {start:.3f}s, watched {walked:.3f}s')
+    assert start < walked
+
+
+def measure(make: Callable, dirs: List[str]):
+    threads = threading.active_count()
+    rss = rss_kb()
+    observer = make()
+    handler = Collect()
+    for path in dirs:
+        observer.schedule(handler, path, recursive=True)
+    observer.start()
+    try:
+        time.sleep(0.2)
+        switches = context_switches()
+        time.sleep(1.0)
+        wakeups = context_switches() - switches
+        return threading.active_count() - threads, wakeups, rss_kb() - rss
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def test_multiplexed_benchmark(tempfiles: Tempfiles):
+    dirs = [tempfiles.make_dir(f'd{i}') for i in range(BENCH_PATHS)]
+
+    before = measure(Observer, dirs)
+    after = measure(MultiplexedObserver, dirs)
+    for name, (threads, wakeups, rss) in (('before', before), ('after', after)):
+        display_info(
+            f'{BENCH_PATHS} paths {name}: {threads} threads,'
+            f' {wakeups} wakeups/s, {rss} KiB rss')
+    assert after[0] == 2
+    assert after[0] < before[0]
+
+
+async def test_idle_wakeups(tempfiles: Tempfiles):
+    config = PyProjectConfig.parse_toml(f"""
+    [tool.foremon]
+    paths = ["{tempfiles.make_dir('src')}"]
+    scripts = ["true"]
+    """).tool.foremon
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(config)
+    monitor.add_task(task)
+    queued = []
+    monitor.queue_task_event = lambda task, ev=None, changes=None: queued.append(task)
+    monitor.debounce.callback = monitor.queue_task_event
+
+    before = set(thread_ids())
+    run = asyncio.ensure_future(monitor.start_interactive(run_on_start=False))
+    await asyncio.sleep(0.2)
+    # the threads started by the monitor and the thread running the loop
+    tids = set(thread_ids()) - before | {str(os.getpid())}
+
+    switches = context_switches(tids)
+    cpu = time.process_time()
+    await asyncio.sleep(IDLE_SECONDS)
+    cpu = time.process_time() - cpu
+    wakeups = context_switches(tids) - switches
+    display_info(f'{wakeups} wakeups of {len(tids)} threads and {cpu * 1000:.1f}ms cpu'
+                 f' over {IDLE_SECONDS:.0f}s idle')
+    # the loop wakes once to end the sleep
+    assert wakeups <= 2
+
+    tempfiles.make_file('src/a.py')
+    await asyncio.sleep(0.5)
+    assert queued == [task]
+
+    monitor.queue.put_nowait(None)
+    await run
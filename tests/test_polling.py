@@ -0,0 +1,127 @@
+import os
+import os.path as op
+
+from foremon.config import *
+from foremon.monitor import Monitor
+from foremon.polling import ShardedPollingEmitter
+from foremon.scan import PathFilter
+from foremon.task import ScriptTask
+from watchdog.observers.api import EventQueue
+from watchdog.observers.api import ObservedWatch
+
+from .fixtures import *
+
+
+def drain(queue: EventQueue):
+    events = []
+    while not queue.empty():
+        ev, _ = queue.get_nowait()
+        events.append((ev.event_type, op.basename(ev.src_path),
+                       op.basename(getattr(ev, 'dest_path', '') or '')))
+    return sorted(events)
+
+
+def make_emitter(path: str, recursive: bool = True, **kwargs):
+    queue = EventQueue()
+    emitter = ShardedPollingEmitter(
+        queue, ObservedWatch(path, recursive), interval=0.01, shards=2, **kwargs)
+    emitter.index()
+    return queue, emitter
+
+
+def test_polling_detects_changes(tempfiles: Tempfiles):
+    tempfiles.make_file('a.txt', 'a')
+    b = tempfiles.make_file('sub/b.txt', 'b')
+    c = tempfiles.make_file('sub/c.txt', 'c')
+    queue, emitter = make_emitter(tempfiles.root)
+    assert emitter.file_count == 3
+    assert drain(queue) == []
+
+    tempfiles.make_file('a.txt', 'changed')
+    os.remove(b)
+    os.rename(c, op.join(tempfiles.root, 'sub/d.txt'))
+    tempfiles.make_file('new/e.txt')
+
+    emitter.queue_events(0)
+    assert drain(queue) == [
+        ('created', 'e.txt', ''),
+        ('created', 'new', ''),
+        ('deleted', 'b.txt', ''),
+        ('modified', 'a.txt', ''),
+        ('moved', 'c.txt', 'd.txt'),
+    ]
+    assert emitter.scan_count == 1
+    assert emitter.scan_files == 3
+
+
+def test_polling_removed_dir(tempfiles: Tempfiles):
+    tempfiles.make_file('sub/deep/x.txt')
+    queue, emitter = make_emitter(tempfiles.root)
+    tempfiles.cleanup()
+    tempfiles.make_dir(tempfiles.root)
+
+    emitter.queue_events(0)
+    assert drain(queue) == [
+        ('deleted', 'deep', ''),
+        ('deleted', 'sub', ''),
+        ('deleted', 'x.txt', ''),
+    ]
+    assert emitter.file_count == 0
+
+
+def test_polling_prunes_ignored(tempfiles: Tempfiles):
+    tempfiles.make_file('build/out.o')
+    tempfiles.make_file('src/main.c')
+    path_filter = PathFilter(['*'], ['*/build/*'])
+    queue, emitter = make_emitter(tempfiles.root, path_filters=[path_filter])
+    assert emitter.file_count == 1
+
+    tempfiles.make_file('build/other.o')
+    emitter.queue_events(0)
+    assert drain(queue) == []
+
+    # Pruned only if every handler ignores it
+    emitter.path_filters.append(None)
+    emitter.queue_events(0)
+    assert ('created', 'build', '') in drain(queue)
+
+
+def test_polling_single_file(tempfiles: Tempfiles):
+    trigger = tempfiles.make_file('trigger')
+    tempfiles.make_file('other')
+    queue, emitter = make_emitter(trigger, recursive=False)
+    assert emitter.file_count == 1
+
+    tempfiles.make_file('other', 'x')
+    tempfiles.make_file('trigger', 'x')
+    emitter.queue_events(0)
+    assert drain(queue) == [('modified', 'trigger', '')]
+
+
+async def test_polling_monitor(output: CapLines, tempfiles: Tempfiles):
+    tempfiles.make_file('trigger')
+
+    conf = PyProjectConfig.parse_toml(f"""
+        [tool.foremon]
+        paths = ["{tempfiles.root}"]
+        scripts = ["echo ok"]
+        polling = true
+        poll_interval = 0.1
+        """).tool.foremon
+    monitor = Monitor(pipe=None)
+    monitor.add_task(ScriptTask(conf))
+    assert monitor.poller is not None
+    assert not monitor.observer.emitters
+
+    def do_exit():
+        monitor.handle_input('exit')
+
+    def do_change():
+        tempfiles.make_file('trigger', 'changed')
+        monitor.loop.call_later(0.5, do_exit)
+
+    monitor.loop.call_later(0.3, do_change)
+    await monitor.start_interactive()
+    assert output.stdout_expect('ok')
+    assert output.stdout_expect('ok')
+    assert not monitor.poller.is_alive()
@@ -0,0 +1,130 @@
+import asyncio
+import os.path as op
+import time
+from typing import List
+
+import pytest
+from foremon.config import *
+from foremon.monitor import Monitor
+from foremon.multiplex import MultiplexedObserver
+from foremon.settle import *
+from foremon.task import ScriptTask
+from watchdog.events import (FileCreatedEvent, FileDeletedEvent,
+                             FileModifiedEvent, FileSystemEvent,
+                             FileSystemEventHandler)
+
+from .fixtures import *
+
+
+def make_task(**config) -> ScriptTask:
+    return ScriptTask(ForemonConfig(scripts=['true'], **config))
+
+
+async def test_settle_waits_for_size(tempfiles: Tempfiles):
+    path = tempfiles.make_file('data.bin', '')
+    task = make_task(settle=0.1)
+    result = []
+    settle = SettleFilter(lambda task, ev: result.append(ev))
+
+    with open(path, 'a') as fd:
+        settle.submit(task, FileCreatedEvent(path), closes=False)
+        for _ in range(6):
+            fd.write('x' * 1024)
+            fd.flush()
+            settle.submit(task, FileModifiedEvent(path), closes=False)
+            await asyncio.sleep(0.05)
+        assert result == []
+        assert len(settle) == 1
+
+    await asyncio.sleep(0.35)
+    assert [(ev.event_type, ev.src_path) for ev in result] == [('closed', path)]
+    assert len(settle) == 0
+
+
+async def test_settle_native_close(tempfiles: Tempfiles):
+    path = tempfiles.make_file('data.bin', 'x')
+    task = make_task(settle=0.1)
+    result = []
+    settle = SettleFilter(lambda task, ev: result.append(ev.event_type))
+
+    # the close of the writer is awaited instead
+    settle.submit(task, FileModifiedEvent(path), closes=True)
+    settle.submit(task, FileClosedEvent(path), closes=True)
+    # a deleted file stops waiting
+    settle.submit(task, FileModifiedEvent(path), closes=False)
+    settle.submit(task, FileDeletedEvent(path), closes=False)
+    await asyncio.sleep(0.2)
+    assert result == ['closed', 'deleted']
+    assert len(settle) == 0
+
+
+class Closed(FileSystemEventHandler):
+
+    def __init__(self):
+        self.events: List[FileSystemEvent] = []
+
+    def dispatch(self, event: FileSystemEvent):
+        if event.event_type == EVENT_TYPE_CLOSED:
+            self.events.append(event)
+
+
+@pytest.mark.skipif(not op.exists('/proc/self/task'), reason='inotify is only available on linux')
+def test_multiplexed_close_events(tempfiles: Tempfiles):
+    root = tempfiles.make_dir('d')
+    handler = Closed()
+    observer = MultiplexedObserver(close_events=True)
+    observer.schedule(handler, root, recursive=True)
+    observer.start()
+    try:
+        with open(op.join(root, 'a.txt'), 'w') as fd:
+            fd.write('a')
+            fd.flush()
+            time.sleep(0.1)
+            assert handler.events == []
+        deadline = time.monotonic() + 2.0
+        while not handler.events and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        observer.stop()
+        observer.join()
+
+    assert [op.basename(e.src_path) for e in handler.events] == ['a.txt']
+
+
+@pytest.mark.parametrize('polling', [False, True])
+async def test_monitor_restarts_once_written(tempfiles: Tempfiles, polling: bool):
+    root = tempfiles.make_dir('d')
+    config = PyProjectConfig.parse_toml(f"""
+    [tool.foremon]
+    paths = ["{root}"]
+    events = ["closed"]
+    settle = 0.3
+    polling = {str(polling).lower()}
+    poll_interval = 0.1
+    scripts = ["true"]
+    """).tool.foremon
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(config)
+    monitor.add_task(task)
+    queued = []
+    monitor.queue_task_event = lambda task, ev, changes: queued.append(set(changes))
+    monitor.debounce.callback = monitor.queue_task_event
+
+    for observer in monitor.observers:
+        observer.start()
+    try:
+        path = op.join(root, 'dataset.csv')
+        with open(path, 'w') as fd:
+            for i in range(5):
+                fd.write(f'{i}\n' * 4096)
+                fd.flush()
+                await asyncio.sleep(0.1)
+            assert queued == []
+        await asyncio.sleep(1.0)
+    finally:
+        for observer in monitor.observers:
+            observer.stop()
+            observer.join()
+
+    assert queued == [{path}]
+    monitor.reset()
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import time
+
+from foremon.config import *
+from foremon.monitor import Monitor
+from foremon.scan import Glob, GlobSet, PathFilter, scan_dir, scan_dir_parallel, split_path
+from foremon.snapshot import *
+from foremon.snapshot import SNAPSHOT_MAGIC
+from foremon.task import ScriptTask
+
+from .fixtures import *
+
+
+# Settings of the configs snapshots are taken of
+SNAPSHOT = dict(snapshot=True, scripts=['echo ran'])
+
+
+def test_snapshot_parallel_scan(tempfiles: Tempfiles):
+    tempfiles.make_files([f'{d}/{s}/{f}.py' for d in 'abc' for s in 'xy' for f in 'mn'])
+    tempfiles.make_file('a/build/skip.py')
+    path_filter = PathFilter(['*.py'], ['*/build/*'])
+    serial = sorted(p for p, _ in scan_dir(tempfiles.root, path_filter))
+    parallel = sorted(p for p, _ in scan_dir_parallel(tempfiles.root, path_filter, workers=4))
+    assert len(serial) == 12
+    assert parallel == serial
+
+
+def test_globset_matches_globs():
+    patterns = ['*.py', '.*', '.git/*', '*/build/*', '/abs/*.py', 'a?c', '[ab]*']
+    paths = ['/a/b.py', '/r/.git/config', '/r/src/build/x.o', '/abs/q.py', '/abs/q/q.py',
+             '/q/abc', '/q/m.pyc', '/R/B.Py', '/r/.hidden', '/r/build']
+    for case_sensitive in (True, False):
+        for n in range(len(patterns) + 1):
+            globs = [Glob(p, case_sensitive) for p in patterns[:n]]
+            globset = GlobSet(patterns[:n], case_sensitive)
+            for path in paths:
+                parts = split_path(path)
+                assert globset.match(parts) == any(g.match(parts) for g in globs), path
+
+
+def test_snapshot_roundtrip(cache_dir: str, tempfiles: Tempfiles):
+    tempfiles.make_file('src/a.py')
+    config = make_config(tempfiles, **SNAPSHOT)
+    store = TreeSnapshot(config)
+    assert store.load() is None
+
+    snapshot = take_snapshot(config)
+    store.save(snapshot)
+    assert TreeSnapshot(config).load() == snapshot
+
+    # Other versions are not read
+    with open(store.path, 'rb') as fd:
+        data = fd.read()
+    with open(store.path, 'wb') as fd:
+        fd.write(data.replace(SNAPSHOT_MAGIC + b'\x01', SNAPSHOT_MAGIC + b'\x00'))
+    assert store.load() is None
+
+    with open(store.path, 'wb') as fd:
+        fd.write(SNAPSHOT_MAGIC + b'\x01garbage')
+    assert store.load() is None
+
+
+def test_snapshot_diff():
+    old = {'a': (1, 1, 1), 'b': (2, 2, 2), 'c': (3, 3, 3)}
+    new = {'a': (1, 1, 1), 'b': (2, 2, 5), 'd': (4, 4, 4)}
+    assert sorted(diff_snapshots(old, new)) == ['b', 'c', 'd']
+
+
+def test_snapshot_loads_quickly(cache_dir: str, tempfiles: Tempfiles):
+    config = make_config(tempfiles, **SNAPSHOT)
+    snapshot = {f'/project/src/pkg{i // 100}/module{i}.py': (i, i * 7, i * 1000000007)
+                for i in range(100000)}
+    store = TreeSnapshot(config)
+    store.save(snapshot)
+
+    started = time.monotonic()
+    assert store.load() == snapshot
+    assert time.monotonic() - started < 1.0
+
+
+async def test_snapshot_skips_unchanged(output: CapLines, cache_dir: str, tempfiles: Tempfiles):
+    src = tempfiles.make_file('src/a.py')
+    config = make_config(tempfiles, **SNAPSHOT)
+
+    def queued():
+        monitor = Monitor(pipe=None)
+        task = ScriptTask(config)
+        monitor.add_task(task)
+        tasks = []
+        monitor.queue_task_event = lambda task, ev=None: tasks.append(task)
+        monitor.queue_changed_tasks()
+        return monitor, task, len(tasks)
+
+    # Nothing to compare to on the first start
+    monitor, task, count = queued()
+    assert count == 1
+    await task.run()
+    monitor.reset()
+
+    monitor, _, count = queued()
+    assert count == 0
+    assert output.stderr_expect('no changes to default since foremon last stopped - skipped')
+    monitor.reset()
+
+    os.utime(src, (1, 1))
+    monitor, task, count = queued()
+    assert count == 1
+    assert output.stderr_expect('1 files of default changed since foremon last stopped')
+    assert list(task.changes) == [src]
+    monitor.reset()
+
+    # Not run since the change, so it is still found
+    monitor, task, count = queued()
+    assert count == 1
+    await task.run()
+    monitor.reset()
+    monitor, _, count = queued()
+    assert count == 0
+    monitor.reset()
+
+    # A crashed task runs on the next start
+    config.scripts = ['exit 1']
+    monitor, task, count = queued()
+    assert count == 1
+    await task.run()
+    assert task.crashed
+    monitor.reset()
+    monitor, _, count = queued()
+    assert count == 1
+    monitor.reset()
+
+
+async def test_snapshot_records_run_start(cache_dir: str, tempfiles: Tempfiles):
+    src = tempfiles.make_file('src/a.py')
+    config = make_config(tempfiles, **SNAPSHOT)
+    config.scripts = [f'touch -d 2001-01-01 {src}']
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(config)
+    monitor.add_task(task)
+    await task.run()
+    assert task.clean_exit
+    monitor.reset()
+
+    # Files changed while the task ran were not seen by it
+    snapshot = TreeSnapshot(config).load()
+    assert diff_snapshots(snapshot, take_snapshot(config)) == [src]
+
+
+async def test_snapshot_terminated_run(cache_dir: str, tempfiles: Tempfiles):
+    src = tempfiles.make_file('src/a.py')
+    quick = tempfiles.make_file('quick')
+    config = make_config(tempfiles, **SNAPSHOT)
+    config.scripts = [f'test -e {quick} || sleep 5']
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(config)
+    monitor.add_task(task)
+    await task.run()
+    saved = TreeSnapshot(config).load()
+    assert saved
+
+    os.utime(src, (1, 1))
+    os.remove(quick)
+    run = task.start()
+    while task.process is None:
+        await asyncio.sleep(0.01)
+    task.terminate()
+    await run
+    assert not task.clean_exit and not task.crashed
+    monitor.reset()
+
+    # The change the run was stopped for is still pending
+    assert TreeSnapshot(config).load() == saved
+
+
+def test_snapshot_key_command(cache_dir: str, tempfiles: Tempfiles):
+    config = make_config(tempfiles, **SNAPSHOT)
+    path = TreeSnapshot(config).path
+    config.scripts = ['echo other']
+    assert TreeSnapshot(config).path != path
+    config.scripts = ['echo ran']
+    config.environment = {'MODE': 'release'}
+    assert TreeSnapshot(config).path != path
+
+
+def test_snapshot_force(cache_dir: str, tempfiles: Tempfiles):
+    tempfiles.make_file('src/a.py')
+    config = make_config(tempfiles, **SNAPSHOT)
+    TreeSnapshot(config).save(take_snapshot(config))
+
+    monitor = Monitor(pipe=None)
+    task = ScriptTask(config)
+    task.force_run = True
+    monitor.add_task(task)
+    tasks = []
+    monitor.queue_task_event = lambda task, ev=None: tasks.append(task)
+    monitor.queue_changed_tasks()
+    assert tasks == [task]
+    monitor.reset()
@@ -0,0 +1,122 @@
+import os
+import os.path as op
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from foremon.display import display_info
+
+from .fixtures import *
+
+# Set to check startup against the time budgets below, which depend on the machine
+BENCHMARK = bool(os.environ.get('BENCHMARK_STARTUP'))
+# Milliseconds `foremon --version` may take, python itself takes ~15ms
+VERSION_BUDGET_MS = float(os.environ.get('VERSION_BUDGET_MS', '50'))
+# Milliseconds of imports `foremon.cli` may add on top of click
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '25'))
+# Seconds from starting foremon until its first script runs
+SPAWN_BUDGET = float(os.environ.get('SPAWN_BUDGET', '1.0'))
+# Seconds to wait for the first script on a busy machine
+SPAWN_TIMEOUT = 10.0
+
+benchmark = pytest.mark.skipif(not BENCHMARK, reason='set BENCHMARK_STARTUP to run')
+
+# Modules only needed once a task is run
+DEFERRED = ['pydantic', 'watchdog', 'toml', 'asyncio', 'foremon.app', 'foremon.monitor']
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+ENV = dict(os.environ, PYTHONPATH=ROOT)
+
+# Prints the deferred modules which are loaded
+REPORT = f"print(' '.join(m for m in {DEFERRED!r} if m in sys.modules), file=sys.stderr)"
+# Runs `foremon` with the arguments passed to it, like `python -m foremon` does
+RUN_MAIN = """
+import runpy, sys
+sys.argv[0] = 'foremon'
+try:
+    runpy.run_module('foremon', run_name='__main__', alter_sys=True)
+except SystemExit:
+    pass
+"""
+
+
+def run(*args: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, env=ENV, check=True)
+    return time.perf_counter() - start
+
+
+def best_of(n: int, *args: str) -> float:
+    return min(run(*args) for _ in range(n))
+
+
+def loaded_modules(*args: str) -> List[str]:
+    """
+    The deferred modules loaded after running python with `args`.
+    """
+    proc = subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, env=ENV, check=True, universal_newlines=True)
+    return proc.stderr.split()
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Cumulative microseconds spent importing each module, from `-X importtime`.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          stderr=subprocess.PIPE, env=ENV, check=True, universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_defers_imports():
+    assert loaded_modules('-c', 'import sys, foremon.cli\n' + REPORT) == []
+    assert 'pydantic' in loaded_modules('-c', 'import sys, foremon.app\n' + REPORT)
+
+
+def test_version_defers_imports():
+    assert loaded_modules('-c', RUN_MAIN + REPORT, '--version') == []
+
+
+def test_first_spawn(tempfiles: Tempfiles):
+    cwd = tempfiles.make_dir('project')
+    marker = op.join(cwd, 'marker')
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'foremon', '-n', '-x', 'touch marker'],
+                            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, cwd=cwd, env=ENV)
+    try:
+        while not op.exists(marker) and time.perf_counter() - start < SPAWN_TIMEOUT:
+            time.sleep(0.002)
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    display_info(f'first spawn after {elapsed * 1000:.1f}ms')
+    assert op.exists(marker)
+    if BENCHMARK:
+        assert elapsed < SPAWN_BUDGET
+
+
+@benchmark
+def test_version_startup():
+    baseline = best_of(5, '-c', 'pass') * 1000
+    elapsed = best_of(5, '-m', 'foremon', '--version') * 1000
+    display_info(f'foremon --version: {elapsed:.1f}ms, python: {baseline:.1f}ms')
+    assert elapsed < VERSION_BUDGET_MS
+
+
+@benchmark
+def test_cli_import_time():
+    times = import_times('foremon.cli')
+    own = (times['foremon.cli'] - times['click']) / 1000
+    display_info(f'import foremon.cli: {own:.1f}ms besides click')
+    assert own < IMPORT_BUDGET_MS
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import os.path as op
+import time
+
+from foremon.config import *
+from foremon.display import display_info
+from foremon.monitor import Monitor
+from foremon.storm import *
+from foremon.task import ScriptTask
+from watchdog.events import FileModifiedEvent
+
+from .fixtures import *
+
+# Set to compare the CPU time of handling a storm, which depends on the machine
+BENCHMARK = bool(os.environ.get('BENCHMARK_STORM'))
+# Number of synthetic events in the simulated checkout
+BENCH_EVENTS = int(os.environ.get('BENCH_EVENTS', '5000'))
+
+benchmark = pytest.mark.skipif(not BENCHMARK, reason='set BENCHMARK_STORM to run')
+
+
+def storm_monitor(tempfiles: Tempfiles, **kwargs) -> Monitor:
+    """
+    A monitor of the python files in `src` with a storm detector of `kwargs`.
+    """
+    monitor = Monitor(pipe=None)
+    monitor.storm = StormDetector(monitor._storm_ended, loop=monitor.loop,
+                                  on_storm_start=monitor._storm_started, **kwargs)
+    monitor.add_task(ScriptTask(make_config(tempfiles, patterns=['*.py'])))
+    return monitor
+
+
+def get_handler(monitor: Monitor):
+    return list(monitor.watch_sets.values())[0].handler
+
+
+async def test_storm_detector():
+    ended = []
+    detector = StormDetector(ended.append, rate=100, window=0.5, quiet=0.1)
+    task = object()
+
+    assert not any(detector.absorb(task, FileModifiedEvent('a')) for _ in range(50))
+    assert not detector.active
+    absorbed = [detector.absorb(task, FileModifiedEvent('a')) for _ in range(100)]
+    assert all(absorbed)
+    assert detector.active
+    assert not ended
+
+    await asyncio.sleep(0.3)
+    assert not detector.active
+    storm, = ended
+    assert storm.tasks == {task: False}
+    assert storm.event_count == 100
+
+
+async def test_storm_triggers_once(output: CapLines, tempfiles: Tempfiles):
+    monitor = storm_monitor(tempfiles, rate=100, window=1.0, quiet=0.1)
+    handler = get_handler(monitor)
+    task = handler.task
+    queued = []
+    monitor.queue_task_event = lambda task, ev, changes: queued.append((task, sorted(changes)))
+    monitor.debounce.callback = monitor.queue_task_event
+
+    old = tempfiles.make_file('src/old.py')
+    os.utime(old, (1, 1))
+    await asyncio.sleep(0.01)
+    changed = []
+    for i in range(1000):
+        if i % 300 == 299:
+            changed.append(tempfiles.make_file(f'src/pkg/{i}.py'))
+        handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, f'src/{i}.py')))
+
+    assert monitor.storm.active
+    await asyncio.sleep(0.5)
+    assert output.stderr_expect('event storm detected.*')
+    assert output.stderr_expect('event storm of .* events over .* ended, rescanning 1 tasks')
+    # old.py was not modified during the storm
+    assert queued == [(task, sorted(changed))]
+    monitor.reset()
+
+
+async def test_storm_moved_files(tempfiles: Tempfiles):
+    monitor = storm_monitor(tempfiles, rate=100, window=1.0, quiet=0.1)
+    handler = get_handler(monitor)
+    task = handler.task
+    queued = []
+    monitor.queue_task_event = lambda task, ev, changes: queued.append((task, sorted(changes)))
+    monitor.debounce.callback = monitor.queue_task_event
+
+    staged = tempfiles.make_file('staged.py')
+    os.utime(staged, (1, 1))
+    await asyncio.sleep(0.01)
+    for i in range(1000):
+        handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, f'src/{i}.py')))
+    # moved in with its old mtime, like a checkout or an extracted archive
+    moved = op.join(tempfiles.root, 'src/moved.py')
+    os.rename(staged, moved)
+
+    await asyncio.sleep(0.5)
+    assert queued == [(task, [moved])]
+    monitor.reset()
+
+
+async def test_storm_ignored_events(tempfiles: Tempfiles):
+    monitor = storm_monitor(tempfiles, rate=100, window=1.0, quiet=0.1)
+    handler = get_handler(monitor)
+    monitor.queue_task_event = lambda *args: None
+    monitor.debounce.callback = monitor.queue_task_event
+
+    # a build writing files the task does not match
+    for i in range(1000):
+        handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, f'src/{i}.o')))
+        handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, f'src/{i}.pyc')))
+    assert not monitor.storm.active
+
+    for i in range(1000):
+        handler.dispatch(FileModifiedEvent(op.join(tempfiles.root, f'src/{i}.py')))
+    assert monitor.storm.active
+    while monitor.storm.active:
+        await asyncio.sleep(0.01)
+    monitor.reset()
+
+
+async def run_checkout(monitor: Monitor, root: str, count: int) -> float:
+    """
+    Feed the events of a checkout touching `count` files through the handler
+    like the observer thread would and return the CPU time until they are
+    handled.
+    """
+    handler = get_handler(monitor)
+    monitor.queue_task_event = lambda *args: None
+    monitor.debounce.callback = monitor.queue_task_event
+    events = [FileModifiedEvent(op.join(root, f'src/pkg{i % 100}/mod{i}.py'))
+              for i in range(count)]
+
+    started = time.process_time()
+    for ev in events:
+        handler.dispatch(ev)
+    # callbacks run in order, the events were handled once this one runs
+    handled = monitor.loop.create_future()
+    monitor.loop.call_soon_threadsafe(handled.set_result, None)
+    await handled
+    while monitor.storm.active:
+        await asyncio.sleep(0.01)
+    # debounce and rescan
+    await asyncio.sleep(0.2)
+    elapsed = time.process_time() - started
+    monitor.reset()
+    return elapsed
+
+
+@benchmark
+async def test_storm_benchmark(tempfiles: Tempfiles):
+    # the same code with storm detection disabled by an unreachable rate,
+    # against the events collapsed into a storm and one rescan
+    single = await run_checkout(
+        storm_monitor(tempfiles, rate=float('inf')), tempfiles.root, BENCH_EVENTS)
+    storm = await run_checkout(
+        storm_monitor(tempfiles, quiet=0.1), tempfiles.root, BENCH_EVENTS)
+    display_info(f'{BENCH_EVENTS} synthetic events: {single:.3f}s cpu one at a time,'
+                 f' {storm:.3f}s cpu as a storm')
+    assert storm < single
@@ -3,9 +3,12 @@ from foremon.errors import ForemonError
 from foremon.queue import queueiter
 import os
 import signal
+import subprocess
+import sys
 
 from foremon.config import *
 from foremon.display import display_info, display_success
+from foremon.changes import ChangeSet
 from foremon.task import ScriptTask
 from pydantic.error_wrappers import ValidationError
 
@@ -240,3 +243,161 @@ async def test_task_callback_throws(output: CapLines):
     await ScriptTask(conf).add_before_callback(thrower).run()
 
     output.stderr_append('Error from callback.*')
+
+
+async def test_task_ready_pattern(output: CapLines):
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    ready_pattern = "listening on \\\\d+"
+    scripts = ["echo booting; echo listening on 8000; sleep 0.2"]
+    """).tool.foremon
+
+    task = ScriptTask(conf)
+    run = task.start()
+    assert await task.wait_ready()
+    assert task.is_ready
+    await run
+    assert not task.is_ready
+
+    assert output.stdout_expect('booting')
+    assert output.stdout_expect('listening on 8000')
+    assert output.stderr_expect('default ready .* after trigger.*')
+
+
+async def test_task_ready_pattern_long_lines(output: CapLines):
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    ready_pattern = "never"
+    ready_timeout = 0.1
+    scripts = ["head -c 200000 /dev/zero | tr '\\\\0' x; echo; printf end"]
+    """).tool.foremon
+
+    await ScriptTask(conf).run()
+    output.read()
+    # every byte is passed through, the line exceeds the stream limit
+    assert output.stdout_lines == ['x' * 200000, 'end']
+
+
+async def test_task_ready_port(output: CapLines):
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    conf = PyProjectConfig.parse_toml(f"""
+    [tool.foremon]
+    ready_port = {port}
+    ready_url = "http://127.0.0.1:{port}/"
+    scripts = ["exec {sys.executable} -m http.server {port} --bind 127.0.0.1"]
+    """).tool.foremon
+
+    task = ScriptTask(conf)
+    run = task.start()
+    assert await task.wait_ready()
+    task.terminate()
+    await run
+    assert output.stderr_expect('default ready .* after trigger.*')
+
+
+async def test_task_ready_timeout(output: CapLines):
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    ready_pattern = "never"
+    ready_timeout = 0.1
+    scripts = ["sleep 0.3"]
+    """).tool.foremon
+
+    task = ScriptTask(conf)
+    run = task.start()
+    assert not await task.wait_ready()
+    await run
+    assert output.stderr_expect('default not ready after 0.1s')
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires /proc')
+@pytest.mark.parametrize('script', [
+    # stays in the session of the script
+    "sleep 30 & echo spawned",
+    # leaves the session, re-parented to foremon as a subreaper
+    "(setsid sleep 30 &); echo spawned",
+])
+async def test_task_cleanup_orphans(output: CapLines, script: str):
+    from foremon.reaper import find_leaked, process_table
+
+    conf = PyProjectConfig.parse_toml(f"""
+    [tool.foremon]
+    cleanup_orphans = true
+    scripts = ["{script}"]
+    """).tool.foremon
+
+    await ScriptTask(conf).run()
+    assert output.stdout_expect('spawned')
+    assert output.stderr_expect('clean exit.*')
+    assert output.stderr_expect('cleaned up 1 leaked processes from default')
+
+    me = os.getpid()
+    assert not find_leaked([], marker=True)
+    assert not [s for s in process_table().values() if s.ppid == me and s.state == 'Z']
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires /proc')
+async def test_task_cleanup_orphans_attributed(output: CapLines):
+    from foremon.reaper import find_leaked
+
+    # a child of foremon which is not a script, like a `files_from` command
+    helper = subprocess.Popen(['sleep', '30'])
+    try:
+        conf = PyProjectConfig.parse_toml("""
+        [tool.foremon]
+        cleanup_orphans = true
+        scripts = ["(setsid sleep 30 &); echo spawned"]
+        """).tool.foremon
+
+        await ScriptTask(conf).run()
+        assert output.stderr_expect('cleaned up 1 leaked processes from default')
+        assert helper.poll() is None
+        assert helper.pid not in find_leaked([], marker=True)
+    finally:
+        helper.kill()
+        helper.wait()
+
+
+async def test_task_cleanup_orphans_disabled(output: CapLines):
+    # off unless enabled
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    scripts = ["sleep 0.2 & echo spawned"]
+    """).tool.foremon
+
+    await ScriptTask(conf).run()
+    assert output.stdout_expect('spawned')
+    assert not output.stderr_expect('cleaned up.*')
+
+
+async def test_task_ready_pattern_leaked_pipe(output: CapLines):
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    cleanup_orphans = true
+    ready_pattern = "up"
+    scripts = ["sleep 30 & echo up"]
+    """).tool.foremon
+
+    task = ScriptTask(conf)
+    await asyncio.wait_for(task.run(), 5)
+    assert output.stdout_expect('up')
+    assert output.stderr_expect('clean exit.*')
+
+
+async def test_task_passes_changed_files(output: CapLines):
+    conf = PyProjectConfig.parse_toml("""
+    [tool.foremon]
+    scripts = ["echo \\"CHANGED=$(echo $FOREMON_CHANGED_FILES)\\""]
+    """).tool.foremon
+
+    task = ScriptTask(conf)
+    task.changes.update(ChangeSet(['a.py', 'b.py']))
+    await task.run()
+
+    assert output.stdout_expect('CHANGED=a.py b.py')
+    assert not task.changes
+    assert list(task.run_changes) == ['a.py', 'b.py']
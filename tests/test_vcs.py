@@ -0,0 +1,134 @@
+import asyncio
+import os
+import os.path as op
+
+from foremon.config import *
+from foremon.vcs import *
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+from watchdog.observers import Observer
+
+from .fixtures import *
+
+
+def test_find_vcs_dir(tempfiles: Tempfiles):
+    git = tempfiles.make_dir('repo/.git')
+    tempfiles.make_dir('repo/src/pkg')
+    assert find_vcs_dir(op.join(tempfiles.root, 'repo/src/pkg')) == git
+
+    # worktrees point to their git dir from a .git file
+    gitdir = tempfiles.make_dir('repo/.git/worktrees/tree')
+    tree = tempfiles.make_dir('tree')
+    with open(op.join(tree, '.git'), 'w') as fd:
+        fd.write(f'gitdir: {gitdir}\n')
+    assert find_vcs_dir(tree) == gitdir
+
+
+async def test_vcs_guard_markers(tempfiles: Tempfiles):
+    git = tempfiles.make_dir('.git')
+    tempfiles.make_dir('.git/rebase-merge')
+    changes = []
+    guard = VcsGuard(git, lambda g: changes.append(g.busy))
+    guard.scan()
+    assert guard.busy
+
+    guard.update('created', 'index.lock')
+    guard.update('deleted', 'rebase-merge')
+    assert changes == []
+    # a commit renames the lock over the index
+    guard.dispatch(FileMovedEvent(op.join(git, 'index.lock'), op.join(git, 'index')))
+    # not a marker of this repository
+    guard.dispatch(FileMovedEvent(op.join(git, 'x', 'MERGE_HEAD'), op.join(git, 'x', 'y')))
+    await asyncio.sleep(0.01)
+    assert changes == [False]
+    assert not guard.busy
+
+
+async def test_vcs_guard_watch(tempfiles: Tempfiles):
+    git = tempfiles.make_dir('.git')
+    changes = []
+    guard = VcsGuard(git, lambda g: changes.append(g.busy))
+    observer = Observer()
+    observer.schedule(guard, git, recursive=False)
+    observer.start()
+    try:
+        lock = tempfiles.make_file('.git/index.lock')
+        await asyncio.sleep(0.3)
+        os.remove(lock)
+        await asyncio.sleep(0.3)
+    finally:
+        observer.stop()
+        observer.join()
+    assert changes == [True, False]
+
+
+async def test_vcs_holds_restarts(output: CapLines, tempfiles: Tempfiles):
+    tempfiles.make_dir('.git')
+    monitor = make_monitor(tempfiles, dwell=0.05)
+    task, = monitor.all_tasks
+    guard = monitor.vcs_guards[task]
+    queued = []
+    # held changes wait in the task
+    monitor.queue_task_event = lambda task, ev, changes: queued.append(
+        (task, sorted(set(task.changes) | set(changes))))
+    monitor.debounce.callback = monitor.queue_task_event
+
+    first = tempfiles.make_file('src/a.py')
+    monitor.submit_event(task, FileModifiedEvent(first))
+    guard.update('created', 'rebase-merge')
+    assert monitor.vcs_held == {task}
+
+    # each step of the rebase
+    paths = [first]
+    for i in range(3):
+        guard.update('created', 'index.lock')
+        paths.append(tempfiles.make_file(f'src/{i}.py'))
+        monitor.submit_event(task, FileModifiedEvent(paths[-1]))
+        guard.update('deleted', 'index.lock')
+        await asyncio.sleep(0.1)
+    assert queued == []
+
+    guard.update('deleted', 'rebase-merge')
+    assert output.stderr_expect(r'operation in .*\.git finished, restarting 1 tasks')
+    await asyncio.sleep(0.1)
+    assert queued == [(task, sorted(paths))]
+    assert not monitor.vcs_held
+    monitor.reset()
+
+
+async def test_vcs_stale_lock(output: CapLines, tempfiles: Tempfiles):
+    # left behind by a crashed git
+    tempfiles.make_file('.git/index.lock')
+    monitor = make_monitor(tempfiles, dwell=0.05, vcs_max_hold=0.2)
+    task, = monitor.all_tasks
+    guard = monitor.vcs_guards[task]
+    assert output.stderr_expect(r'index.lock found in .*\.git, holding restarts of default')
+    output.cleanup()
+    queued = []
+    monitor.queue_task_event = lambda task, ev, changes: queued.append(
+        (task, sorted(set(task.changes) | set(changes))))
+    monitor.debounce.callback = monitor.queue_task_event
+
+    path = tempfiles.make_file('src/a.py')
+    monitor.submit_event(task, FileModifiedEvent(path))
+    assert monitor.vcs_held == {task}
+
+    await asyncio.sleep(0.4)
+    assert output.stderr_expect(r'index.lock in .*\.git exists for 0.2s, ignoring it')
+    assert queued == [(task, [path])]
+    assert not guard.busy
+
+    # a new operation holds restarts again
+    guard.update('created', 'index.lock')
+    assert guard.busy
+    monitor.reset()
+
+
+async def test_vcs_wait_disabled(tempfiles: Tempfiles):
+    tempfiles.make_dir('.git')
+    monitor = make_monitor(tempfiles, dwell=0.05)
+    task, = monitor.all_tasks
+    monitor.reset()
+    task.config.wait_for_vcs = False
+    monitor.add_task(task)
+    assert task not in monitor.vcs_guards
+    monitor.reset()
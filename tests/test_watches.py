@@ -0,0 +1,38 @@
+from foremon.watches import WatchSet
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from .fixtures import *
+
+
+def test_watches_update_by_difference(tempfiles: Tempfiles):
+    a, b, c = [tempfiles.make_dir(d) for d in 'abc']
+    observer = Observer()
+    watches = WatchSet(observer, FileSystemEventHandler())
+
+    assert watches.update([(a, True), (b, False)]) == (2, 0)
+    assert watches.update([(a, True), (b, False)]) == (0, 0)
+    assert watches.update([(b, False), (c, False)]) == (1, 1)
+    assert (a, True) not in watches
+    assert len(observer.emitters) == 2
+
+    watches.clear()
+    assert not watches
+    assert not observer.emitters
+
+
+def test_watches_shared(tempfiles: Tempfiles):
+    a = tempfiles.make_dir('a')
+    observer = Observer()
+    first = WatchSet(observer, FileSystemEventHandler())
+    second = WatchSet(observer, FileSystemEventHandler())
+
+    first.update([(a, True)])
+    second.update([(a, True)])
+    assert len(observer.emitters) == 1
+
+    # The other handler still uses the watch
+    first.clear()
+    assert len(observer.emitters) == 1
+    second.clear()
+    assert not observer.emitters